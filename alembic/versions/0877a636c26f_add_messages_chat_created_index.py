@@ -0,0 +1,35 @@
+"""Add messages chat_id created_date id index
+
+Revision ID: 0877a636c26f
+Revises: b8f6a0583867
+Create Date: 2026-10-18 17:52:40.127754
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0877a636c26f'
+down_revision: Union[str, None] = 'b8f6a0583867'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # CONCURRENTLY can't run inside the migration transaction
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_messages_chat_id_created_date_id',
+            'messages',
+            ['chat_id', 'created_date', 'id'],
+            unique=False,
+            postgresql_concurrently=True
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_messages_chat_id_created_date_id', table_name='messages', postgresql_concurrently=True)
@@ -0,0 +1,46 @@
+"""Add execution usage
+
+Revision ID: 3f8d2c6b91e4
+Revises: 5c1d7e9a2b40
+Create Date: 2026-10-18 20:41:07.382915
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f8d2c6b91e4'
+down_revision: Union[str, None] = '5c1d7e9a2b40'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('execution_usage',
+    sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+    sa.Column('user_id', postgresql.UUID(as_uuid=True), nullable=False),
+    sa.Column('prompt', sa.Text(), nullable=True),
+    sa.Column('code_digest', sa.String(length=64), nullable=True),
+    sa.Column('mode', sa.String(), nullable=False),
+    sa.Column('cached', sa.Boolean(), nullable=False),
+    sa.Column('exit_code', sa.Integer(), nullable=True),
+    sa.Column('limit_exceeded', sa.String(), nullable=True),
+    sa.Column('wall_ms', sa.Integer(), nullable=False),
+    sa.Column('cpu_user_ms', sa.Integer(), nullable=False),
+    sa.Column('cpu_system_ms', sa.Integer(), nullable=False),
+    sa.Column('max_rss_bytes', sa.BigInteger(), nullable=False),
+    sa.Column('output_bytes', sa.BigInteger(), nullable=False),
+    sa.Column('created_date', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_execution_usage_user_id_created_date', 'execution_usage', ['user_id', 'created_date'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_execution_usage_user_id_created_date', table_name='execution_usage')
+    op.drop_table('execution_usage')
@@ -0,0 +1,28 @@
+"""Add rolling summary to chats
+
+Revision ID: 5c1d7e9a2b40
+Revises: e5f26a039e39
+Create Date: 2026-10-18 19:48:21.530117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5c1d7e9a2b40'
+down_revision: Union[str, None] = 'e5f26a039e39'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('chats', sa.Column('summary', sa.Text(), nullable=True))
+    op.add_column('chats', sa.Column('summary_revision', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column('chats', 'summary_revision')
+    op.drop_column('chats', 'summary')
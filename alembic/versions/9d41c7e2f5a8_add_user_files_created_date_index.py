@@ -0,0 +1,35 @@
+"""Add user files created date index
+
+Revision ID: 9d41c7e2f5a8
+Revises: 3f8d2c6b91e4
+Create Date: 2026-10-18 21:26:13.904177
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9d41c7e2f5a8'
+down_revision: Union[str, None] = '3f8d2c6b91e4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # The retention sweep filters and orders on it
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_user_files_created_date',
+            'user_files',
+            ['created_date'],
+            unique=False,
+            postgresql_concurrently=True
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_user_files_created_date', table_name='user_files', postgresql_concurrently=True)
@@ -0,0 +1,57 @@
+"""Add chat version and message revision for incremental sync
+
+Revision ID: a03788e3c198
+Revises: b87b305d29bf
+Create Date: 2026-10-18 18:41:07.662931
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a03788e3c198'
+down_revision: Union[str, None] = 'b87b305d29bf'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('chats', sa.Column('version', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('messages', sa.Column('revision', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('messages', sa.Column('deleted_date', sa.DateTime(), nullable=True))
+
+    # Number existing messages in creation order and start each chat's version after them
+    op.execute("""
+        UPDATE messages SET revision = numbered.revision
+        FROM (
+            SELECT id, row_number() OVER (PARTITION BY chat_id ORDER BY created_date NULLS FIRST, id) AS revision
+            FROM messages
+        ) numbered
+        WHERE messages.id = numbered.id
+    """)
+    op.execute("""
+        UPDATE chats SET version = counts.version
+        FROM (SELECT chat_id, MAX(revision) AS version FROM messages GROUP BY chat_id) counts
+        WHERE chats.id = counts.chat_id
+    """)
+
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_messages_chat_id_revision',
+            'messages',
+            ['chat_id', 'revision'],
+            unique=False,
+            postgresql_concurrently=True
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_messages_chat_id_revision', table_name='messages', postgresql_concurrently=True)
+    op.execute("DELETE FROM messages WHERE deleted_date IS NOT NULL")
+    op.drop_column('messages', 'deleted_date')
+    op.drop_column('messages', 'revision')
+    op.drop_column('chats', 'version')
@@ -0,0 +1,58 @@
+"""Add hot path indexes and unique chats per user context
+
+Revision ID: b87b305d29bf
+Revises: 0877a636c26f
+Create Date: 2026-10-18 18:04:51.530218
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b87b305d29bf'
+down_revision: Union[str, None] = '0877a636c26f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Keep the oldest chat for each (user_id, context) and fold the duplicates into it
+DUPLICATE_CHATS = """
+    WITH ranked AS (
+        SELECT id, first_value(id) OVER (
+            PARTITION BY user_id, context ORDER BY created_date NULLS LAST, id
+        ) AS keep_id
+        FROM chats
+    )
+"""
+
+
+def upgrade() -> None:
+    op.execute(DUPLICATE_CHATS + """
+        UPDATE messages SET chat_id = ranked.keep_id
+        FROM ranked
+        WHERE messages.chat_id = ranked.id AND ranked.id <> ranked.keep_id
+    """)
+    op.execute(DUPLICATE_CHATS + """
+        DELETE FROM chats USING ranked
+        WHERE chats.id = ranked.id AND ranked.id <> ranked.keep_id
+    """)
+    op.create_unique_constraint('uq_chats_user_id_context', 'chats', ['user_id', 'context'])
+
+    # messages.chat_id lookups are served by ix_messages_chat_id_created_date_id
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_user_files_user_id_id',
+            'user_files',
+            ['user_id', 'id'],
+            unique=False,
+            postgresql_concurrently=True
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_user_files_user_id_id', table_name='user_files', postgresql_concurrently=True)
+    op.drop_constraint('uq_chats_user_id_context', 'chats', type_='unique')
@@ -0,0 +1,42 @@
+"""Add user_file_versions
+
+Revision ID: b8f6a0583867
+Revises: 846f86e2a249
+Create Date: 2026-10-18 17:30:12.418093
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b8f6a0583867'
+down_revision: Union[str, None] = '846f86e2a249'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('user_file_versions',
+    sa.Column('user_id', sa.UUID(), nullable=False),
+    sa.Column('file_name', sa.String(), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'file_name')
+    )
+    # Seed the counters from the name_vN.ext files users already have
+    op.execute(r"""
+        INSERT INTO user_file_versions (user_id, file_name, version)
+        SELECT user_id,
+               regexp_replace(file_name, '_v\d+(\.[^.]*)?$', '\1'),
+               MAX(substring(file_name from '_v(\d+)(?:\.[^.]*)?$')::int)
+        FROM user_files
+        WHERE file_name ~ '_v\d+(\.[^.]*)?$'
+        GROUP BY 1, 2
+    """)
+
+
+def downgrade() -> None:
+    op.drop_table('user_file_versions')
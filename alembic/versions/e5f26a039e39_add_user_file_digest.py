@@ -0,0 +1,42 @@
+"""Add digest, size and mime type to user files
+
+Revision ID: e5f26a039e39
+Revises: a03788e3c198
+Create Date: 2026-10-18 19:12:44.201583
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5f26a039e39'
+down_revision: Union[str, None] = 'a03788e3c198'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Existing rows keep NULLs and are still served from output/users
+    op.add_column('user_files', sa.Column('digest', sa.String(length=64), nullable=True))
+    op.add_column('user_files', sa.Column('size', sa.BigInteger(), nullable=True))
+    op.add_column('user_files', sa.Column('mime_type', sa.String(), nullable=True))
+
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_user_files_digest',
+            'user_files',
+            ['digest'],
+            unique=False,
+            postgresql_concurrently=True
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_user_files_digest', table_name='user_files', postgresql_concurrently=True)
+    op.drop_column('user_files', 'mime_type')
+    op.drop_column('user_files', 'size')
+    op.drop_column('user_files', 'digest')
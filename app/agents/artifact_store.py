@@ -0,0 +1,269 @@
+import errno
+import hashlib
+import mimetypes
+import os
+import shutil
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from pathlib import Path
+
+
+def file_digest(path) -> str:
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+def guess_mime_type(name: str) -> str:
+    return mimetypes.guess_type(name)[0] or 'application/octet-stream'
+
+
+class ArtifactStore(ABC):
+    """Keeps one blob per distinct content, addressed by its sha256.
+
+    `put` takes ownership of a produced file and returns what a UserFile row
+    needs (digest, size, mime_type); storing bytes that are already there
+    costs a hash and nothing else. Backends that keep blobs on local disk
+    also return a path from `local_path`, so downloads can use sendfile.
+
+    A blob that was put or linked in the last `grace_seconds` counts as
+    `recently_used`: the UserFile rows pointing at it are committed only
+    once the run is over, so garbage collection leaves it alone until then.
+    """
+
+    # True when blobs are files on this machine and `local_path` finds them
+    has_local_paths = False
+    grace_seconds = 3600
+
+    def __init__(self):
+        self._delete_listeners = []
+        # digest -> when this process last put or linked it, oldest first
+        self._used = OrderedDict()
+        self._used_lock = threading.Lock()
+
+    def add_delete_listener(self, callback):
+        # callback(digest) runs after a blob is deleted, for anything that hands out digests
+        self._delete_listeners.append(callback)
+
+    def _deleted(self, digest: str):
+        for callback in self._delete_listeners:
+            callback(digest)
+
+    def _touch(self, digest: str):
+        now = time.time()
+        with self._used_lock:
+            self._used[digest] = now
+            self._used.move_to_end(digest)
+            while next(iter(self._used.values())) < now - self.grace_seconds:
+                self._used.popitem(last=False)
+
+    def recently_used(self, digest: str) -> bool:
+        with self._used_lock:
+            used = self._used.get(digest)
+        return used is not None and used > time.time() - self.grace_seconds
+
+    @abstractmethod
+    def put(self, source) -> dict:
+        ...
+
+    @abstractmethod
+    def exists(self, digest: str) -> bool:
+        ...
+
+    @abstractmethod
+    def open(self, digest: str):
+        ...
+
+    @abstractmethod
+    def delete(self, digest: str):
+        ...
+
+    def link(self, digest: str, path) -> bool:
+        # Exposes a blob under a per-user name, False when that name is already taken
+        self._touch(digest)
+        return True
+
+    def local_path(self, digest: str):
+        return None
+
+    def iter_bytes(self, digest: str, chunk_size: int = 256 * 1024):
+        with self.open(digest) as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                yield chunk
+
+    @staticmethod
+    def _describe(source: Path, digest: str, size: int) -> dict:
+        return {'digest': digest, 'size': size, 'mime_type': guess_mime_type(source.name)}
+
+
+class LocalArtifactStore(ArtifactStore):
+    """Blobs under `root/ab/cd/<digest>`, per-user names are hard links to them.
+
+    Hard links keep the output/users/<id>/ layout the download endpoint
+    reads, while every copy of the same bytes shares one inode. With the
+    root on another filesystem than the user directories, names are
+    copies instead. Blobs are made read-only since any of their names
+    could be used to change them.
+    """
+
+    has_local_paths = True
+
+    def __init__(self, root):
+        super().__init__()
+        self.root = Path(root).resolve()
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def _blob_path(self, digest: str) -> Path:
+        return self.root / digest[:2] / digest[2:4] / digest
+
+    def put(self, source) -> dict:
+        source = Path(source)
+        digest = file_digest(source)
+        size = source.stat().st_size
+        blob = self._blob_path(digest)
+        if not blob.exists():
+            blob.parent.mkdir(parents=True, exist_ok=True)
+            os.chmod(source, 0o444)
+            try:
+                os.link(source, blob)
+            except FileExistsError:
+                # Someone stored the same bytes a moment ago
+                pass
+            except OSError as e:
+                if e.errno != errno.EXDEV:
+                    raise
+                # Different filesystem, copy next to the blob and rename into place
+                tmp = blob.with_name(f"{digest}.{uuid.uuid4().hex}.tmp")
+                shutil.copyfile(source, tmp)
+                os.chmod(tmp, 0o444)
+                os.replace(tmp, blob)
+        else:
+            # Bumps the blob's ctime, which other processes' sweeps go by
+            os.utime(blob)
+        self._touch(digest)
+        os.remove(source)
+        return self._describe(source, digest, size)
+
+    def exists(self, digest: str) -> bool:
+        return self._blob_path(digest).exists()
+
+    def open(self, digest: str):
+        return open(self._blob_path(digest), 'rb')
+
+    def delete(self, digest: str):
+        try:
+            os.remove(self._blob_path(digest))
+        except FileNotFoundError:
+            pass
+        self._deleted(digest)
+
+    def link(self, digest: str, path) -> bool:
+        self._touch(digest)
+        try:
+            os.link(self._blob_path(digest), path)
+        except FileExistsError:
+            return False
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+            return self._copy_to(digest, Path(path))
+        return True
+
+    def _copy_to(self, digest: str, path: Path) -> bool:
+        # The root is on another filesystem, the name gets a copy of its own. Linked into place so a taken name still fails.
+        tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+        shutil.copyfile(self._blob_path(digest), tmp)
+        os.chmod(tmp, 0o444)
+        try:
+            os.link(tmp, path)
+        except FileExistsError:
+            return False
+        finally:
+            os.remove(tmp)
+        return True
+
+    def local_path(self, digest: str):
+        blob = self._blob_path(digest)
+        return blob if blob.exists() else None
+
+    def recently_used(self, digest: str) -> bool:
+        # A new hard link or a put of the same bytes changes the ctime, whichever process made it
+        if super().recently_used(digest):
+            return True
+        try:
+            return self._blob_path(digest).stat().st_ctime > time.time() - self.grace_seconds
+        except FileNotFoundError:
+            return False
+
+    def stats(self):
+        blobs = [p for p in self.root.glob('*/*/*') if p.is_file()]
+        return {'blobs': len(blobs), 'bytes': sum(p.stat().st_size for p in blobs)}
+
+
+class S3ArtifactStore(ArtifactStore):
+    """Blobs as objects under `prefix/<digest>` in an S3-compatible bucket.
+
+    `client` is anything with the boto3 S3 client's put_object, head_object,
+    get_object and delete_object, which lets tests hand in a stand-in.
+    Only this process's puts count towards `recently_used`, objects have
+    nothing as cheap to check as a ctime.
+    """
+
+    def __init__(self, client, bucket: str, prefix: str = 'artifacts'):
+        super().__init__()
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix.strip('/')
+
+    def _key(self, digest: str) -> str:
+        return f"{self.prefix}/{digest}" if self.prefix else digest
+
+    def put(self, source) -> dict:
+        source = Path(source)
+        digest = file_digest(source)
+        size = source.stat().st_size
+        info = self._describe(source, digest, size)
+        if not self.exists(digest):
+            with open(source, 'rb') as f:
+                self.client.put_object(Bucket=self.bucket, Key=self._key(digest), Body=f, ContentType=info['mime_type'])
+        self._touch(digest)
+        os.remove(source)
+        return info
+
+    def exists(self, digest: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._key(digest))
+        except Exception as e:
+            if _is_not_found(e):
+                return False
+            raise
+        return True
+
+    def open(self, digest: str):
+        return self.client.get_object(Bucket=self.bucket, Key=self._key(digest))['Body']
+
+    def delete(self, digest: str):
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(digest))
+        self._deleted(digest)
+
+
+def _is_not_found(error) -> bool:
+    # botocore's ClientError carries the HTTP status, stand-ins raise KeyError
+    if isinstance(error, KeyError):
+        return True
+    response = getattr(error, 'response', None) or {}
+    return str(response.get('Error', {}).get('Code')) in ('404', 'NoSuchKey', 'NotFound')
+
+
+def create_artifact_store(backend: str, root: str, bucket: str = None, prefix: str = 'artifacts'):
+    if backend == 's3':
+        try:
+            import boto3
+        except ImportError:
+            raise RuntimeError("ARTIFACT_STORE is s3 but boto3 isn't installed, pip install boto3")
+        return S3ArtifactStore(boto3.client('s3'), bucket, prefix)
+    return LocalArtifactStore(root)
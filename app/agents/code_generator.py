@@ -1,57 +1,249 @@
+import hashlib
 import os
 import re
-import importlib
-import subprocess
-import sys
-from openai import OpenAI
-from ..config import OPENAI_API_KEY
+import shutil
+import time
+from ..config import (
+    OPENAI_API_KEY, CACHE_DIR, PROMPT_CACHE_ENABLED, PROMPT_CACHE_TTL, PROMPT_CACHE_MAX_ENTRIES,
+    EXECUTOR_MODE, EXECUTOR_STUB_SECONDS, EXECUTION_TIMEOUT, WARM_POOL_SIZE, WARM_PRELOAD, INSTALL_WORKERS,
+    ARTIFACT_STORE, ARTIFACT_DIR, ARTIFACT_BUCKET, ARTIFACT_PREFIX, SUMMARY_MODEL, SUMMARY_MAX_TOKENS,
+    EXECUTION_CACHE_ENABLED, EXECUTION_CACHE_TTL, EXECUTION_CACHE_MAX_ENTRIES,
+    EXECUTION_CPU_SECONDS, EXECUTION_MEMORY_MB, EXECUTION_MAX_OPEN_FILES, EXECUTION_MAX_OUTPUT_MB,
+    OPENAI_MAX_CONNECTIONS, OPENAI_MAX_RETRIES, OPENAI_BACKOFF_BASE, OPENAI_BACKOFF_MAX, OPENAI_DEADLINE_SECONDS,
+    OPENAI_HEDGE, OPENAI_HEDGE_QUANTILE, PIPELINED_GENERATION
+)
+from ..models.message import MessageType
+from .artifact_store import create_artifact_store
+from .code_stream import CodeStream
+from .dependency_resolver import DependencyResolver
+from .execution_cache import ExecutionCache, NO_CACHE_MARKER
+from .openai_client import OpenAIClient
+from .prompt_cache import PromptCache
+from .resource_limits import MB, ResourceLimits, directory_bytes, run_limited
+from .warm_executor import get_warm_executor
+from ..profiling import span
+from ..metrics import (
+    STAGE_LATENCY, OPENAI_REQUESTS, OPENAI_TOKENS, OPENAI_COMPLETION_TOKENS,
+    EXECUTIONS, EXECUTION_CPU, EXECUTION_RSS, EXECUTION_OUTPUT
+)
 import uuid
 from pathlib import Path
 
 os.environ["OPENAI_API_KEY"] = OPENAI_API_KEY
 
+prompt_cache = PromptCache(
+    os.path.join(CACHE_DIR, 'prompt_cache.sqlite3'),
+    ttl_seconds=PROMPT_CACHE_TTL,
+    max_entries=PROMPT_CACHE_MAX_ENTRIES
+) if PROMPT_CACHE_ENABLED else None
+
+dependency_resolver = DependencyResolver(
+    os.path.join(CACHE_DIR, 'dependency_index.json'),
+    os.path.join(CACHE_DIR, 'wheels'),
+    max_workers=INSTALL_WORKERS
+)
+
+artifact_store = create_artifact_store(ARTIFACT_STORE, ARTIFACT_DIR, ARTIFACT_BUCKET, ARTIFACT_PREFIX)
+
+execution_cache = ExecutionCache(
+    os.path.join(CACHE_DIR, 'execution_cache.sqlite3'),
+    ttl_seconds=EXECUTION_CACHE_TTL,
+    max_entries=EXECUTION_CACHE_MAX_ENTRIES
+) if EXECUTION_CACHE_ENABLED else None
+if execution_cache:
+    # Cached results are only as long-lived as the artifacts they point at
+    artifact_store.add_delete_listener(execution_cache.forget_digest)
+
+openai_client = OpenAIClient(
+    max_connections=OPENAI_MAX_CONNECTIONS,
+    max_retries=OPENAI_MAX_RETRIES,
+    backoff_base=OPENAI_BACKOFF_BASE,
+    backoff_max=OPENAI_BACKOFF_MAX,
+    deadline=OPENAI_DEADLINE_SECONDS,
+    hedge=OPENAI_HEDGE,
+    hedge_quantile=OPENAI_HEDGE_QUANTILE
+)
+
+execution_limits = ResourceLimits(
+    cpu_seconds=EXECUTION_CPU_SECONDS,
+    memory_bytes=EXECUTION_MEMORY_MB * MB,
+    open_files=EXECUTION_MAX_OPEN_FILES,
+    output_bytes=EXECUTION_MAX_OUTPUT_MB * MB
+)
+
 class CodeGenerator:
-    def __init__(self):
-        self.openai_helper = OpenAIHelper()
+    # Holds no per-run state, one instance serves every request
+    def __init__(self, openai_helper=None, pipelined=None):
+        self.openai_helper = openai_helper or OpenAIHelper()
         self.library_manager = LibraryManager()
         self.code_executor = CodeExecutor()
+        self.pipelined = PIPELINED_GENERATION if pipelined is None else pipelined
 
-    def run(self, prompt, requestor_id=''):
+    def run(self, prompt, requestor_id='', on_event=None, allocate_version=None, history=None, history_usage=None):
+        emit = on_event or (lambda stage, data=None: None)
         print(f"Generating code for: {prompt}")
-        
-        # Generate the Python code based on the prompt
-        code = self.openai_helper.generate_code(prompt)
+        emit("generating")
+        marks = {'started': time.perf_counter()}
+
+        # Pipelined, the completion is streamed so installs and syntax checks start as the code arrives
+        stream = CodeStream(dependency_resolver) if self.pipelined else None
+
+        # Generate the Python code based on the prompt, streaming tokens out when someone is listening
+        def on_token(text):
+            if stream:
+                stream.feed(text)
+            if on_event:
+                emit("tokens", {"text": text})
+        code, usage = self.generate(
+            prompt, on_token=on_token if stream or on_event else None, history=history, history_usage=history_usage
+        )
+        marks['generated'] = time.perf_counter()
+        print(f"Token usage: {usage}")
+        emit("usage", usage)
         
         print("Generated code:")
         print(code)
         
         # Install any libraries mentioned in the code
-        self.library_manager.install_libraries(code)
+        emit("installing")
+        with span('install'):
+            if stream:
+                stream.close()
+                stream.wait()
+                marks['prefetched'] = time.perf_counter()
+            dependencies = self.library_manager.install_libraries(code)
+        marks['installed'] = time.perf_counter()
+
+        syntax_error = None
+        if stream:
+            with span('validate'):
+                syntax_error = stream.validate(code)
         
         print("\nExecuting code...")
+        emit("executing")
         
         # Execute the generated code
-        output, error = self.code_executor.execute_code(code, requestor_id)
+        marks['executing'] = time.perf_counter()
+        with span('execute'):
+            if syntax_error:
+                # Bound to fail, no need to start a process for it
+                result = self.code_executor.reject(code, syntax_error)
+            else:
+                result = self.code_executor.execute_code(
+                    code, requestor_id, allocate_version=allocate_version, dependencies=dependencies
+                )
+        marks['finished'] = time.perf_counter()
+        self.openai_helper.remember(prompt, code, result.exit_code == 0, history)
+        result.usage = usage
+        result.timings = self._timings(marks, stream)
+        print(f"Resource usage: {result.resources}")
+        print(f"Stage timings: {result.timings}")
+        emit("timings", result.timings)
 
         # Print the output or errors from code execution
-        if output:
+        if result.output:
             print("Output:")
-            print(output)
-        if error:
+            print(result.output)
+        if result.error:
             print("Error:")
-            print(error)
-        return (output, error)
+            print(result.error)
+        return result
+
+    @staticmethod
+    def _timings(marks, stream=None):
+        generate = marks['generated'] - marks['started']
+        install = marks['installed'] - marks['generated']
+        execute = marks['finished'] - marks['executing']
+        total = marks['finished'] - marks['started']
+        timings = {'pipelined': stream is not None}
+        if stream:
+            # Time the generation sat waiting on installs, the rest of the install was hidden behind it
+            install_wait = marks['prefetched'] - marks['generated']
+            STAGE_LATENCY.observe(install_wait, stage='install_wait')
+            STAGE_LATENCY.observe(stream.validate_seconds, stage='validate')
+            if stream.prefetch_started_at and stream.installed_at:
+                install = stream.installed_at - stream.prefetch_started_at + marks['installed'] - marks['prefetched']
+            if stream.first_token_at:
+                timings['first_token_ms'] = round((stream.first_token_at - marks['started']) * 1000, 1)
+            timings['install_wait_ms'] = round(install_wait * 1000, 1)
+            timings['validate_ms'] = round(stream.validate_seconds * 1000, 1)
+            # Against running the same stages one after the other
+            sequential = generate + install + stream.validate_seconds + execute
+            timings['overlap_saved_ms'] = round(max(0, sequential - total) * 1000, 1)
+        timings.update({
+            'generate_ms': round(generate * 1000, 1),
+            'install_ms': round(install * 1000, 1),
+            'execute_ms': round(execute * 1000, 1),
+            'total_ms': round(total * 1000, 1),
+        })
+        return timings
+
+    def generate(self, prompt, on_token=None, history=None, history_usage=None):
+        # Code and token usage, without installing or running anything
+        usage = dict(history_usage or {})
+        with span('openai'):
+            code = self.openai_helper.generate_code(prompt, on_token=on_token, history=history, on_usage=usage.update)
+        return code, usage
     
 class OpenAIHelper:
-    def __init__(self):
-        self.client = OpenAI()
+    MODEL = "gpt-4o"
+    SYSTEM_PROMPT = "You are a Python code generator. Respond only with executable Python code, no explanations or comments."
+    SUMMARY_PROMPT = (
+        "You maintain a short running summary of a chat in which a user asks for Python scripts that produce files. "
+        "Update the summary with the new messages. Keep every requirement the user stated that could matter for a "
+        "follow-up request (data, formats, file names, styling) and drop pleasantries and links."
+    )
+    USER_PROMPT = (
+        "Generate Python code to {prompt}. If you need to use any external libraries, include a comment at the top of "
+        "the code listing the required pip installations. If the output depends on the current date or time, "
+        f"randomness or live data, include the comment `{NO_CACHE_MARKER}` at the top."
+    )
 
-    def generate_code(self, prompt):
-        response = self.client.chat.completions.create(
-            model="gpt-4o",
+    def __init__(self, cache=None, client=None):
+        self.client = client or openai_client
+        self.cache = cache if cache is not None else prompt_cache
+
+    def _cache_key(self, prompt, history=None):
+        if not self.cache:
+            return None
+        # Only what the user asked shapes the key, replies carry one-off file links
+        context = '\x00'.join(f'{m["role"]}: {m["content"]}' for m in history or () if m["role"] != "assistant")
+        return self.cache.make_key(prompt, self.MODEL, self.SYSTEM_PROMPT, context, self.USER_PROMPT)
+
+    def generate_code(self, prompt, on_token=None, history=None, on_usage=None):
+        # Fresh code isn't cached here, see remember
+        cache_key = self._cache_key(prompt, history)
+        if cache_key:
+            code = self.cache.get(cache_key)
+            if code is not None:
+                print("Prompt cache hit")
+                OPENAI_REQUESTS.inc(model=self.MODEL, cached='true')
+                if on_usage:
+                    on_usage({"cached": True, "prompt_tokens": 0, "completion_tokens": 0, "latency_ms": 0})
+                if on_token:
+                    on_token(code)
+                return code
+
+        return self._complete(prompt, on_token, history, on_usage)
+
+    def remember(self, prompt, code, succeeded, history=None):
+        # Called once the code has run: only code that ran cleanly is replayed, code that failed is forgotten
+        cache_key = self._cache_key(prompt, history)
+        if not cache_key:
+            return
+        if succeeded and code.strip():
+            self.cache.set(cache_key, code)
+        else:
+            self.cache.delete(cache_key)
+
+    def _complete(self, prompt, on_token=None, history=None, on_usage=None):
+        started = time.perf_counter()
+        request = dict(
+            model=self.MODEL,
             messages=[
-                {"role": "system", "content": "You are a Python code generator. Respond only with executable Python code, no explanations or comments."},
-                {"role": "user", "content": f"Generate Python code to {prompt}. If you need to use any external libraries, include a comment at the top of the code listing the required pip installations."}
+                {"role": "system", "content": self.SYSTEM_PROMPT},
+                *(history or []),
+                {"role": "user", "content": self.USER_PROMPT.format(prompt=prompt)}
             ],
             max_tokens=4000,
             temperature=0.7,
@@ -59,7 +251,68 @@ class OpenAIHelper:
             frequency_penalty=0,
             presence_penalty=0
         )
-        code = re.sub(r'^```python\n|^```\n|```$', '', response.choices[0].message.content, flags=re.MULTILINE)
+        if on_token is None:
+            response = self.client.complete(**request)
+            self._report_usage(on_usage, response.usage, started)
+            return self.clean_code(response.choices[0].message.content)
+
+        # Streaming mode, hand each delta to the listener as it arrives
+        chunks = []
+        usage = []
+
+        def on_chunk(chunk):
+            if chunk.usage:
+                # Comes on a final chunk of its own
+                usage.append(chunk.usage)
+            if not chunk.choices:
+                return
+            text = chunk.choices[0].delta.content
+            if text:
+                chunks.append(text)
+                on_token(text)
+
+        self.client.stream(on_chunk, stream_options={"include_usage": True}, **request)
+        self._report_usage(on_usage, usage[-1] if usage else None, started)
+        return self.clean_code(''.join(chunks))
+
+    def _report_usage(self, on_usage, usage, started):
+        latency = time.perf_counter() - started
+        STAGE_LATENCY.observe(latency, stage='openai')
+        OPENAI_REQUESTS.inc(model=self.MODEL, cached='false')
+        if usage:
+            OPENAI_TOKENS.inc(usage.prompt_tokens, model=self.MODEL, kind='prompt')
+            OPENAI_TOKENS.inc(usage.completion_tokens, model=self.MODEL, kind='completion')
+            OPENAI_COMPLETION_TOKENS.observe(usage.completion_tokens, model=self.MODEL)
+        if on_usage:
+            on_usage({
+                "cached": False,
+                "prompt_tokens": usage.prompt_tokens if usage else None,
+                "completion_tokens": usage.completion_tokens if usage else None,
+                "latency_ms": round(latency * 1000),
+            })
+
+    def summarize(self, summary, messages):
+        transcript = '\n'.join(
+            f"{'User' if m.line_type == MessageType.USER else 'Assistant'}: {m.content}" for m in messages
+        )
+        with STAGE_LATENCY.time(stage='summarize'):
+            response = self.client.complete(
+                model=SUMMARY_MODEL,
+                messages=[
+                    {"role": "system", "content": self.SUMMARY_PROMPT},
+                    {"role": "user", "content": f"Summary so far:\n{summary or '(none)'}\n\nNew messages:\n{transcript}"}
+                ],
+                max_tokens=SUMMARY_MAX_TOKENS,
+                temperature=0
+            )
+        if response.usage:
+            OPENAI_TOKENS.inc(response.usage.prompt_tokens, model=SUMMARY_MODEL, kind='prompt')
+            OPENAI_TOKENS.inc(response.usage.completion_tokens, model=SUMMARY_MODEL, kind='completion')
+        return response.choices[0].message.content.strip()
+
+    @staticmethod
+    def clean_code(content):
+        code = re.sub(r'^```python\n|^```\n|```$', '', content, flags=re.MULTILINE)
         code_lines = code.split('\n')
         
         # Clean up code, removing any unnecessary lines
@@ -71,28 +324,78 @@ class OpenAIHelper:
 class LibraryManager:
     @staticmethod
     def install_libraries(code):
-        libraries = re.findall(r'#\s*pip install\s+([\w-]+)', code)
-        if libraries:
-            print("Installing required libraries...")
-            for lib in libraries:
-                try:
-                    importlib.import_module(lib.replace('-', '_'))
-                    print(f"{lib} is already installed.")
-                except ImportError:
-                    print(f"Installing {lib}...")
-                    subprocess.check_call([sys.executable, "-m", "pip", "install", lib])
-            print("Libraries installed successfully.")
+        # Returns the distribution -> version the code will run against
+        return LibraryManager.install_batch([code])[0]
+
+    @staticmethod
+    def install_batch(codes):
+        # One install for everything the scripts need between them, each gets back only its own versions
+        wanted = [dependency_resolver.requirements_for(code) for code in codes]
+        requirements = frozenset().union(*wanted)
+        if not requirements:
+            return [{} for _ in codes]
+        with STAGE_LATENCY.time(stage='install'):
+            result = dependency_resolver.ensure(requirements)
+        if result['installed']:
+            print(f"Installed {', '.join(result['installed'])}.")
+        if result['failed']:
+            print(f"Could not install {', '.join(result['failed'])}.")
+        return [{d: result['versions'][d] for d in needed} for needed in wanted]
+
+class ExecutionResult:
+    def __init__(self, run_id, stdout="", stderr="", artifacts=None):
+        self.run_id = run_id
+        self.stdout = stdout
+        self.stderr = stderr
+        self.exit_code = None
+        # True when the result was replayed from the execution cache instead of run
+        self.cached = False
+        # CPU time, peak RSS, bytes written and which cap, if any, the run hit
+        self.resources = {}
+        self.code_digest = None
+        self.usage = {}
+        # Milliseconds per stage of the run that produced this, see CodeGenerator._timings
+        self.timings = {}
+        # Manifest of the files this run produced, in the order they were stored
+        self.artifacts = artifacts or []
+
+    @property
+    def output(self):
+        # The last artifact stored, or stdout when the script made no files
+        return self.artifacts[-1]['path'] if self.artifacts else self.stdout
+
+    @property
+    def error(self):
+        return self.stderr
 
 class CodeExecutor:
     @staticmethod
-    def execute_code(code, requestor_id):
-        # Ensure the output directory exists
+    def execute_code(code, requestor_id, allocate_version=None, dependencies=None):
         output_dir = os.path.join(os.getcwd(), 'output')
-        os.makedirs(output_dir, exist_ok=True)
+        code_digest = hashlib.sha256(code.encode('utf-8')).hexdigest()
+        cache_key = None
+        if execution_cache and execution_cache.cacheable(code):
+            cache_key = execution_cache.make_key(code, dependencies)
+            cached = execution_cache.get(cache_key)
+            if cached:
+                try:
+                    result = CodeExecutor._replay(cached, output_dir, requestor_id, allocate_version)
+                    result.code_digest = code_digest
+                    return result
+                except FileNotFoundError:
+                    # A blob went away since the lookup, run it after all
+                    execution_cache.delete(cache_key)
+
+        # Every run gets its own scratch directory, so concurrent runs never see each other's files
+        run_id = uuid.uuid4().hex
+        scratch_dir = os.path.join(output_dir, 'runs', run_id)
+        os.makedirs(scratch_dir)
         
-        # Generate a unique filename
-        filename = f"temp_{uuid.uuid4().hex}.py"
-        temp_file_path = os.path.join(output_dir, filename)
+        filename = f"temp_{run_id}.py"
+        temp_file_path = os.path.join(scratch_dir, filename)
+        result = ExecutionResult(run_id)
+        result.code_digest = code_digest
+        usage = {}
         
         try:
             # Write the code to the file
@@ -100,36 +403,134 @@ class CodeExecutor:
                 temp_file.write(code)
             
             # Execute the code
-            result = subprocess.run(['python', temp_file_path], capture_output=True, text=True, timeout=30, cwd=output_dir)
-            output = result.stdout
-            error = result.stderr
-            
-        except subprocess.TimeoutExpired:
-            output = ""
-            error = "Execution timed out after 30 seconds."
+            with span('script'):
+                if EXECUTOR_MODE == 'warm':
+                    executor = get_warm_executor(size=WARM_POOL_SIZE, preload=WARM_PRELOAD)
+                    result.stdout, result.stderr, result.exit_code, timed_out, usage = executor.execute(
+                        temp_file_path, scratch_dir, timeout=EXECUTION_TIMEOUT, limits=execution_limits
+                    )
+                elif EXECUTOR_MODE == 'stub':
+                    result.stdout, result.stderr, result.exit_code, timed_out, usage = CodeExecutor._run_stub(
+                        scratch_dir, EXECUTOR_STUB_SECONDS
+                    )
+                else:
+                    result.stdout, result.stderr, result.exit_code, timed_out, usage = run_limited(
+                        ['python', temp_file_path], scratch_dir, EXECUTION_TIMEOUT, execution_limits
+                    )
+            if timed_out:
+                result.stdout = ""
+                result.stderr = f"Execution timed out after {EXECUTION_TIMEOUT} seconds."
         finally:
             # Clean up the temporary file
             if os.path.exists(temp_file_path):
                 os.remove(temp_file_path)
 
-            for file in Path(output_dir).iterdir():
-                if file.is_file() and file.suffix != '.log':
-                    # Ensure the 'users/requestor_id' directory exists
-                    destination = Path(output_dir) / 'users' / requestor_id
-                    destination.mkdir(parents=True, exist_ok=True)
-
-                                # Prepare the new file name with versioning
-                    base_name = file.stem
-                    extension = file.suffix
-                    version = 1
-                    while True:
-                        new_file_name = f"{base_name}_v{version}{extension}"
-                        new_file_path = destination / new_file_name
-                        if not new_file_path.exists():
-                            break
-                        version += 1
-                    # Move the file to the 'users/requestor_id' directory
-                    file.rename(new_file_path)  # Actually move the file
-                    output = new_file_path
-        
-        return output, error
\ No newline at end of file
+            with span('scan'):
+                usage['output_bytes'] = directory_bytes(scratch_dir)
+            usage['limit_exceeded'] = execution_limits.exceeded(usage, result.stderr, result.exit_code)
+            result.resources = usage
+            CodeExecutor._record_metrics(result)
+            if usage['limit_exceeded'] == 'output':
+                # Over the output cap, nothing from this run is kept
+                result.stderr = f"{result.stderr}\nOutput exceeded {execution_limits.output_bytes} bytes.".strip()
+                shutil.rmtree(scratch_dir, ignore_errors=True)
+                os.makedirs(scratch_dir)
+
+            destination = Path(output_dir) / 'users' / requestor_id
+            with STAGE_LATENCY.time(stage='store'), span('artifacts'):
+                for file in sorted(Path(scratch_dir).iterdir()):
+                    if file.is_file() and file.suffix != '.log':
+                        destination.mkdir(parents=True, exist_ok=True)
+                        new_file_path, stored = CodeExecutor.store_artifact(file, destination, requestor_id, allocate_version)
+                        result.artifacts.append({
+                            'name': file.name,
+                            'file_name': new_file_path.name,
+                            'path': new_file_path,
+                            **stored,
+                        })
+                shutil.rmtree(scratch_dir, ignore_errors=True)
+
+        if cache_key and result.exit_code == 0:
+            execution_cache.set(cache_key, result.stdout, result.stderr, result.artifacts)
+        return result
+
+    @staticmethod
+    def reject(code, error):
+        # Code that doesn't parse, failed the way Python would have failed it
+        stderr = f'  File "<generated>", line {error.lineno}\n{type(error).__name__}: {error.msg}'
+        result = ExecutionResult(uuid.uuid4().hex, stderr=stderr)
+        result.exit_code = 1
+        result.code_digest = hashlib.sha256(code.encode('utf-8')).hexdigest()
+        EXECUTIONS.inc(mode=EXECUTOR_MODE, cached='false', outcome='rejected')
+        return result
+
+    @staticmethod
+    def _run_stub(cwd, delay):
+        # Stands in for the script in load tests: takes `delay`, makes one small file, runs nothing
+        started = time.perf_counter()
+        time.sleep(delay)
+        with open(os.path.join(cwd, 'report.csv'), 'w') as f:
+            f.write(f"run,value\n{uuid.uuid4().hex},1\n")
+        usage = {'wall_seconds': time.perf_counter() - started, 'stdout_bytes': 0, 'stderr_bytes': 0, 'timed_out': False}
+        return "", "", 0, False, usage
+
+    @staticmethod
+    def _record_metrics(result):
+        usage = result.resources
+        outcome = usage.get('limit_exceeded') or ('ok' if result.exit_code == 0 else 'error')
+        EXECUTIONS.inc(mode=EXECUTOR_MODE, cached='false', outcome=outcome)
+        if 'wall_seconds' in usage:
+            STAGE_LATENCY.observe(usage['wall_seconds'], stage='execute')
+        if 'cpu_seconds' in usage:
+            EXECUTION_CPU.observe(usage['cpu_seconds'], mode=EXECUTOR_MODE)
+            EXECUTION_RSS.observe(usage['max_rss_bytes'], mode=EXECUTOR_MODE)
+        EXECUTION_OUTPUT.observe(usage.get('output_bytes', 0), mode=EXECUTOR_MODE)
+
+    @staticmethod
+    def _replay(cached, output_dir, requestor_id, allocate_version=None):
+        # Same code against the same dependencies, hand out the stored artifacts under fresh names
+        result = ExecutionResult(uuid.uuid4().hex, cached['stdout'], cached['stderr'])
+        result.exit_code = 0
+        result.cached = True
+        destination = Path(output_dir) / 'users' / requestor_id
+        for artifact in cached['artifacts']:
+            destination.mkdir(parents=True, exist_ok=True)
+            stored = {k: artifact[k] for k in ('digest', 'size', 'mime_type')}
+            new_file_path = CodeExecutor._link_versioned(Path(artifact['name']), stored, destination, allocate_version)
+            result.artifacts.append({
+                'name': artifact['name'],
+                'file_name': new_file_path.name,
+                'path': new_file_path,
+                **stored,
+            })
+        EXECUTIONS.inc(mode=EXECUTOR_MODE, cached='true', outcome='ok')
+        print(f"Execution cache hit, replayed {len(result.artifacts)} artifact(s)")
+        return result
+
+    @staticmethod
+    def store_artifact(file, destination, requestor_id, allocate_version=None):
+        # The bytes go into the content-addressed store once, the versioned name just points at them
+        stored = artifact_store.put(file)
+        return CodeExecutor._link_versioned(file, stored, destination, allocate_version), stored
+
+    @staticmethod
+    def _link_versioned(file, stored, destination, allocate_version=None):
+        base_name = file.stem
+        extension = file.suffix
+        while True:
+            if allocate_version:
+                version = allocate_version(file.name)
+            else:
+                version = CodeExecutor._next_free_version(destination, base_name, extension)
+            new_file_path = destination / f"{base_name}_v{version}{extension}"
+            # Refuses to overwrite, so a file left over from before the counter existed is skipped
+            if artifact_store.link(stored['digest'], new_file_path):
+                return new_file_path
+
+    @staticmethod
+    def _next_free_version(destination, base_name, extension):
+        # Fallback when no counter is available
+        version = 1
+        while (destination / f"{base_name}_v{version}{extension}").exists():
+            version += 1
+        return version
@@ -0,0 +1,118 @@
+import ast
+import re
+import threading
+import time
+from concurrent.futures import wait
+
+# A line starting with one of these continues the statement above it
+CONTINUATIONS = ('else', 'elif', 'except', 'finally', ')', ']', '}')
+
+
+class CodeStream:
+    """Follows generated code token by token, so the work on it starts before it's complete.
+
+    Every import or `# pip install` line that streams in has its
+    distributions handed to the resolver's prefetch straight away, one
+    future per distribution so concurrent generations share an install.
+    Statements are syntax checked as they complete: a line that starts at
+    column 0 closes the statements above it, and the lines since the last
+    check are parsed on their own. A piece that doesn't parse yet is just
+    carried over to the next line, so once the code ends only the unchecked
+    tail is left to parse. Lines go through the same cleanup as
+    OpenAIHelper.clean_code. `feed` and everything after it run on the
+    thread generating the code, the job's worker, while the OpenAI client
+    waits for the next chunk. Only `_prefetched` runs elsewhere, on the
+    resolver's install threads, hence the lock.
+    """
+
+    def __init__(self, resolver):
+        self.resolver = resolver
+        self.lines = []
+        self.requirements = set()
+        self.started = time.perf_counter()
+        self.first_token_at = None
+        self.prefetch_started_at = None
+        self.installed_at = None
+        self.validate_seconds = 0.0
+        self._futures = []
+        self._partial = ''
+        self._in_code = False
+        self._checked = 0
+        self._lock = threading.Lock()
+
+    def feed(self, text: str):
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+        *complete, self._partial = (self._partial + text).split('\n')
+        for line in complete:
+            self._line(line)
+
+    def close(self):
+        if self._partial:
+            self._line(self._partial)
+            self._partial = ''
+
+    def _line(self, line: str):
+        if re.match(r'^```(python)?\s*$', line):
+            return
+        if not self._in_code:
+            # Whatever comes before the code proper, as clean_code drops it
+            if not line.startswith(('import', 'from', '#')):
+                return
+            self._in_code = True
+        if line[:1] not in ('', ' ', '\t') and not line.startswith(CONTINUATIONS):
+            self._check(len(self.lines))
+        self.lines.append(line)
+        stripped = line.strip()
+        if stripped.startswith(('import ', 'from ')) or re.search(r'#\s*pip install', stripped):
+            self._prefetch(stripped)
+
+    def _prefetch(self, line: str):
+        for distribution in self.resolver.requirements_for(line) - self.requirements:
+            self.requirements.add(distribution)
+            if self.prefetch_started_at is None:
+                self.prefetch_started_at = time.perf_counter()
+            future = self.resolver.prefetch({distribution})
+            future.add_done_callback(self._prefetched)
+            self._futures.append(future)
+
+    def _prefetched(self, future):
+        with self._lock:
+            self.installed_at = time.perf_counter()
+
+    def _check(self, end: int):
+        # Lines [_checked, end) are complete statements if they parse on their own
+        if end <= self._checked:
+            return
+        started = time.perf_counter()
+        try:
+            ast.parse('\n'.join(self.lines[self._checked:end]))
+            self._checked = end
+        except SyntaxError:
+            pass
+        finally:
+            self.validate_seconds += time.perf_counter() - started
+
+    def wait(self):
+        # Blocks until every prefetch has finished, failures are left to the final install
+        wait(self._futures)
+
+    def validate(self, code: str):
+        """The SyntaxError in `code`, None when it parses. Only the part not checked yet is parsed."""
+        started = time.perf_counter()
+        try:
+            checked = '\n'.join(self.lines[:self._checked])
+            if self._checked and code.startswith(checked + '\n'):
+                try:
+                    ast.parse(code[len(checked) + 1:])
+                    return None
+                except SyntaxError:
+                    # Parsed again whole, for the right line number
+                    pass
+            try:
+                ast.parse(code)
+            except SyntaxError as e:
+                return e
+            return None
+        finally:
+            self.validate_seconds += time.perf_counter() - started
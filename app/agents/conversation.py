@@ -0,0 +1,95 @@
+from collections import namedtuple
+
+from ..config import unit_of_work
+from ..models.message import MessageType
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("o200k_base")
+except Exception:
+    # Optional, without it we estimate at four characters a token
+    _encoding = None
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return (len(text) + 3) // 4
+
+
+# What history needs of a message, read once so nothing lazy-loads outside the transaction
+Turn = namedtuple('Turn', 'content line_type revision')
+
+
+class ConversationHistory:
+    """Fits a chat's history into a token budget for the next generation.
+
+    The newest messages are sent verbatim. Whatever doesn't fit is folded
+    into the chat's rolling summary, which is stored with the revision of
+    the last message it covers, so a message is summarized once and later
+    calls only read the summary back. When it has to fold, it folds until
+    half the budget is free again, so summarizing happens every few turns
+    rather than on every one.
+    """
+
+    def __init__(self, token_budget: int, max_messages: int, summarize=None):
+        self.token_budget = token_budget
+        self.max_messages = max_messages
+        # summarize(previous_summary, messages) -> new summary
+        self.summarize = summarize
+
+    def build(self, db, chat, prompt: str, message_id=None):
+        # Reading and saving the summary are short transactions of their own, nothing
+        # is held open while OpenAI writes the summary
+        with unit_of_work(db):
+            chat_id = chat.id
+            summary = chat.summary or ''
+            summary_revision = chat.summary_revision
+            recent = chat.get_recent_messages(db, summary_revision, self.max_messages)
+            if message_id is not None:
+                # The prompt is sent on its own, wherever an edit left its message
+                recent = [m for m in recent if m.id != message_id]
+            elif recent and recent[0].line_type == MessageType.USER and recent[0].content == prompt:
+                recent = recent[1:]
+            messages = [Turn(m.content, m.line_type, m.revision) for m in recent]
+
+        budget = self.token_budget - count_tokens(prompt) - count_tokens(summary)
+        kept, used = [], 0
+        for message in messages:
+            tokens = count_tokens(message.content)
+            if used + tokens > budget:
+                break
+            kept.append((message, tokens))
+            used += tokens
+
+        overflow = messages[len(kept):]
+        if overflow and self.summarize:
+            while kept and used > budget // 2:
+                message, tokens = kept.pop()
+                overflow.insert(0, message)
+                used -= tokens
+            try:
+                summary = self.summarize(summary, list(reversed(overflow)))
+                with unit_of_work(db):
+                    if not chat.save_summary(db, summary, overflow[0].revision, summary_revision):
+                        # Another job got there first, this generation still uses its own summary
+                        print(f"Summary of chat {chat_id} was updated concurrently, keeping the other one")
+            except Exception as e:
+                # Carry on without the overflow rather than fail the generation
+                print(f"Failed to summarize chat {chat_id}: {e}")
+
+        history = []
+        if summary:
+            history.append({"role": "system", "content": f"Summary of the conversation so far: {summary}"})
+        for message, _ in reversed(kept):
+            role = "user" if message.line_type == MessageType.USER else "assistant"
+            history.append({"role": role, "content": message.content})
+
+        usage = {
+            "history_messages": len(kept),
+            "history_tokens": used,
+            "summary_tokens": count_tokens(summary),
+        }
+        return history, usage
@@ -0,0 +1,247 @@
+import ast
+import importlib
+import importlib.metadata
+import json
+import os
+import re
+import subprocess
+import sys
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+
+# Import name -> pip name for popular packages whose names differ, used
+# when the distribution isn't installed yet so metadata can't tell us
+IMPORT_TO_DISTRIBUTION = {
+    'pptx': 'python-pptx',
+    'docx': 'python-docx',
+    'PIL': 'pillow',
+    'bs4': 'beautifulsoup4',
+    'sklearn': 'scikit-learn',
+    'cv2': 'opencv-python',
+    'yaml': 'pyyaml',
+    'dateutil': 'python-dateutil',
+    'fitz': 'pymupdf',
+    'dotenv': 'python-dotenv',
+}
+
+
+def canonicalize(name: str) -> str:
+    return re.sub(r'[-_.]+', '-', name).lower()
+
+
+class DependencyResolver:
+    """Works out which distributions a generated script needs and installs the missing ones.
+
+    Installed distributions and their import names are kept in a JSON index
+    on disk so startup doesn't rescan site-packages. The index is signed
+    with the site-packages directories' mtimes, which change whenever a
+    package is installed, upgraded or removed by anyone, and is rebuilt
+    when they no longer match. Missing packages are
+    built into a local wheel cache in parallel and installed from it in one
+    pip call. Resolved requirement sets are memoized, so a repeat costs a
+    dictionary lookup.
+    """
+
+    def __init__(self, index_path: str, wheel_dir: str, max_workers: int = 4):
+        self.index_path = index_path
+        self.wheel_dir = wheel_dir
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="resolver")
+        self._resolved = {}
+        self._inflight = {}
+        self._distributions = {}
+        self._modules = {}
+        self._indexed_signature = None
+        os.makedirs(wheel_dir, exist_ok=True)
+        if not self._load_index():
+            self.rebuild_index()
+
+    def _signature(self):
+        mtimes = []
+        for path in sys.path:
+            if os.path.basename(path) in ('site-packages', 'dist-packages'):
+                try:
+                    mtimes.append(f"{path}@{os.stat(path).st_mtime_ns}")
+                except OSError:
+                    pass
+        return f"{sys.executable}:{sys.version_info[0]}.{sys.version_info[1]}:{','.join(mtimes)}"
+
+    def refresh(self):
+        # A stat per site-packages directory, cheap enough to run on every lookup
+        if self._signature() != self._indexed_signature:
+            self.rebuild_index()
+            with self._lock:
+                self._resolved.clear()
+
+    def _load_index(self):
+        try:
+            with open(self.index_path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if data.get('signature') != self._signature():
+            return False
+        self._distributions = data['distributions']
+        self._modules = data['modules']
+        self._indexed_signature = data['signature']
+        return True
+
+    def rebuild_index(self):
+        # Taken first, a change during the scan shows up as a mismatch next time
+        signature = self._signature()
+        distributions = {}
+        modules = {}
+        for module, dists in importlib.metadata.packages_distributions().items():
+            for dist in dists:
+                name = canonicalize(dist)
+                entry = distributions.setdefault(name, {'version': None, 'import_names': []})
+                entry['import_names'].append(module)
+                modules.setdefault(module, name)
+        for dist in importlib.metadata.distributions():
+            name = canonicalize(dist.metadata['Name'] or '')
+            if name:
+                distributions.setdefault(name, {'version': None, 'import_names': []})['version'] = dist.version
+
+        with self._lock:
+            self._distributions = distributions
+            self._modules = modules
+            self._indexed_signature = signature
+        os.makedirs(os.path.dirname(os.path.abspath(self.index_path)), exist_ok=True)
+        tmp_path = f"{self.index_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'signature': signature, 'distributions': distributions, 'modules': modules}, f)
+        os.replace(tmp_path, self.index_path)
+
+    @staticmethod
+    def parse_pip_comments(code: str):
+        names = []
+        for line in re.findall(r'#\s*pip install\s+(.+)', code):
+            for token in line.split():
+                if token.startswith('-'):
+                    continue
+                match = re.match(r'[A-Za-z0-9][\w.-]*', token)
+                if match:
+                    names.append(match.group(0))
+        return names
+
+    @staticmethod
+    def parse_imports(code: str):
+        try:
+            tree = ast.parse(code)
+        except SyntaxError:
+            return set(re.findall(r'^\s*(?:from|import)\s+([A-Za-z_]\w*)', code, flags=re.MULTILINE))
+        modules = set()
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                modules.update(alias.name.split('.')[0] for alias in node.names)
+            elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+                modules.add(node.module.split('.')[0])
+        return modules
+
+    def to_distribution(self, name: str) -> str:
+        canonical = canonicalize(name)
+        if canonical in self._distributions:
+            return canonical
+        if name in self._modules:
+            return self._modules[name]
+        if name in IMPORT_TO_DISTRIBUTION:
+            return IMPORT_TO_DISTRIBUTION[name]
+        return canonical
+
+    def requirements_for(self, code: str) -> frozenset:
+        requirements = {self.to_distribution(name) for name in self.parse_pip_comments(code)}
+        # Imports are only trusted when we know which distribution provides them
+        for module in self.parse_imports(code):
+            if module in sys.stdlib_module_names:
+                continue
+            if module in IMPORT_TO_DISTRIBUTION and module not in self._modules:
+                requirements.add(IMPORT_TO_DISTRIBUTION[module])
+        return frozenset(requirements)
+
+    def is_installed(self, distribution: str) -> bool:
+        return canonicalize(distribution) in self._distributions
+
+    def ensure(self, requirements) -> dict:
+        self.refresh()
+        if isinstance(requirements, str):
+            requirements = self.requirements_for(requirements)
+        resolved = self._resolved.get(frozenset(requirements))
+        if resolved is not None:
+            return resolved
+        return self.prefetch(requirements).result()
+
+    def prefetch(self, requirements) -> Future:
+        # Starts resolution in the background, concurrent callers share one future
+        self.refresh()
+        if isinstance(requirements, str):
+            requirements = self.requirements_for(requirements)
+        requirements = frozenset(requirements)
+        with self._lock:
+            resolved = self._resolved.get(requirements)
+            if resolved is not None:
+                future = Future()
+                future.set_result(resolved)
+                return future
+            future = self._inflight.get(requirements)
+            started = future is None
+            if started:
+                future = self._pool.submit(self._resolve, requirements)
+                self._inflight[requirements] = future
+        if started:
+            future.add_done_callback(lambda _: self._forget(requirements))
+        return future
+
+    def _forget(self, requirements):
+        with self._lock:
+            self._inflight.pop(requirements, None)
+
+    def _resolve(self, requirements: frozenset) -> dict:
+        missing = sorted(d for d in requirements if not self.is_installed(d))
+        failed = []
+        if missing:
+            print(f"Installing {', '.join(missing)}...")
+            failed = self._install(missing)
+            self.rebuild_index()
+        result = {
+            'requirements': sorted(requirements),
+            'installed': [d for d in missing if d not in failed],
+            'failed': failed,
+            'versions': {d: self._distributions.get(d, {}).get('version') for d in requirements},
+        }
+        if not failed:
+            self._resolved[requirements] = result
+        return result
+
+    def _has_wheel(self, distribution: str) -> bool:
+        # Wheel file names start with the distribution name, with dashes escaped
+        name = canonicalize(distribution)
+        return any(
+            canonicalize(wheel.split('-')[0]) == name
+            for wheel in os.listdir(self.wheel_dir) if wheel.endswith('.whl')
+        )
+
+    def _fetch_wheel(self, distribution: str):
+        if self._has_wheel(distribution):
+            return
+        subprocess.check_call(
+            [sys.executable, "-m", "pip", "wheel", "--quiet", "--wheel-dir", self.wheel_dir, distribution]
+        )
+
+    def _install(self, distributions):
+        # Download/build in parallel, that's where the time goes
+        with ThreadPoolExecutor(max_workers=len(distributions)) as fetchers:
+            futures = {fetchers.submit(self._fetch_wheel, d): d for d in distributions}
+            wait(futures)
+        failed = [d for future, d in futures.items() if future.exception()]
+        to_install = [d for d in distributions if d not in failed]
+        if to_install:
+            try:
+                subprocess.check_call(
+                    [sys.executable, "-m", "pip", "install", "--quiet", "--no-index",
+                     "--find-links", self.wheel_dir, *to_install]
+                )
+            except subprocess.CalledProcessError as e:
+                print(f"Failed to install {', '.join(to_install)}: {e}")
+                failed.extend(to_install)
+        importlib.invalidate_caches()
+        return failed
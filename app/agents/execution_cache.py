@@ -0,0 +1,164 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+
+# Generated scripts carry this comment when their output depends on the
+# clock, randomness or live data, and are then always run
+NO_CACHE_MARKER = "# cache: off"
+_NO_CACHE = re.compile(r'^\s*#\s*cache:\s*off\b', flags=re.IGNORECASE | re.MULTILINE)
+
+
+class ExecutionCache:
+    """Results of running generated code, keyed on the code and the dependency versions it ran against.
+
+    An entry holds stdout, stderr and the digests of the artifacts the run
+    produced, never the files themselves: those live in the artifact store.
+    An entry is only as good as its blobs, so `forget_digest` drops every
+    entry that handed out a blob when the store deletes it, and lookups
+    don't ask the store (a HEAD per file on S3). Blobs that went away
+    behind the store's back are swept by `evict_missing`, which the
+    retention sweep runs. Shares the SQLite layout of PromptCache.
+    """
+
+    def __init__(self, path: str, ttl_seconds: int = 7 * 24 * 3600, max_entries: int = 10000):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+        self._local = threading.local()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS execution_cache (
+                    key TEXT PRIMARY KEY,
+                    result TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used REAL NOT NULL,
+                    hit_count INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_execution_cache_last_used ON execution_cache (last_used)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS execution_cache_digests (
+                    key TEXT NOT NULL,
+                    digest TEXT NOT NULL,
+                    PRIMARY KEY (digest, key)
+                )
+            """)
+
+    def _connect(self):
+        # sqlite3 connections can't be shared across threads, keep one per thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def cacheable(code: str) -> bool:
+        return not _NO_CACHE.search(code)
+
+    @staticmethod
+    def make_key(code: str, dependencies: dict = None) -> str:
+        pinned = ','.join(f"{name}=={version}" for name, version in sorted((dependencies or {}).items()))
+        raw = '\x00'.join([f"{sys.version_info[0]}.{sys.version_info[1]}", pinned, code])
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def get(self, key: str):
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute("SELECT result, created_at FROM execution_cache WHERE key = ?", (key,)).fetchone()
+            result = json.loads(row[0]) if row else None
+            if row and now - row[1] > self.ttl_seconds:
+                self._delete(conn, [key])
+                result = None
+            if result:
+                conn.execute(
+                    "UPDATE execution_cache SET last_used = ?, hit_count = hit_count + 1 WHERE key = ?",
+                    (now, key)
+                )
+        with self._stats_lock:
+            if result:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return result
+
+    def set(self, key: str, stdout: str, stderr: str, artifacts):
+        result = {
+            'stdout': stdout,
+            'stderr': stderr,
+            'artifacts': [
+                {k: artifact[k] for k in ('name', 'digest', 'size', 'mime_type')} for artifact in artifacts
+            ],
+        }
+        now = time.time()
+        with self._connect() as conn:
+            self._delete(conn, [key])
+            conn.execute(
+                "INSERT INTO execution_cache (key, result, created_at, last_used) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(result), now, now)
+            )
+            conn.executemany(
+                "INSERT OR IGNORE INTO execution_cache_digests (key, digest) VALUES (?, ?)",
+                [(key, a['digest']) for a in result['artifacts']]
+            )
+            expired = [k for k, in conn.execute("SELECT key FROM execution_cache WHERE created_at < ?", (now - self.ttl_seconds,))]
+            count = conn.execute("SELECT COUNT(*) FROM execution_cache").fetchone()[0] - len(expired)
+            if count > self.max_entries:
+                expired += [k for k, in conn.execute(
+                    "SELECT key FROM execution_cache ORDER BY last_used ASC LIMIT ?", (count - self.max_entries,)
+                )]
+            self._delete(conn, expired)
+
+    def delete(self, key: str):
+        with self._connect() as conn:
+            self._delete(conn, [key])
+
+    @staticmethod
+    def _delete(conn, keys):
+        for key in keys:
+            conn.execute("DELETE FROM execution_cache WHERE key = ?", (key,))
+            conn.execute("DELETE FROM execution_cache_digests WHERE key = ?", (key,))
+
+    def forget_digest(self, digest: str):
+        # Call when a blob is deleted, every result that handed it out goes with it
+        with self._connect() as conn:
+            keys = [k for k, in conn.execute("SELECT key FROM execution_cache_digests WHERE digest = ?", (digest,))]
+            self._delete(conn, keys)
+
+    def evict_missing(self, store) -> int:
+        with self._connect() as conn:
+            digests = [d for d, in conn.execute("SELECT DISTINCT digest FROM execution_cache_digests")]
+        missing = [d for d in digests if not store.exists(d)]
+        for digest in missing:
+            self.forget_digest(digest)
+        return len(missing)
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM execution_cache")
+            conn.execute("DELETE FROM execution_cache_digests")
+
+    def stats(self):
+        with self._connect() as conn:
+            entries = conn.execute("SELECT COUNT(*) FROM execution_cache").fetchone()[0]
+        with self._stats_lock:
+            hits, misses = self.hits, self.misses
+        lookups = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "entries": entries,
+        }
@@ -0,0 +1,221 @@
+import asyncio
+import queue
+import random
+import threading
+from collections import deque
+
+import httpx
+import openai
+
+from ..metrics import OPENAI_RETRIES, OPENAI_HEDGES
+
+_END = object()
+
+
+def retryable(error) -> bool:
+    if isinstance(error, openai.APIConnectionError):
+        # Timeouts included
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in (408, 409, 429) or error.status_code >= 500
+    return False
+
+def retry_after(error):
+    response = getattr(error, 'response', None)
+    value = response.headers.get('retry-after') if response is not None else None
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+class LatencyTracker:
+    """The last `size` times to a first response, for picking when to hedge."""
+
+    def __init__(self, size: int = 200):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def quantile(self, q: float, min_samples: int = 20):
+        with self._lock:
+            samples = sorted(self._samples)
+        if len(samples) < min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * q))]
+
+
+class OpenAIClient:
+    """One AsyncOpenAI client for the whole process, on an event loop thread of its own.
+
+    Connections stay in a keep-alive pool across generations instead of a
+    TLS handshake per request. Callers are job worker threads, so `complete`
+    and `stream` block the caller while the I/O for every caller runs on
+    the one loop, which does nothing else: stream chunks are handed back to
+    the caller's thread. Failed calls on 429, 5xx and connection errors are
+    retried with exponential backoff and full jitter, honouring Retry-After,
+    and all attempts together have to fit in the call's deadline. With
+    hedging on, an attempt with no response after the recent p95 for its
+    model and kind of call gets a duplicate sent alongside it and the first
+    answer wins; for streams "response" means the first chunk. Once tokens
+    have been handed out a stream is never retried.
+    """
+
+    def __init__(self, max_connections: int = 20, max_retries: int = 4, backoff_base: float = 0.5,
+                 backoff_max: float = 20, deadline: float = 120, hedge: bool = False,
+                 hedge_quantile: float = 0.95, hedge_min_samples: int = 20, http_client=None):
+        self.max_connections = max_connections
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.deadline = deadline
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_samples = hedge_min_samples
+        self._latency = {}
+        self._http_client = http_client
+        self._client = None
+        self._loop = None
+        self._lock = threading.Lock()
+
+    def _start(self):
+        # Lazily, so importing the app needs neither an API key nor a thread
+        with self._lock:
+            if self._loop is None:
+                http_client = self._http_client or openai.DefaultAsyncHttpxClient(
+                    limits=httpx.Limits(
+                        max_connections=self.max_connections,
+                        max_keepalive_connections=self.max_connections,
+                        keepalive_expiry=60
+                    )
+                )
+                # Retries are ours, the SDK's own would ignore the deadline
+                self._client = openai.AsyncOpenAI(max_retries=0, timeout=self.deadline, http_client=http_client)
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="openai_client", daemon=True).start()
+                self._loop = loop
+        return self._loop
+
+    def latency_for(self, model: str, stream: bool) -> LatencyTracker:
+        # Time to a first chunk and time to a whole completion differ by far, and so do models
+        with self._lock:
+            return self._latency.setdefault((model, stream), LatencyTracker())
+
+    def _run(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self._start()).result()
+
+    def complete(self, deadline: float = None, **kwargs):
+        return self._run(self._with_retries(
+            lambda: self._client.chat.completions.create(**kwargs), deadline or self.deadline,
+            latency=self.latency_for(kwargs.get('model'), False)
+        ))
+
+    def stream(self, on_chunk, deadline: float = None, **kwargs):
+        # The loop thread only queues chunks, on_chunk(chunk) runs here on the calling
+        # thread, so a slow listener never holds up the calls of other threads
+        chunks = queue.Queue()
+        future = asyncio.run_coroutine_threadsafe(
+            self._stream(chunks.put_nowait, deadline or self.deadline, kwargs), self._start()
+        )
+        future.add_done_callback(lambda _: chunks.put_nowait(_END))
+        try:
+            while (chunk := chunks.get()) is not _END:
+                on_chunk(chunk)
+        except BaseException:
+            future.cancel()
+            raise
+        return future.result()
+
+    async def _stream(self, on_chunk, deadline, kwargs):
+        loop = asyncio.get_running_loop()
+        ends = loop.time() + deadline
+
+        async def open_stream():
+            stream = await self._client.chat.completions.create(stream=True, **kwargs)
+            try:
+                return stream, await stream.__anext__()
+            except StopAsyncIteration:
+                return stream, None
+            except BaseException:
+                await stream.close()
+                raise
+
+        stream, first = await self._with_retries(
+            open_stream, deadline, discard=lambda opened: opened[0].close(), latency=self.latency_for(kwargs.get('model'), True)
+        )
+
+        async def consume():
+            if first is not None:
+                on_chunk(first)
+            async for chunk in stream:
+                on_chunk(chunk)
+
+        try:
+            await asyncio.wait_for(consume(), max(0, ends - loop.time()))
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"OpenAI stream missed its {deadline:.0f}s deadline")
+        finally:
+            await stream.close()
+
+    async def _with_retries(self, attempt, deadline, discard=None, latency=None):
+        loop = asyncio.get_running_loop()
+        ends = loop.time() + deadline
+        retries = 0
+        while True:
+            try:
+                return await asyncio.wait_for(self._hedged(attempt, discard, latency), max(0, ends - loop.time()))
+            except asyncio.TimeoutError:
+                raise TimeoutError(f"OpenAI call missed its {deadline:.0f}s deadline")
+            except Exception as e:
+                if retries >= self.max_retries or not retryable(e):
+                    raise
+                delay = retry_after(e) or random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** retries))
+                if loop.time() + delay >= ends:
+                    raise
+                retries += 1
+                OPENAI_RETRIES.inc(reason=getattr(e, 'status_code', None) or 'connection')
+                print(f"OpenAI call failed ({type(e).__name__}), retry {retries} in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    async def _hedged(self, attempt, discard=None, latency=None):
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        latency = latency or LatencyTracker()
+        hedge_after = latency.quantile(self.hedge_quantile, self.hedge_min_samples) if self.hedge else None
+        primary = asyncio.ensure_future(attempt())
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=hedge_after)
+        except BaseException:
+            primary.cancel()
+            raise
+        if done:
+            result = primary.result()
+            latency.add(loop.time() - started)
+            return result
+
+        OPENAI_HEDGES.inc(outcome='sent')
+        backup = asyncio.ensure_future(attempt())
+        pending = {primary, backup}
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        error = task.exception()
+                        continue
+                    if task is backup:
+                        OPENAI_HEDGES.inc(outcome='won')
+                    latency.add(loop.time() - started)
+                    # Both could finish in the same turn, the loser is dropped
+                    for other in done - {task}:
+                        if discard and other.exception() is None:
+                            await discard(other.result())
+                    return task.result()
+            raise error
+        finally:
+            for task in (primary, backup):
+                task.cancel()
@@ -0,0 +1,118 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+
+
+class PromptCache:
+    """Persistent prompt -> generated code cache backed by SQLite.
+
+    The database file can be shared by every worker on the host. Entries
+    expire after `ttl_seconds` and the least recently used ones are evicted
+    once there are more than `max_entries`.
+    """
+
+    def __init__(self, path: str, ttl_seconds: int = 7 * 24 * 3600, max_entries: int = 10000):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+        self._local = threading.local()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS prompt_cache (
+                    key TEXT PRIMARY KEY,
+                    code TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used REAL NOT NULL,
+                    hit_count INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_prompt_cache_last_used ON prompt_cache (last_used)")
+
+    def _connect(self):
+        # sqlite3 connections can't be shared across threads, keep one per thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def normalize(prompt: str) -> str:
+        # Case is kept, file names, column names and quoted strings depend on it
+        prompt = re.sub(r'\s+', ' ', prompt.strip())
+        return prompt.rstrip('.!?')
+
+    def make_key(self, prompt: str, model: str, system_prompt: str, context: str = '', template: str = '') -> str:
+        # Context is the conversation the prompt was asked in, "make it blue" means nothing without it.
+        # Template is what the prompt is wrapped in, rewording it changes what comes back.
+        parts = [model, system_prompt, template, self.normalize(prompt)]
+        if context:
+            parts.append(context)
+        raw = '\x00'.join(parts)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def get(self, key: str):
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute("SELECT code, created_at FROM prompt_cache WHERE key = ?", (key,)).fetchone()
+            if row and now - row[1] > self.ttl_seconds:
+                conn.execute("DELETE FROM prompt_cache WHERE key = ?", (key,))
+                row = None
+            if row:
+                conn.execute(
+                    "UPDATE prompt_cache SET last_used = ?, hit_count = hit_count + 1 WHERE key = ?",
+                    (now, key)
+                )
+        with self._stats_lock:
+            if row:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return row[0] if row else None
+
+    def set(self, key: str, code: str):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO prompt_cache (key, code, created_at, last_used) VALUES (?, ?, ?, ?)",
+                (key, code, now, now)
+            )
+            conn.execute("DELETE FROM prompt_cache WHERE created_at < ?", (now - self.ttl_seconds,))
+            count = conn.execute("SELECT COUNT(*) FROM prompt_cache").fetchone()[0]
+            if count > self.max_entries:
+                conn.execute(
+                    "DELETE FROM prompt_cache WHERE key IN "
+                    "(SELECT key FROM prompt_cache ORDER BY last_used ASC LIMIT ?)",
+                    (count - self.max_entries,)
+                )
+
+    def delete(self, key: str):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM prompt_cache WHERE key = ?", (key,))
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM prompt_cache")
+
+    def stats(self):
+        with self._connect() as conn:
+            entries = conn.execute("SELECT COUNT(*) FROM prompt_cache").fetchone()[0]
+        with self._stats_lock:
+            hits, misses = self.hits, self.misses
+        lookups = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "entries": entries,
+        }
@@ -0,0 +1,152 @@
+import os
+import resource
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+MB = 1024 * 1024
+
+# Sets the rlimits given as limit:soft:hard and execs the command after --. Lets
+# run_limited cap a child without preexec_fn, which isn't safe in a threaded server.
+_SETRLIMIT_AND_EXEC = (
+    "import os, resource, sys\n"
+    "end = sys.argv.index('--')\n"
+    "for spec in sys.argv[1:end]:\n"
+    "    limit, soft, hard = map(int, spec.split(':'))\n"
+    "    resource.setrlimit(limit, (soft, hard))\n"
+    "os.execvp(sys.argv[end + 1], sys.argv[end + 1:])\n"
+)
+
+
+class ResourceLimits:
+    """Caps applied to a generated script's process with setrlimit, 0 means no cap.
+
+    `memory_bytes` limits the data segment, which Linux counts as the heap
+    plus private anonymous mappings; RSS itself can't be capped with rlimits.
+    `output_bytes` caps each file the script writes (RLIMIT_FSIZE, Python
+    then gets EFBIG instead of SIGXFSZ), and the executor checks the total
+    once the run is over.
+    """
+
+    def __init__(self, cpu_seconds: int = 0, memory_bytes: int = 0, open_files: int = 0, output_bytes: int = 0):
+        self.cpu_seconds = cpu_seconds
+        self.memory_bytes = memory_bytes
+        self.open_files = open_files
+        self.output_bytes = output_bytes
+
+    def apply(self):
+        # Caps the calling process, for the warm executor's forked workers
+        for limit, soft, hard in self.rlimits():
+            resource.setrlimit(limit, (soft, hard))
+
+    def wrap(self, args):
+        # `args` run under these caps, applied by a small interpreter that then execs them
+        specs = [f"{limit}:{soft}:{hard}" for limit, soft, hard in self.rlimits()]
+        return [sys.executable, '-I', '-S', '-c', _SETRLIMIT_AND_EXEC, *specs, '--', *args]
+
+    def rlimits(self):
+        # (limit, soft, hard) for each cap, kept under the hard limits this process has
+        rlimits = []
+        caps = [
+            (resource.RLIMIT_CPU, self.cpu_seconds),
+            (resource.RLIMIT_DATA, self.memory_bytes),
+            (resource.RLIMIT_NOFILE, self.open_files),
+            (resource.RLIMIT_FSIZE, self.output_bytes),
+            (resource.RLIMIT_CORE, 0),
+        ]
+        for limit, value in caps:
+            if value or limit == resource.RLIMIT_CORE:
+                _, hard = resource.getrlimit(limit)
+                value = value if hard == resource.RLIM_INFINITY else min(value, hard)
+                # SIGXCPU at the soft limit, SIGKILL a second later if it's ignored
+                ceiling = value + 1 if limit == resource.RLIMIT_CPU else value
+                if hard != resource.RLIM_INFINITY:
+                    ceiling = min(ceiling, hard)
+                rlimits.append((limit, value, ceiling))
+        return rlimits
+
+    def exceeded(self, usage: dict, stderr: str, exit_code):
+        # Best guess at which cap ended the run, None when none did
+        if usage.get('timed_out'):
+            return 'timeout'
+        if self.output_bytes and usage.get('output_bytes', 0) > self.output_bytes:
+            return 'output'
+        # CPU time is sampled per tick, a run stopped at the limit can read just under it
+        if exit_code == -signal.SIGXCPU or (self.cpu_seconds and usage.get('cpu_seconds', 0) >= self.cpu_seconds * 0.95):
+            return 'cpu'
+        if 'MemoryError' in (stderr or '') or (exit_code == -signal.SIGKILL and self.memory_bytes):
+            return 'memory'
+        if 'File too large' in (stderr or ''):
+            return 'output'
+        if 'Too many open files' in (stderr or ''):
+            return 'open_files'
+        return None
+
+
+def rusage_dict(rusage) -> dict:
+    return {
+        'cpu_user_seconds': rusage.ru_utime,
+        'cpu_system_seconds': rusage.ru_stime,
+        'cpu_seconds': rusage.ru_utime + rusage.ru_stime,
+        # Kilobytes on Linux
+        'max_rss_bytes': rusage.ru_maxrss * 1024,
+    }
+
+def directory_bytes(path) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except FileNotFoundError:
+                pass
+    return total
+
+
+def run_limited(args, cwd: str, timeout: float, limits: ResourceLimits):
+    """Runs a command under `limits` and measures it.
+
+    Reaped with wait4 so the child's own rusage comes back rather than the
+    sum over every child this process ever had. Output goes to files, a
+    pipe nobody reads while we poll would block the script.
+
+    Returns (stdout, stderr, exit_code, timed_out, usage).
+    """
+    with tempfile.TemporaryDirectory() as capture_dir:
+        stdout_path = os.path.join(capture_dir, 'stdout')
+        stderr_path = os.path.join(capture_dir, 'stderr')
+        started = time.perf_counter()
+        with open(stdout_path, 'wb') as stdout, open(stderr_path, 'wb') as stderr:
+            process = subprocess.Popen(limits.wrap(args), cwd=cwd, stdout=stdout, stderr=stderr)
+
+        deadline = started + timeout
+        delay = 0.002
+        timed_out = False
+        while True:
+            pid, status, rusage = os.wait4(process.pid, os.WNOHANG)
+            if pid:
+                break
+            if time.perf_counter() > deadline:
+                process.kill()
+                _, status, rusage = os.wait4(process.pid, 0)
+                timed_out = True
+                break
+            time.sleep(delay)
+            delay = min(delay * 2, 0.05)
+        # Already reaped, keep Popen from trying again
+        process.returncode = os.waitstatus_to_exitcode(status)
+
+        usage = {
+            **rusage_dict(rusage),
+            'wall_seconds': time.perf_counter() - started,
+            'stdout_bytes': os.path.getsize(stdout_path),
+            'stderr_bytes': os.path.getsize(stderr_path),
+            'timed_out': timed_out,
+        }
+        with open(stdout_path, errors='replace') as f:
+            out = f.read()
+        with open(stderr_path, errors='replace') as f:
+            err = f.read()
+    return out, err, process.returncode, timed_out, usage
@@ -0,0 +1,182 @@
+import atexit
+import json
+import multiprocessing
+import os
+import queue
+import resource
+import runpy
+import sys
+import tempfile
+import threading
+import time
+import traceback
+
+from .resource_limits import ResourceLimits, rusage_dict
+
+# Imported once in the fork server so every worker starts with them loaded.
+# Missing modules are skipped by the fork server.
+DEFAULT_PRELOAD = [
+    'app.agents.warm_executor',
+    'numpy',
+    'pandas',
+    'matplotlib',
+    'matplotlib.pyplot',
+    'pptx',
+    'openpyxl',
+]
+
+
+def _worker(conn):
+    # Runs in a fresh process forked from the fork server and handles exactly one script
+    job = conn.recv()
+    if job is None:
+        os._exit(0)
+    script_path, cwd, stdout_path, stderr_path, usage_path, limits = job
+
+    if limits:
+        limits.apply()
+    os.chdir(cwd)
+    for fd, path in ((1, stdout_path), (2, stderr_path)):
+        capture_fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        os.dup2(capture_fd, fd)
+        os.close(capture_fd)
+    sys.argv = [script_path]
+    sys.path[0] = os.path.dirname(script_path)
+
+    exit_code = 0
+    try:
+        runpy.run_path(script_path, run_name='__main__')
+    except SystemExit as e:
+        if isinstance(e.code, int):
+            exit_code = e.code
+        elif e.code is not None:
+            print(e.code, file=sys.stderr)
+            exit_code = 1
+    except BaseException:
+        traceback.print_exc()
+        exit_code = 1
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+    # Forked children start with zeroed CPU counters, so this is the script's own usage
+    try:
+        with open(usage_path, 'w') as f:
+            json.dump(rusage_dict(resource.getrusage(resource.RUSAGE_SELF)), f)
+    except OSError:
+        # Out of file descriptors, say, the run is still reported without usage
+        pass
+    os._exit(exit_code)
+
+
+class WarmExecutor:
+    """Pool of idle interpreters forked from a fork server with heavy libraries preloaded.
+
+    Each script still gets its own process: a worker runs a single job and
+    exits, and a replacement is forked in the background.
+    """
+
+    def __init__(self, size: int = 2, preload=None):
+        self.size = size
+        self._ctx = multiprocessing.get_context('forkserver')
+        self._ctx.set_forkserver_preload(preload if preload is not None else DEFAULT_PRELOAD)
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._started = False
+        self._closed = False
+
+    def start(self):
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        os.environ.setdefault('MPLBACKEND', 'Agg')
+        for _ in range(self.size):
+            self._spawn()
+        atexit.register(self.shutdown)
+
+    def _spawn(self):
+        if self._closed:
+            return
+        parent_conn, child_conn = self._ctx.Pipe()
+        process = self._ctx.Process(target=_worker, args=(child_conn,))
+        process.start()
+        child_conn.close()
+        self._idle.put((process, parent_conn))
+
+    def _take_worker(self):
+        while True:
+            try:
+                process, conn = self._idle.get_nowait()
+            except queue.Empty:
+                # Pool is drained, fork one on the spot rather than wait
+                self._spawn()
+                continue
+            if process.is_alive():
+                return process, conn
+            conn.close()
+
+    def execute(self, script_path: str, cwd: str, timeout: float = 30, limits: ResourceLimits = None):
+        self.start()
+        process, conn = self._take_worker()
+        threading.Thread(target=self._spawn, daemon=True).start()
+
+        with tempfile.TemporaryDirectory() as capture_dir:
+            stdout_path = os.path.join(capture_dir, 'stdout')
+            stderr_path = os.path.join(capture_dir, 'stderr')
+            usage_path = os.path.join(capture_dir, 'usage')
+            started = time.perf_counter()
+            conn.send((os.path.abspath(script_path), cwd, stdout_path, stderr_path, usage_path, limits))
+            conn.close()
+
+            process.join(timeout)
+            timed_out = process.is_alive()
+            if timed_out:
+                process.kill()
+                process.join()
+
+            stdout = self._read(stdout_path)
+            stderr = self._read(stderr_path)
+            usage_file = self._read(usage_path)
+            # Empty when the worker was killed before it could report
+            usage = {
+                **(json.loads(usage_file) if usage_file else {}),
+                'wall_seconds': time.perf_counter() - started,
+                'stdout_bytes': len(stdout.encode()),
+                'stderr_bytes': len(stderr.encode()),
+                'timed_out': timed_out,
+            }
+        return stdout, stderr, process.exitcode, timed_out, usage
+
+    @staticmethod
+    def _read(path):
+        if not os.path.exists(path):
+            return ""
+        with open(path, errors='replace') as f:
+            return f.read()
+
+    def shutdown(self):
+        self._closed = True
+        while True:
+            try:
+                process, conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+            conn.close()
+            process.join(1)
+            if process.is_alive():
+                process.kill()
+
+
+_warm_executor = None
+_warm_executor_lock = threading.Lock()
+
+def get_warm_executor(size: int = 2, preload=None) -> WarmExecutor:
+    global _warm_executor
+    with _warm_executor_lock:
+        if _warm_executor is None:
+            _warm_executor = WarmExecutor(size=size, preload=preload)
+        return _warm_executor
@@ -3,8 +3,9 @@ from fastapi.templating import Jinja2Templates
 from starlette.requests import Request
 from starlette.responses import RedirectResponse
 from authlib.integrations.starlette_client import OAuth, OAuthError
-from sqlalchemy.orm import Session
-from .config import CLIENT_ID, CLIENT_SECRET, get_db
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from .config import CLIENT_ID, CLIENT_SECRET, get_async_db, unit_of_work_async
 from .models import User
 
 # Create an APIRouter instance
@@ -34,7 +35,7 @@ async def login(request: Request):
 
 # OAuth callback route
 @router.get('/auth')
-async def auth(request: Request, db: Session = Depends(get_db)):
+async def auth(request: Request, db: AsyncSession = Depends(get_async_db)):
     try:
         token = await oauth.google.authorize_access_token(request)
     except OAuthError as e:
@@ -46,14 +47,13 @@ async def auth(request: Request, db: Session = Depends(get_db)):
     
     if user_info:
         # Check if the user exists in the database by email
-        user = db.query(User).filter(User.email == user_info['email']).first()
+        user = (await db.execute(select(User).where(User.email == user_info['email']))).scalars().first()
 
         # If user doesn't exist, create a new one
         if not user:
-            user = User(name=user_info['name'], email=user_info['email'])
-            db.add(user)
-            db.commit()
-            db.refresh(user)
+            async with unit_of_work_async(db):
+                user = User(name=user_info['name'], email=user_info['email'])
+                db.add(user)
 
         # Store the user info in the session
         request.session['user'] = {'id': str(user.id), 'name': user.name, 'email': user.email}
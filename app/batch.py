@@ -0,0 +1,52 @@
+import zipfile
+
+
+class _Chunks:
+    # Write-only file object that hands back whatever has been written since it was last asked
+    def __init__(self):
+        self._parts = []
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self) -> bytes:
+        data = b''.join(self._parts)
+        self._parts = []
+        return data
+
+
+class ZipStream:
+    """A zip archive written front to back and handed out in pieces as it grows.
+
+    The archive never has to be seekable: sizes and checksums go into data
+    descriptors after each entry, so an entry's bytes can go out to the
+    client while later entries are still being produced. Entries are
+    stored, not deflated, most generated files are already compressed
+    formats and this keeps the CPU out of the way.
+    """
+
+    def __init__(self):
+        self._out = _Chunks()
+        self._zip = zipfile.ZipFile(self._out, 'w', compression=zipfile.ZIP_STORED)
+
+    def add(self, name: str, chunks):
+        # Yields the archive's bytes as the entry's chunks are written
+        with self._zip.open(name, 'w', force_zip64=True) as entry:
+            yield self._out.take()
+            for chunk in chunks:
+                entry.write(chunk)
+                yield self._out.take()
+        yield self._out.take()
+
+    def add_bytes(self, name: str, data: bytes) -> bytes:
+        self._zip.writestr(name, data)
+        return self._out.take()
+
+    def close(self) -> bytes:
+        # The central directory, the last bytes of the archive
+        self._zip.close()
+        return self._out.take()
@@ -1,8 +1,11 @@
 import os
+from contextlib import contextmanager, asynccontextmanager
 from dotenv import load_dotenv
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 
 load_dotenv()
 
@@ -10,15 +13,119 @@ CLIENT_ID = os.environ.get('CLIENT_ID', None)
 CLIENT_SECRET = os.environ.get('CLIENT_SECRET', None)
 OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY', None)
 DATABASE_URL = os.getenv("DATABASE_URL", "postgresql+psycopg2://raghureddy:@localhost/chat_app")
+ASYNC_DATABASE_URL = os.getenv(
+    "ASYNC_DATABASE_URL",
+    make_url(DATABASE_URL).set(drivername="postgresql+asyncpg").render_as_string(hide_password=False)
+)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "10"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+GENERATOR_WORKERS = int(os.getenv("GENERATOR_WORKERS", "4"))
+# Fair scheduling of generation jobs: per-user concurrency and how many may wait
+GENERATOR_MAX_PER_USER = int(os.getenv("GENERATOR_MAX_PER_USER", "2"))
+JOB_QUEUE_MAX = int(os.getenv("JOB_QUEUE_MAX", "100"))
+JOB_QUEUE_MAX_PER_USER = int(os.getenv("JOB_QUEUE_MAX_PER_USER", "10"))
+# Batches: prompts per request, and how many of their items run at once across all batches
+BATCH_MAX_PROMPTS = int(os.getenv("BATCH_MAX_PROMPTS", "50"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+# Requests carrying this token in X-Profile or ?profile= are profiled end to end, empty turns it off
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+CACHE_DIR = os.getenv("CACHE_DIR", "cache")
+PROMPT_CACHE_ENABLED = os.getenv("PROMPT_CACHE_ENABLED", "true").lower() == "true"
+PROMPT_CACHE_TTL = int(os.getenv("PROMPT_CACHE_TTL", str(7 * 24 * 3600)))
+PROMPT_CACHE_MAX_ENTRIES = int(os.getenv("PROMPT_CACHE_MAX_ENTRIES", "10000"))
+# "subprocess" cold-starts python per run, "warm" uses the pre-forked interpreter pool,
+# "stub" runs nothing and writes a placeholder file after EXECUTOR_STUB_SECONDS, for load tests
+EXECUTOR_MODE = os.getenv("EXECUTOR_MODE", "subprocess")
+EXECUTOR_STUB_SECONDS = float(os.getenv("EXECUTOR_STUB_SECONDS", "0.2"))
+EXECUTION_TIMEOUT = int(os.getenv("EXECUTION_TIMEOUT", "30"))
+# Per-script rlimits, 0 turns a cap off
+EXECUTION_CPU_SECONDS = int(os.getenv("EXECUTION_CPU_SECONDS", "30"))
+EXECUTION_MEMORY_MB = int(os.getenv("EXECUTION_MEMORY_MB", "2048"))
+EXECUTION_MAX_OPEN_FILES = int(os.getenv("EXECUTION_MAX_OPEN_FILES", "256"))
+EXECUTION_MAX_OUTPUT_MB = int(os.getenv("EXECUTION_MAX_OUTPUT_MB", "100"))
+WARM_POOL_SIZE = int(os.getenv("WARM_POOL_SIZE", "2"))
+WARM_PRELOAD = [m for m in os.getenv("WARM_PRELOAD", "").split(",") if m] or None
+INSTALL_WORKERS = int(os.getenv("INSTALL_WORKERS", "4"))
+# Stream the completion and start installing and checking the code while it arrives
+PIPELINED_GENERATION = os.getenv("PIPELINED_GENERATION", "false").lower() == "true"
+IDENTITY_CACHE_TTL = int(os.getenv("IDENTITY_CACHE_TTL", "300"))
+IDENTITY_CACHE_MAX_USERS = int(os.getenv("IDENTITY_CACHE_MAX_USERS", "10000"))
+IDENTITY_CACHE_MAX_CHATS = int(os.getenv("IDENTITY_CACHE_MAX_CHATS", "30000"))
+# "local" keeps artifact blobs under ARTIFACT_DIR, "s3" puts them in ARTIFACT_BUCKET
+ARTIFACT_STORE = os.getenv("ARTIFACT_STORE", "local")
+ARTIFACT_DIR = os.getenv("ARTIFACT_DIR", os.path.join("output", "blobs"))
+ARTIFACT_BUCKET = os.getenv("ARTIFACT_BUCKET")
+ARTIFACT_PREFIX = os.getenv("ARTIFACT_PREFIX", "artifacts")
+# Generated files older than this are deleted with their blobs, 0 keeps them forever
+ARTIFACT_RETENTION_DAYS = int(os.getenv("ARTIFACT_RETENTION_DAYS", "0"))
+ARTIFACT_GC_INTERVAL = int(os.getenv("ARTIFACT_GC_INTERVAL", "3600"))
+EXECUTION_CACHE_ENABLED = os.getenv("EXECUTION_CACHE_ENABLED", "true").lower() == "true"
+EXECUTION_CACHE_TTL = int(os.getenv("EXECUTION_CACHE_TTL", str(7 * 24 * 3600)))
+EXECUTION_CACHE_MAX_ENTRIES = int(os.getenv("EXECUTION_CACHE_MAX_ENTRIES", "10000"))
+# Chat history sent along with each prompt, older turns are folded into a rolling summary
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "3000"))
+HISTORY_MAX_MESSAGES = int(os.getenv("HISTORY_MAX_MESSAGES", "50"))
+SUMMARY_MODEL = os.getenv("SUMMARY_MODEL", "gpt-4o-mini")
+SUMMARY_MAX_TOKENS = int(os.getenv("SUMMARY_MAX_TOKENS", "400"))
+# One pooled OpenAI client per process: retries with backoff on 429/5xx, an overall deadline per call,
+# and with OPENAI_HEDGE a duplicate request once an attempt is slower than the recent p95
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "20"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "4"))
+OPENAI_BACKOFF_BASE = float(os.getenv("OPENAI_BACKOFF_BASE", "0.5"))
+OPENAI_BACKOFF_MAX = float(os.getenv("OPENAI_BACKOFF_MAX", "20"))
+OPENAI_DEADLINE_SECONDS = float(os.getenv("OPENAI_DEADLINE_SECONDS", "120"))
+OPENAI_HEDGE = os.getenv("OPENAI_HEDGE", "false").lower() == "true"
+OPENAI_HEDGE_QUANTILE = float(os.getenv("OPENAI_HEDGE_QUANTILE", "0.95"))
+# Set to fan chat events out through Redis pub/sub across workers, unset keeps it in-process
+REDIS_URL = os.getenv("REDIS_URL")
+REALTIME_QUEUE_SIZE = int(os.getenv("REALTIME_QUEUE_SIZE", "100"))
 
 
 engine = create_engine(DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+# Used by the request handlers, the sync engine above is left to job workers and alembic
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    pool_pre_ping=True
+)
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+# One transaction per request or job: model helpers only flush, this commits
+# once at the end or rolls everything back
+@contextmanager
+def unit_of_work(db):
+    try:
+        yield db
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+@asynccontextmanager
+async def unit_of_work_async(db):
+    try:
+        yield db
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        raise
@@ -0,0 +1,139 @@
+import mimetypes
+import os
+import re
+from email.utils import formatdate, parsedate_to_datetime
+
+import anyio
+from starlette.responses import Response
+
+# Artifacts are never rewritten in place: every run gets a new versioned file
+# name and a new user_files row, so a download can be cached for good
+IMMUTABLE_CACHE_CONTROL = "private, max-age=31536000, immutable"
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def make_etag(stat_result) -> str:
+    # Strong: a file's bytes never change once it has a user_files row
+    return f'"{stat_result.st_ino:x}-{stat_result.st_size:x}-{stat_result.st_mtime_ns:x}"'
+
+def parse_range(header: str, size: int):
+    """Returns the inclusive (start, end) of a single `bytes=` range.
+
+    None means the header should be ignored and the whole file sent, which
+    is what we do for multiple ranges and units other than bytes.
+    """
+    match = re.fullmatch(r'\s*bytes\s*=\s*(\d*)\s*-\s*(\d*)\s*', header)
+    if not match or match.group(1) == match.group(2) == '':
+        return None
+    first, last = match.groups()
+    if first == '':
+        # Suffix range, the last N bytes
+        length = int(last)
+        if length == 0 or size == 0:
+            raise RangeNotSatisfiable()
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or (last and int(last) < start):
+        raise RangeNotSatisfiable()
+    return start, end
+
+def _etag_matches(header: str, etag: str) -> bool:
+    # Weak comparison, which is what If-None-Match calls for
+    if header.strip() == '*':
+        return True
+    return etag in (tag.strip().removeprefix('W/') for tag in header.split(','))
+
+def _not_modified_since(header: str, stat_result) -> bool:
+    try:
+        return int(stat_result.st_mtime) <= parsedate_to_datetime(header).timestamp()
+    except (TypeError, ValueError):
+        return False
+
+
+class FileRangeResponse(Response):
+    """Sends all or part of a file, through the ASGI zero-copy extension when the server has it.
+
+    Servers that support `http.response.zerocopysend` hand the file descriptor
+    to sendfile(2); otherwise the file is read in chunks off the event loop.
+    Uvicorn, which this app runs under, doesn't offer the extension, so
+    there every download takes the chunked path. Zero-copy only applies
+    under a server that implements it.
+    """
+
+    chunk_size = 256 * 1024
+
+    def __init__(self, path, start: int, end: int, status_code: int = 200, headers: dict = None, media_type: str = None):
+        super().__init__(status_code=status_code, headers=headers, media_type=media_type)
+        self.path = path
+        self.start = start
+        self.count = end - start + 1
+        self.headers["content-length"] = str(self.count)
+
+    async def __call__(self, scope, receive, send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope.get("method", "GET").upper() == "HEAD" or self.count <= 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        zero_copy = "http.response.zerocopysend" in scope.get("extensions", {})
+        async with await anyio.open_file(self.path, mode="rb") as file:
+            if zero_copy:
+                await send({
+                    "type": "http.response.zerocopysend",
+                    "file": file.wrapped,
+                    "offset": self.start,
+                    "count": self.count,
+                    "more_body": False,
+                })
+                return
+            await file.seek(self.start)
+            remaining = self.count
+            while remaining:
+                chunk = await file.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+            if remaining:
+                # The file got shorter under us, end the body rather than hang
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+def file_response(request, path, stat_result=None, etag: str = None, media_type: str = None) -> Response:
+    """Answers a GET for a stored file with 304, 206, 416 or 200 as its headers call for."""
+    stat_result = stat_result or os.stat(path)
+    etag = etag or make_etag(stat_result)
+    headers = {
+        "etag": etag,
+        "last-modified": formatdate(stat_result.st_mtime, usegmt=True),
+        "cache-control": IMMUTABLE_CACHE_CONTROL,
+        "accept-ranges": "bytes",
+    }
+
+    if_none_match = request.headers.get("if-none-match")
+    if_modified_since = request.headers.get("if-modified-since")
+    if (if_none_match and _etag_matches(if_none_match, etag)) or (
+        not if_none_match and if_modified_since and _not_modified_since(if_modified_since, stat_result)
+    ):
+        return Response(status_code=304, headers=headers)
+
+    media_type = media_type or mimetypes.guess_type(str(path))[0] or "application/octet-stream"
+    size = stat_result.st_size
+    http_range = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    # A resumed download only gets a partial response if the file is still the one it started with
+    if http_range and (if_range is None or if_range.strip() in (etag, headers["last-modified"])):
+        try:
+            byte_range = parse_range(http_range, size)
+        except RangeNotSatisfiable:
+            return Response(status_code=416, headers={**headers, "content-range": f"bytes */{size}"})
+        if byte_range:
+            start, end = byte_range
+            headers["content-range"] = f"bytes {start}-{end}/{size}"
+            return FileRangeResponse(path, start, end, status_code=206, headers=headers, media_type=media_type)
+
+    return FileRangeResponse(path, 0, size - 1, headers=headers, media_type=media_type)
@@ -0,0 +1,138 @@
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import make_transient_to_detached
+
+from .config import IDENTITY_CACHE_TTL, IDENTITY_CACHE_MAX_USERS, IDENTITY_CACHE_MAX_CHATS
+from .models import User, Chat
+from .models.chat import ChatContextType
+
+
+class TTLCache:
+    """Thread-safe LRU map whose entries also expire after `ttl_seconds`."""
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[1] < time.monotonic():
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+            }
+
+
+def snapshot(instance) -> dict:
+    return {attr.key: getattr(instance, attr.key) for attr in inspect(instance).mapper.column_attrs}
+
+def restore(cls, values: dict):
+    # A detached instance that a session can adopt with merge(load=False), no SELECT needed
+    instance = cls(**values)
+    make_transient_to_detached(instance)
+    return instance
+
+
+class IdentityCache:
+    """Caches user rows by id and chat rows by (user_id, context).
+
+    Values are column snapshots, never live ORM objects, so they can be
+    shared across sessions and threads. Updates and deletes of User or Chat
+    rows evict the matching entries through mapper events.
+    """
+
+    def __init__(self, max_users: int, max_chats: int, ttl_seconds: float):
+        self.users = TTLCache(max_users, ttl_seconds)
+        self.chats = TTLCache(max_chats, ttl_seconds)
+
+    async def get_user_async(self, db, user_id):
+        values = self.users.get(str(user_id))
+        if values is not None:
+            return await db.merge(restore(User, values), load=False)
+        user = await User.get_by_id_async(db, user_id)
+        if user:
+            self.users.set(str(user.id), snapshot(user))
+        return user
+
+    async def get_chat_async(self, db, user, context: ChatContextType, create: bool = False):
+        key = (str(user.id), context)
+        values = self.chats.get(key)
+        if values is not None:
+            return await db.merge(restore(Chat, values), load=False)
+        if create:
+            chat = await Chat.get_or_create_async(db, user.id, context)
+        else:
+            chat = await Chat.get_async(db, user.id, context)
+        if chat:
+            self.chats.set(key, snapshot(chat))
+        return chat
+
+    def invalidate_user(self, user_id):
+        self.users.pop(str(user_id))
+        for context in ChatContextType:
+            self.chats.pop((str(user_id), context))
+
+    def invalidate_chat(self, user_id, context: ChatContextType):
+        self.chats.pop((str(user_id), context))
+
+    def clear(self):
+        self.users.clear()
+        self.chats.clear()
+
+    def stats(self):
+        return {"users": self.users.stats(), "chats": self.chats.stats()}
+
+
+identity_cache = IdentityCache(
+    max_users=IDENTITY_CACHE_MAX_USERS,
+    max_chats=IDENTITY_CACHE_MAX_CHATS,
+    ttl_seconds=IDENTITY_CACHE_TTL
+)
+
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _evict_user(mapper, connection, target):
+    identity_cache.invalidate_user(target.id)
+
+@event.listens_for(Chat, "after_update")
+@event.listens_for(Chat, "after_delete")
+def _evict_chat(mapper, connection, target):
+    identity_cache.invalidate_chat(target.user_id, target.context)
@@ -0,0 +1,316 @@
+import asyncio
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from datetime import datetime
+from enum import Enum as PyEnum
+
+# Streamed tokens go out in pieces of this many characters, or at least this often
+TOKEN_FLUSH_CHARS = 256
+TOKEN_FLUSH_SECONDS = 0.05
+
+
+class JobStatus(PyEnum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+
+class Job:
+    def __init__(self, user_id: str, chat_id, prompt: str, on_event=None, message_id=None):
+        self.id = str(uuid.uuid4())
+        self.user_id = str(user_id)
+        self.chat_id = chat_id
+        self.prompt = prompt
+        # The message being answered, when there is one
+        self.message_id = message_id
+        self.status = JobStatus.QUEUED
+        self.result = None
+        self.error = None
+        self.created_date = datetime.utcnow()
+        self.started_date = None
+        self.finished_date = None
+        self.events = []
+        self._subscribers = []
+        self._on_event = on_event
+        self._events_lock = threading.Lock()
+        self._tokens = []
+        self._token_chars = 0
+        self._tokens_flushed = time.monotonic()
+
+    @property
+    def finished(self):
+        return self.status in (JobStatus.DONE, JobStatus.FAILED)
+
+    def add_event(self, stage: str, data: dict = None):
+        # Called from worker threads, subscribers are woken on their own event loops
+        if stage == "tokens":
+            self._add_tokens(data["text"])
+            return
+        self._flush_tokens()
+        event = {"stage": stage, **(data or {})}
+        with self._events_lock:
+            self.events.append(event)
+            subscribers = list(self._subscribers)
+        self._dispatch(event, subscribers)
+
+    def _add_tokens(self, text: str):
+        # Coalesced, and never kept for replay: only stage events are
+        with self._events_lock:
+            self._tokens.append(text)
+            self._token_chars += len(text)
+            if self._token_chars < TOKEN_FLUSH_CHARS and time.monotonic() - self._tokens_flushed < TOKEN_FLUSH_SECONDS:
+                return
+        self._flush_tokens()
+
+    def _flush_tokens(self):
+        with self._events_lock:
+            self._tokens_flushed = time.monotonic()
+            if not self._tokens:
+                return
+            event = {"stage": "tokens", "text": ''.join(self._tokens)}
+            self._tokens, self._token_chars = [], 0
+            subscribers = list(self._subscribers)
+        self._dispatch(event, subscribers)
+
+    def _dispatch(self, event, subscribers):
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, event)
+            except RuntimeError:
+                # The subscriber's loop has already shut down
+                pass
+        if self._on_event:
+            self._on_event(self, event)
+
+    def subscribe(self) -> asyncio.Queue:
+        # Replays the events so far, then follows along live
+        queue = asyncio.Queue()
+        with self._events_lock:
+            for event in self.events:
+                queue.put_nowait(event)
+            self._subscribers.append((asyncio.get_running_loop(), queue))
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        with self._events_lock:
+            self._subscribers = [(loop, q) for loop, q in self._subscribers if q is not queue]
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "status": self.status.value,
+            "result": self.result,
+            "error": self.error,
+            "created_date": self.created_date.isoformat(),
+            "started_date": self.started_date.isoformat() if self.started_date else None,
+            "finished_date": self.finished_date.isoformat() if self.finished_date else None,
+        }
+
+
+class QueueFull(Exception):
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class JobQueue:
+    """Runs code generation jobs on a bounded pool of worker threads, fairly across users.
+
+    Each user has their own FIFO and free workers take the next job from
+    users in round-robin order, skipping anyone already at
+    `max_per_user` running jobs, so one busy user can't starve the rest.
+    At most `max_queued` jobs wait in total and `max_queued_per_user` per
+    user; past that `submit` raises QueueFull instead of queueing. A
+    caller with work to do before submitting can `reserve` a place first
+    and hand it to `submit(reserved=True)`, or give it back with `release`.
+
+    Jobs are tracked in memory, so a status lookup has to hit the same
+    process that accepted the job. Finished jobs are kept around until
+    `max_finished` newer ones have completed. `on_event(job, event)` is
+    called for every event of every job, on the thread that raised it.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = 4,
+        max_finished: int = 1000,
+        on_event=None,
+        max_per_user: int = 2,
+        max_queued: int = 100,
+        max_queued_per_user: int = 10
+    ):
+        self.max_workers = max_workers
+        self.max_per_user = max_per_user
+        self.max_queued = max_queued
+        self.max_queued_per_user = max_queued_per_user
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._max_finished = max_finished
+        self._on_event = on_event
+        self._ready = threading.Condition()
+        # user id -> deque of waiting jobs, in round-robin order
+        self._queues = OrderedDict()
+        self._running = {}
+        # user id -> places held by reserve() and not submitted yet
+        self._reserved = {}
+        self._workers = []
+        self._closed = False
+        self._waits = deque(maxlen=1000)
+        self._rejected = 0
+        self._started = 0
+
+    def check_admission(self, user_id: str):
+        # Lets callers turn a request away before doing any work for it
+        with self._ready:
+            self._admit(str(user_id))
+
+    def reserve(self, user_id: str):
+        # Holds a place in the queue, the job that takes it can't be turned away
+        with self._ready:
+            self._admit(str(user_id))
+            self._reserved[str(user_id)] = self._reserved.get(str(user_id), 0) + 1
+
+    def release(self, user_id: str):
+        with self._ready:
+            self._unreserve(str(user_id))
+
+    def _unreserve(self, user_id: str):
+        self._reserved[user_id] -= 1
+        if not self._reserved[user_id]:
+            del self._reserved[user_id]
+
+    def _admit(self, user_id: str):
+        queued = sum(len(q) for q in self._queues.values()) + sum(self._reserved.values())
+        if queued >= self.max_queued:
+            self._rejected += 1
+            raise QueueFull("Too many requests are waiting, try again shortly", self._retry_after())
+        if len(self._queues.get(user_id, ())) + self._reserved.get(user_id, 0) >= self.max_queued_per_user:
+            self._rejected += 1
+            raise QueueFull("You have too many requests waiting, try again once some finish", self._retry_after())
+
+    def _retry_after(self) -> int:
+        waits = sorted(self._waits)
+        return max(1, round(waits[len(waits) // 2])) if waits else 5
+
+    def submit(self, work, user_id: str, chat_id, prompt: str, message_id=None, reserved: bool = False) -> Job:
+        job = Job(user_id, chat_id, prompt, on_event=self._on_event, message_id=message_id)
+        with self._ready:
+            if reserved:
+                self._unreserve(job.user_id)
+            else:
+                self._admit(job.user_id)
+            with self._lock:
+                self._jobs[job.id] = job
+            self._queues.setdefault(job.user_id, deque()).append((job, work))
+            self._start_workers()
+            self._ready.notify()
+        return job
+
+    def get(self, job_id: str):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def position(self, job: Job):
+        # 1-based place in the round-robin order, None once the job has started
+        with self._ready:
+            queues = [list(queue) for queue in self._queues.values()]
+        place = 0
+        for turn in range(max(map(len, queues), default=0)):
+            for queue in queues:
+                if turn < len(queue):
+                    place += 1
+                    if queue[turn][0] is job:
+                        return place
+        return None
+
+    def _start_workers(self):
+        while len(self._workers) < self.max_workers:
+            worker = threading.Thread(target=self._work, name=f"generator_{len(self._workers)}", daemon=True)
+            self._workers.append(worker)
+            worker.start()
+
+    def _next(self):
+        # Called with _ready held, the first user in round-robin order who may run another job
+        for user_id, queue in self._queues.items():
+            if self._running.get(user_id, 0) < self.max_per_user:
+                job, work = queue.popleft()
+                if queue:
+                    self._queues.move_to_end(user_id)
+                else:
+                    del self._queues[user_id]
+                self._running[user_id] = self._running.get(user_id, 0) + 1
+                return job, work
+        return None
+
+    def _work(self):
+        while True:
+            with self._ready:
+                task = self._next()
+                while task is None and not self._closed:
+                    self._ready.wait()
+                    task = self._next()
+                if task is None:
+                    return
+            job, work = task
+            try:
+                self._run(job, work)
+            finally:
+                with self._ready:
+                    self._running[job.user_id] -= 1
+                    if not self._running[job.user_id]:
+                        del self._running[job.user_id]
+                    # A slot for this user opened up, its queued jobs may now be eligible
+                    self._ready.notify_all()
+
+    def _run(self, job: Job, work):
+        job.status = JobStatus.RUNNING
+        job.started_date = datetime.utcnow()
+        with self._ready:
+            self._waits.append((job.started_date - job.created_date).total_seconds())
+            self._started += 1
+        try:
+            job.result = work(job)
+            job.status = JobStatus.DONE
+        except Exception as e:
+            print(f"Job {job.id} failed: {e}")
+            job.error = str(e)
+            job.status = JobStatus.FAILED
+        finally:
+            job.finished_date = datetime.utcnow()
+            job.add_event(job.status.value, {"result": job.result, "error": job.error})
+            self._prune()
+
+    def _prune(self):
+        with self._lock:
+            finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+            for job_id in finished[:max(0, len(finished) - self._max_finished)]:
+                del self._jobs[job_id]
+
+    def stats(self):
+        with self._ready:
+            waits = sorted(self._waits)
+            return {
+                "queued": sum(len(q) for q in self._queues.values()),
+                "queued_users": len(self._queues),
+                "reserved": sum(self._reserved.values()),
+                "running": sum(self._running.values()),
+                "running_users": len(self._running),
+                "workers": self.max_workers,
+                "started": self._started,
+                "rejected": self._rejected,
+                "wait_seconds_p50": waits[len(waits) // 2] if waits else 0.0,
+                "wait_seconds_p95": waits[min(len(waits) - 1, int(len(waits) * 0.95))] if waits else 0.0,
+                "wait_seconds_max": waits[-1] if waits else 0.0,
+            }
+
+    def shutdown(self, wait: bool = True):
+        # Workers finish what's queued, then exit
+        with self._ready:
+            self._closed = True
+            self._ready.notify_all()
+        if wait:
+            for worker in self._workers:
+                worker.join()
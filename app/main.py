@@ -1,25 +1,111 @@
-from fastapi import FastAPI, Depends, HTTPException
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, Depends, HTTPException, Query, WebSocket
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi.templating import Jinja2Templates
 from fastapi.middleware.cors import CORSMiddleware
 from starlette.requests import Request
 from starlette.responses import RedirectResponse
 from starlette.middleware.sessions import SessionMiddleware
 from fastapi.staticfiles import StaticFiles
-from app.agents.code_generator import CodeGenerator
+from starlette.concurrency import iterate_in_threadpool
+from app.agents.code_generator import CodeGenerator, artifact_store, prompt_cache, execution_cache
+from app.agents.conversation import ConversationHistory
 from app.models.chat import ChatContextType
 from app.models.message import MessageType
-from app.models.user_file import UserFile
+from app.models.user_file import UserFile, UserFileVersion
+from app.models.execution_usage import ExecutionUsage
 from .auth_router import router as auth_router
 from .models import User, Message, Chat
-from .config import get_db
-from sqlalchemy.orm import Session
+from .config import (
+    get_async_db, unit_of_work, unit_of_work_async, SessionLocal, AsyncSessionLocal, GENERATOR_WORKERS,
+    HISTORY_TOKEN_BUDGET, HISTORY_MAX_MESSAGES, GENERATOR_MAX_PER_USER, JOB_QUEUE_MAX, JOB_QUEUE_MAX_PER_USER,
+    EXECUTOR_MODE, PROFILE_TOKEN, PROFILE_DIR, BATCH_MAX_PROMPTS, BATCH_CONCURRENCY,
+    ARTIFACT_RETENTION_DAYS, ARTIFACT_GC_INTERVAL
+)
+from .jobs import JobQueue, QueueFull
+from .realtime import broker, connections, chat_channel
+from .downloads import file_response, IMMUTABLE_CACHE_CONTROL
+from .pagination import encode_cursor, decode_cursor
+from .identity_cache import identity_cache
+from .metrics import registry, MetricsMiddleware
+from .batch import ZipStream
+from .retention import RetentionSweeper
+from . import profiling
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import SQLAlchemyError
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+import asyncio
+import json
 import os
+import uuid
+import time
+from datetime import datetime
 
 app = FastAPI()
 
+
+def publish_job_event(job, event):
+    # Job progress goes out to every socket open on the job's chat
+    try:
+        broker.publish(chat_channel(job.chat_id), {"type": "job", "job_id": job.id, **event})
+    except Exception as e:
+        print(f"Failed to publish event for job {job.id}: {e}")
+
+job_queue = JobQueue(
+    max_workers=GENERATOR_WORKERS,
+    on_event=publish_job_event,
+    max_per_user=GENERATOR_MAX_PER_USER,
+    max_queued=JOB_QUEUE_MAX,
+    max_queued_per_user=JOB_QUEUE_MAX_PER_USER
+)
+
+@contextmanager
+def queue_slot(user_id):
+    # Turned away before anything is written, so a saved message's job always has a place in the queue.
+    # The job submitted inside takes it with reserved=True, a request that fails first gives it back.
+    try:
+        job_queue.reserve(user_id)
+    except QueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    try:
+        yield
+    except BaseException:
+        job_queue.release(user_id)
+        raise
+
+def submit_reply_job(user_id, chat_id, prompt, profile=None, message_id=None):
+    # Only inside queue_slot, the reserved place can't be refused
+    work = generate_reply
+    if profile:
+        # Keeps the profile open from here until the job has run
+        profile.hold()
+        work = lambda job: generate_reply(job, profile)
+    job = job_queue.submit(work, user_id, chat_id, prompt, message_id, reserved=True)
+    return {**job.to_dict(), "position": job_queue.position(job), **({"profile": profile.id} if profile else {})}
+
+async def request_profile(request: Request):
+    # Admin only, see PROFILE_TOKEN. Without the token nothing is set up at all.
+    if not profiling.requested(request, PROFILE_TOKEN):
+        yield None
+        return
+    profile = profiling.Profile(f"{request.method} {request.url.path}", PROFILE_DIR)
+    # The loop thread serves every request, it's only sampled inside this one's spans
+    with profiling.activate(profile, spans_only=True):
+        yield profile
+
+# Shared by every job, it and the OpenAI client under it keep no per-request state
+code_generator = CodeGenerator()
+
+conversation_history = ConversationHistory(
+    token_budget=HISTORY_TOKEN_BUDGET,
+    max_messages=HISTORY_MAX_MESSAGES,
+    summarize=code_generator.openai_helper.summarize
+)
+
+# The items of every batch share these threads, so one large batch can't crowd out everything else
+batch_pool = ThreadPoolExecutor(max_workers=BATCH_CONCURRENCY, thread_name_prefix="batch")
+
 app.add_middleware(SessionMiddleware, 
                    secret_key="add any string...",
                    https_only=False)
@@ -31,8 +117,33 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
 
+# Outermost, so its timings include the other middleware
+app.add_middleware(MetricsMiddleware)
+
+registry.add_collector('job_queue', job_queue.stats)
+registry.add_collector('realtime', connections.stats)
+registry.add_collector('realtime_broker', broker.stats)
+registry.add_collector('identity_cache', identity_cache.stats)
+if prompt_cache:
+    registry.add_collector('prompt_cache', prompt_cache.stats)
+if execution_cache:
+    registry.add_collector('execution_cache', execution_cache.stats)
+
+if ARTIFACT_RETENTION_DAYS:
+    retention_sweeper = RetentionSweeper(
+        SessionLocal,
+        artifact_store,
+        ARTIFACT_RETENTION_DAYS,
+        ARTIFACT_GC_INTERVAL,
+        Path(os.getcwd()) / 'output' / 'users',
+        cache=execution_cache
+    )
+    retention_sweeper.start()
+    registry.add_collector('retention', retention_sweeper.stats)
+
 
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
@@ -67,9 +178,27 @@ def get_session(request: Request):
         return {"user": user}
     return {"user": None}
 
+def serialize_message(message):
+    return {
+        "id": str(message.id),
+        "line_type": message.line_type.value,
+        "content": message.content,
+        "created_date": message.created_date.isoformat() if message.created_date else None,
+        "revision": message.revision,
+        "deleted": message.deleted_date is not None
+    }
+
 @app.get("/api/users/{userId}/chats/{chatContext}/messages")
-def get_user_messages(userId: str, chatContext: str, db: Session = Depends(get_db)):
-    user = User.get_by_id(db, userId)
+async def get_user_messages(
+    userId: str,
+    chatContext: str,
+    request: Request,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: str = None,
+    since: int = Query(None, ge=0),
+    db: AsyncSession = Depends(get_async_db)
+):
+    user = await identity_cache.get_user_async(db, userId)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
@@ -78,34 +207,48 @@ def get_user_messages(userId: str, chatContext: str, db: Session = Depends(get_d
     except KeyError:
         raise HTTPException(status_code=400, detail="Invalid chat context")
 
-    chat = user.get_or_create_chat(db, chat_context_enum)
-    messages = chat.get_messages(db)
-
-    if not messages:
-        first_message = chat.add_message(db, f"Hi {user.name}, how can I assist you today?", MessageType.SYSTEM)
-        messages = [first_message]
-
-    serialized_messages = [
-        {
-            "id": str(message.id),
-            "line_type": message.line_type.value,
-            "content": message.content,
-            "created_date": message.created_date.isoformat() if message.created_date else None
-        } for message in messages
-    ]
-
-    return {
+    try:
+        before = decode_cursor(cursor) if cursor else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    next_before = None
+    async with unit_of_work_async(db):
+        chat = await identity_cache.get_chat_async(db, user, chat_context_enum, create=True)
+        version = await chat.get_version_async(db)
+        # The version covers every message write, so a matching ETag means nothing changed
+        etag = f'W/"{chat.id}:{version}:{cursor or ""}:{since if since is not None else ""}"'
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers={"ETag": etag})
+
+        if since is not None:
+            # Only what changed after `since`, edits and tombstones included
+            messages = await chat.get_changes_async(db, since, limit)
+        else:
+            messages, next_before = await chat.get_messages_page_async(db, limit, before)
+            if not messages and not before:
+                first_message = await chat.add_message_async(db, f"Hi {user.name}, how can I assist you today?", MessageType.SYSTEM)
+                messages = [first_message]
+                version = first_message.revision
+
+    if since is not None and len(messages) == limit:
+        # More changes are waiting, the client carries on from the last one it got
+        version = messages[-1].revision
+
+    return JSONResponse({
         "user": user.name,
         "chat_context": chat_context_enum.value,
-        "messages": serialized_messages,
+        "messages": [serialize_message(message) for message in messages],
+        "next_cursor": encode_cursor(*next_before) if next_before else None,
+        "version": version,
         "details": "all messages by user chat context"
-    }
+    }, headers={"ETag": etag})
 
 @app.post("/api/users/{userId}/chats/{chatContext}/messages")
-async def send_message(userId: str, chatContext: str, request: Request, db: Session = Depends(get_db)):
+async def send_message(userId: str, chatContext: str, request: Request, db: AsyncSession = Depends(get_async_db), profile=Depends(request_profile)):
     data = await request.json()
     
-    user = User.get_by_id(db, userId)
+    user = await identity_cache.get_user_async(db, userId)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     chat_context_enum = ChatContextType[chatContext.upper()]
@@ -118,38 +261,44 @@ async def send_message(userId: str, chatContext: str, request: Request, db: Sess
     user_message_content = data.get('content')
     if not user_message_content:
         raise HTTPException(status_code=400, detail="Message content cannot be empty")
-    
-    # Find or create the chat with the given context
-    chat = user.get_or_create_chat(db, chat_context_enum)
-    # Save the user's message
-    user_message = chat.add_message(db, user_message_content, line_type_enum)
-
-    generated_content = run_generator(db, user_message_content, userId)
-    
-    # Save the system message
-    system_message = chat.add_message(db, generated_content, MessageType.SYSTEM)
+    with queue_slot(userId):
+        with profiling.span('save_message'):
+            async with unit_of_work_async(db):
+                # Find or create the chat with the given context
+                chat = await identity_cache.get_chat_async(db, user, chat_context_enum, create=True)
+                # Save the user's message
+                user_message = await chat.add_message_async(db, user_message_content, line_type_enum)
+        await publish_message_async(chat.id, user_message)
+
+        # Generation runs in the background, progress and the reply are pushed over the chat socket
+        job = submit_reply_job(userId, chat.id, user_message_content, profile, user_message.id)
 
     return {
         "user": user.name,
         "chat_context": chat_context_enum.value,
-        "details": generated_content
+        "job": job,
+        "details": "Working on it, I'll reply here when I'm done"
     }
 
 @app.delete("/api/users/{userId}/chats/{chatContext}/messages/{messageId}")
-async def delete_message(userId: str, chatContext: str, messageId: str, request: Request, db: Session = Depends(get_db)):
+async def delete_message(userId: str, chatContext: str, messageId: str, request: Request, db: AsyncSession = Depends(get_async_db)):
     chat_context_enum = ChatContextType[chatContext.upper()]
     # Check if user exists
-    user = db.query(User).filter(User.id == userId).first()
+    user = await identity_cache.get_user_async(db, userId)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    chat = db.query(Chat).filter(Chat.user_id == user.id, Chat.context == chat_context_enum).first()
+    chat = await identity_cache.get_chat_async(db, user, chat_context_enum)
     if not chat:
         raise HTTPException(status_code=422, detail="Something went wrong")
     
-    user_message = db.query(Message).filter(Message.id == messageId).first()
-    db.delete(user_message)
-    db.commit()
+    async with unit_of_work_async(db):
+        user_message = await chat.get_message_async(db, messageId)
+        if not user_message:
+            raise HTTPException(status_code=404, detail="Message not found")
+        # Soft delete, the tombstone is how other clients learn about it through `since`
+        await chat.delete_message_async(db, user_message)
+    await publish_message_async(chat.id, user_message)
 
     return {
         "user": user.name,
@@ -158,23 +307,20 @@ async def delete_message(userId: str, chatContext: str, messageId: str, request:
     }
 
 @app.put("/api/users/{userId}/chats/{chatContext}/messages/{messageId}")
-async def update_message(userId: str, chatContext: str, messageId: str, request: Request, db: Session = Depends(get_db)):
+async def update_message(userId: str, chatContext: str, messageId: str, request: Request, db: AsyncSession = Depends(get_async_db), profile=Depends(request_profile)):
     data = await request.json()
     chat_context_enum = ChatContextType[chatContext.upper()]
     # Check if user exists
-    user = db.query(User).filter(User.id == userId).first()
+    user = await identity_cache.get_user_async(db, userId)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    chat = db.query(Chat).filter(Chat.user_id == user.id, Chat.context == chat_context_enum).first()
+    chat = await identity_cache.get_chat_async(db, user, chat_context_enum)
     if not chat:
         raise HTTPException(status_code=422, detail="Something went wrong")
     
     # Check if message exists and belongs to the user and chat
-    message = db.query(Message).filter(
-        Message.id == messageId,
-        Message.chat_id == chat.id
-    ).first()
+    message = await chat.get_message_async(db, messageId)
     
     if not message:
         raise HTTPException(status_code=404, detail="Message not found")
@@ -183,15 +329,13 @@ async def update_message(userId: str, chatContext: str, messageId: str, request:
     new_content = data.get('content')
     if new_content is None:
         raise HTTPException(status_code=400, detail="New message content is required")
-    
-    message.content = new_content
-    db.commit()
-    db.refresh(message)
+    with queue_slot(userId):
+        with profiling.span('save_message'):
+            async with unit_of_work_async(db):
+                await chat.update_message_async(db, message, new_content)
+        await publish_message_async(chat.id, message)
 
-    generated_content = run_generator(db, new_content, userId)
-    
-    # Save the system message
-    system_message = chat.add_message(db, generated_content, MessageType.SYSTEM)
+        job = submit_reply_job(userId, chat.id, new_content, profile, message.id)
 
     return {
         "user": user.name,
@@ -199,47 +343,386 @@ async def update_message(userId: str, chatContext: str, messageId: str, request:
         "message": {
             "id": message.id,
             "content": message.content,
+            "revision": message.revision,
         },
-        "details": generated_content
+        "job": job,
+        "details": "Working on it, I'll reply here when I'm done"
     }
 
+@app.post("/api/users/{userId}/chats/{chatContext}/batches")
+async def send_batch(userId: str, chatContext: str, request: Request, format: str = Query("ndjson"), db: AsyncSession = Depends(get_async_db)):
+    data = await request.json()
+
+    user = await identity_cache.get_user_async(db, userId)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    chat_context_enum = ChatContextType[chatContext.upper()]
+
+    prompts = data.get('prompts')
+    if not isinstance(prompts, list) or not prompts or not all(isinstance(p, str) and p.strip() for p in prompts):
+        raise HTTPException(status_code=400, detail="Batch prompts must be a list of non-empty strings")
+    if len(prompts) > BATCH_MAX_PROMPTS:
+        raise HTTPException(status_code=400, detail=f"A batch takes at most {BATCH_MAX_PROMPTS} prompts")
+    if format not in ("ndjson", "zip"):
+        raise HTTPException(status_code=400, detail="Batch format must be ndjson or zip")
+    with queue_slot(userId):
+        async with unit_of_work_async(db):
+            chat = await identity_cache.get_chat_async(db, user, chat_context_enum, create=True)
+            user_message = await chat.add_message_async(
+                db, '\n'.join(f"{i + 1}. {prompt}" for i, prompt in enumerate(prompts)), MessageType.USER
+            )
+        await publish_message_async(chat.id, user_message)
+
+        # One job for the whole batch, it counts once against the user's share of the queue
+        job = job_queue.submit(
+            lambda job: generate_batch(job, prompts), userId, chat.id, f"Batch of {len(prompts)} prompts", reserved=True
+        )
+
+    # Items are streamed in the order they finish, the client can also follow the job's events
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "X-Job-Id": job.id}
+    if format == "zip":
+        headers["Content-Disposition"] = f'attachment; filename="batch-{job.id}.zip"'
+        return StreamingResponse(batch_zip(job), media_type="application/zip", headers=headers)
+    return StreamingResponse(batch_ndjson(job), media_type="application/x-ndjson", headers=headers)
+
+async def batch_events(job):
+    queue = job.subscribe()
+    try:
+        while True:
+            event = await queue.get()
+            yield event
+            if event["stage"] in ("done", "failed"):
+                break
+    finally:
+        job.unsubscribe(queue)
+
+async def batch_ndjson(job):
+    # A line per item as it finishes, then the whole manifest
+    async for event in batch_events(job):
+        if event["stage"] == "item":
+            yield json.dumps(event["item"]) + "\n"
+        elif event["stage"] == "done":
+            yield json.dumps({"job_id": job.id, "manifest": event["result"]}) + "\n"
+        elif event["stage"] == "failed":
+            yield json.dumps({"job_id": job.id, "error": event["error"]}) + "\n"
+
+async def batch_zip(job):
+    # Each item's files go into the archive as it finishes, manifest.json comes last
+    archive = ZipStream()
+    async for event in batch_events(job):
+        if event["stage"] == "item":
+            for file in event["item"]["files"]:
+                chunks = artifact_store.iter_bytes(file["digest"])
+                async for piece in iterate_in_threadpool(archive.add(file["file_name"], chunks)):
+                    if piece:
+                        yield piece
+        elif event["stage"] in ("done", "failed"):
+            manifest = {"job_id": job.id, "manifest": event["result"], "error": event["error"]}
+            yield archive.add_bytes("manifest.json", json.dumps(manifest, indent=2).encode())
+    yield archive.close()
+
+async def publish_message_async(chat_id, message):
+    # From the event loop, a Redis round trip here must not block it
+    try:
+        await broker.publish_async(chat_channel(chat_id), {"type": "message", "message": serialize_message(message)})
+    except Exception as e:
+        print(f"Failed to publish a message to chat {chat_id}: {e}")
+
+def publish_message(chat_id, message):
+    try:
+        broker.publish(chat_channel(chat_id), {"type": "message", "message": serialize_message(message)})
+    except Exception as e:
+        print(f"Failed to publish message {message.id}: {e}")
+
+@app.websocket("/api/users/{userId}/chats/{chatContext}/ws")
+async def chat_socket(websocket: WebSocket, userId: str, chatContext: str):
+    try:
+        chat_context_enum = ChatContextType[chatContext.upper()]
+    except KeyError:
+        await websocket.close(code=1008)
+        return
+
+    # A short-lived session, an idle socket shouldn't pin a pooled connection
+    async with AsyncSessionLocal() as db:
+        user = await identity_cache.get_user_async(db, userId)
+        chat = None
+        if user:
+            async with unit_of_work_async(db):
+                chat = await identity_cache.get_chat_async(db, user, chat_context_enum, create=True)
+    if not chat:
+        await websocket.close(code=1008)
+        return
+
+    await websocket.accept()
+    channel = chat_channel(chat.id)
+    queue = broker.subscribe(channel)
+    connections.opened(channel)
+
+    async def push():
+        while True:
+            await websocket.send_json(await queue.get())
+
+    async def drain():
+        # Nothing is expected from the client, this only notices the disconnect
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+
+    tasks = [asyncio.create_task(push()), asyncio.create_task(drain())]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+        broker.unsubscribe(channel, queue)
+        connections.closed(channel)
+
+@app.get("/api/realtime/stats")
+def realtime_stats():
+    return {"connections": connections.stats(), "broker": broker.stats()}
+
+@app.get("/api/users/{userId}/jobs/{jobId}")
+def get_job(userId: str, jobId: str):
+    job = job_queue.get(jobId)
+    if not job or job.user_id != userId:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {"job": {**job.to_dict(), "position": job_queue.position(job)}}
+
+@app.get("/api/jobs/stats")
+def job_stats():
+    return job_queue.stats()
+
+@app.get("/metrics")
+def metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/users/{userId}/chats/{chatContext}/jobs/{jobId}/events")
+async def stream_job_events(userId: str, chatContext: str, jobId: str):
+    job = job_queue.get(jobId)
+    if not job or job.user_id != userId:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def event_stream():
+        queue = job.subscribe()
+        try:
+            while True:
+                event = await queue.get()
+                yield f"event: {event['stage']}\ndata: {json.dumps(event)}\n\n"
+                if event["stage"] in ("done", "failed"):
+                    break
+        finally:
+            job.unsubscribe(queue)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 # Serve static files from the output directory
 app.mount("/output", StaticFiles(directory="output"), name="output")
 
 
 # Endpoint to download a generated file
 @app.get("/api/users/{userId}/user-files/{userFileId}")
-async def get_user_file(userId: str, userFileId: str, request: Request, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.id == userId).first()
+async def get_user_file(userId: str, userFileId: str, request: Request, db: AsyncSession = Depends(get_async_db)):
+    try:
+        uuid.UUID(userFileId)
+    except ValueError:
+        # Can't be a file id, no need to ask the database
+        raise HTTPException(status_code=404, detail="File not found")
+
+    user = await identity_cache.get_user_async(db, userId)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    user_file = user.get_file(db, userFileId)  # Assuming user.get_file is defined
+    user_file = await user.get_file_async(db, userFileId)
+    if not user_file:
+        raise HTTPException(status_code=404, detail="File not found")
 
-    # Construct the file path
+    if user_file.digest:
+        etag = f'"{user_file.digest}"'
+        if artifact_store.has_local_paths:
+            blob_path = artifact_store.local_path(user_file.digest)
+            try:
+                stat_result = os.stat(blob_path) if blob_path else None
+            except FileNotFoundError:
+                stat_result = None
+            if not stat_result:
+                raise HTTPException(status_code=404, detail="File not found")
+            return file_response(request, blob_path, stat_result, etag=etag, media_type=user_file.mime_type)
+        # Remote store, stream it through since the bytes never change. Checked first, a
+        # missing blob can't be reported once the headers have gone out.
+        if not await asyncio.to_thread(artifact_store.exists, user_file.digest):
+            raise HTTPException(status_code=404, detail="File not found")
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers={"ETag": etag})
+        return StreamingResponse(
+            artifact_store.iter_bytes(user_file.digest),
+            media_type=user_file.mime_type,
+            headers={"ETag": etag, "Content-Length": str(user_file.size), "Cache-Control": IMMUTABLE_CACHE_CONTROL}
+        )
+
+    # Stored before the artifact store, served from the user's directory
     output_dir = Path(os.getcwd()) / 'output' / 'users' / userId
     file_path = output_dir / user_file.file_name
 
-    if not file_path.exists():
+    try:
+        stat_result = os.stat(file_path)
+    except FileNotFoundError:
         raise HTTPException(status_code=404, detail="File not found")
 
-    # Serve the file for downloading or embedding
-    return FileResponse(file_path)
+    # Serve the file for downloading or embedding, revalidated by ETag and resumable by Range
+    return file_response(request, file_path, stat_result)
     
 
-def run_generator(db, content, userId):
-    generator = CodeGenerator()
-    resp, error = generator.run(content, userId)
+def generate_reply(job, profile=None):
+    # Runs on a job worker thread, so it needs a session of its own
+    db = SessionLocal()
+    try:
+        with profiling.activate(profile):
+            if profile:
+                now = time.perf_counter()
+                profile.record('queued', now - (datetime.utcnow() - job.created_date).total_seconds(), now)
+            # Short transactions of its own, none is open while the summary is written by OpenAI
+            with profiling.span('history'):
+                with unit_of_work(db):
+                    chat = db.get(Chat, job.chat_id)
+                history, history_usage = conversation_history.build(db, chat, job.prompt, job.message_id)
+            with profiling.span('reply'), unit_of_work(db):
+                generated_content, user_file_id = run_generator(
+                    db, job.prompt, job.user_id, on_event=job.add_event, history=history, history_usage=history_usage
+                )
+                with profiling.span('save_reply'):
+                    reply = chat.add_message(db, generated_content, MessageType.SYSTEM)
+            # Only announce the reply and the file once they're committed and can be fetched
+            publish_message(job.chat_id, reply)
+            if user_file_id:
+                job.add_event("artifact", {"user_file_id": str(user_file_id), "url": user_file_url(job.user_id, user_file_id)})
+            return generated_content
+    finally:
+        db.close()
+        if profile:
+            profile.release()
+
+def generate_batch(job, prompts):
+    # Runs on a job worker thread and fans the prompts out to batch_pool: all of them are
+    # generated, what they need between them is installed once, then each runs and is
+    # reported as soon as it's done. Prompts stand alone, no chat history goes with them.
+    total = len(prompts)
+    manifest = [None] * total
+    codes = {}
+
+    def finish(index, entry):
+        manifest[index] = {"index": index, "prompt": prompts[index], **entry}
+        job.add_event("item", {"item": manifest[index]})
+
+    job.add_event("generating", {"total": total})
+    generations = {batch_pool.submit(code_generator.generate, prompt): index for index, prompt in enumerate(prompts)}
+    for future in as_completed(generations):
+        index = generations[future]
+        try:
+            codes[index] = future.result()
+        except Exception as e:
+            print(f"Batch {job.id} item {index} failed to generate: {e}")
+            finish(index, {"status": "failed", "error": f"Generation failed: {e}", "files": []})
+
+    job.add_event("installing")
+    ready = sorted(codes)
+    dependencies = code_generator.library_manager.install_batch([codes[index][0] for index in ready])
+
+    job.add_event("executing")
+    runs = {
+        batch_pool.submit(run_batch_item, job.user_id, prompts[index], *codes[index], versions): index
+        for index, versions in zip(ready, dependencies)
+    }
+    for future in as_completed(runs):
+        index = runs[future]
+        try:
+            finish(index, future.result())
+        except Exception as e:
+            print(f"Batch {job.id} item {index} failed: {e}")
+            finish(index, {"status": "failed", "error": str(e), "files": []})
+
+    # One reply for the whole batch, published while the session can still load it after the commit
+    db = SessionLocal()
+    try:
+        with unit_of_work(db):
+            chat = db.get(Chat, job.chat_id)
+            reply = chat.add_message(db, batch_reply(manifest), MessageType.SYSTEM)
+        publish_message(job.chat_id, reply)
+    finally:
+        db.close()
+    return manifest
+
+def run_batch_item(user_id, prompt, code, usage, dependencies):
+    # On a batch_pool thread, with a session of its own
+    db = SessionLocal()
+    try:
+        with unit_of_work(db):
+            result = code_generator.code_executor.execute_code(
+                code,
+                user_id,
+                allocate_version=lambda file_name: UserFileVersion.next_version(db, user_id, file_name),
+                dependencies=dependencies
+            )
+            result.usage = usage
+            code_generator.openai_helper.remember(prompt, code, result.exit_code == 0)
+            ExecutionUsage.record(db, user_id, prompt, result, EXECUTOR_MODE)
+            if result.error or not result.artifacts:
+                return {"status": "failed", "error": result.error or "No files were produced", "files": []}
+            files = [{
+                "user_file_id": str(user_file.id),
+                "file_name": user_file.file_name,
+                "digest": user_file.digest,
+                "size": user_file.size,
+                "mime_type": user_file.mime_type,
+                "url": user_file_url(user_id, user_file.id),
+            } for user_file in save_user_files(db, user_id, result)]
+        return {"status": "done", "error": None, "files": files}
+    finally:
+        db.close()
+
+def batch_reply(manifest):
+    lines = [f"I've finished your batch of {len(manifest)}:"]
+    for entry in manifest:
+        if entry["files"]:
+            lines.append(f"{entry['index'] + 1}. link: {entry['files'][-1]['url']}")
+        else:
+            lines.append(f"{entry['index'] + 1}. I couldn't perform this one")
+    return '\n'.join(lines)
+
+def user_file_url(userId, user_file_id):
+    return f"http://localhost:8000/api/users/{userId}/user-files/{user_file_id}"
+
+def run_generator(db, content, userId, on_event=None, history=None, history_usage=None):
+    result = code_generator.run(
+        content,
+        userId,
+        on_event=on_event,
+        allocate_version=lambda file_name: UserFileVersion.next_version(db, userId, file_name),
+        history=history,
+        history_usage=history_usage
+    )
     generated_content = "I've finished working and determined that I can't perform this action"
-
-    if resp and not error:
-        file = Path(resp)
-        file_name = file.name
-        new_user_file = UserFile(file_name=file_name, user_id=userId)
-        db.add(new_user_file)
-        db.commit()
-        db.refresh(new_user_file)
-        output_view_url = f"http://localhost:8000/api/users/{userId}/user-files/{new_user_file.id}"
-        generated_content = f"I've generated some output. link: {output_view_url}"
-
-    return generated_content
\ No newline at end of file
+    user_file_id = None
+    ExecutionUsage.record(db, userId, content, result, EXECUTOR_MODE)
+
+    if result.artifacts and not result.error:
+        user_file_id = save_user_files(db, userId, result)[-1].id
+        generated_content = f"I've generated some output. link: {user_file_url(userId, user_file_id)}"
+
+    return generated_content, user_file_id
+
+def save_user_files(db, userId, result):
+    new_user_files = [
+        UserFile(
+            file_name=artifact['file_name'],
+            user_id=userId,
+            digest=artifact['digest'],
+            size=artifact['size'],
+            mime_type=artifact['mime_type']
+        ) for artifact in result.artifacts
+    ]
+    db.add_all(new_user_files)
+    db.flush()
+    return new_user_files
@@ -0,0 +1,289 @@
+import bisect
+import functools
+import inspect
+import math
+import threading
+import time
+
+# Seconds, from a cached lookup to a slow OpenAI call
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+BYTE_BUCKETS = tuple(2 ** n * 1024 * 1024 for n in range(0, 13, 2))
+TOKEN_BUCKETS = (50, 100, 250, 500, 1000, 2000, 4000, 8000, 16000)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _format_labels(pairs) -> str:
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+def _format_number(value) -> str:
+    value = float(value)
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels) -> tuple:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        yield f"# HELP {self.name} {_escape(self.documentation)}"
+        yield f"# TYPE {self.name} {self.kind}"
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in sorted(values):
+            yield from self._samples(list(zip(self.labelnames, key)), value)
+
+    def _samples(self, labels, value):
+        yield f"{self.name}{_format_labels(labels)} {_format_number(value)}"
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        # Counts per bucket, cumulated only when scraped
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+    def _samples(self, labels, value):
+        counts, total = value
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), counts):
+            cumulative += count
+            yield f"{self.name}_bucket{_format_labels(labels + [('le', _format_number(bound))])} {cumulative}"
+        yield f"{self.name}_sum{_format_labels(labels)} {_format_number(total)}"
+        yield f"{self.name}_count{_format_labels(labels)} {cumulative}"
+
+
+class _Timer:
+    def __init__(self, histogram: Histogram, labels: dict):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+        return False
+
+
+class Registry:
+    """Metrics rendered in the Prometheus text format, no client library needed.
+
+    Recording is a dict lookup and an add under a lock, cheap enough to
+    leave on everywhere. Anything that already keeps its own numbers (job
+    queue, caches, realtime) is registered as a collector instead and only
+    read when /metrics is scraped.
+    """
+
+    def __init__(self, namespace: str = ''):
+        self.namespace = namespace
+        self._metrics = []
+        self._collectors = []
+
+    def _name(self, name: str) -> str:
+        return f"{self.namespace}_{name}" if self.namespace else name
+
+    def counter(self, name: str, documentation: str, labelnames=()) -> Counter:
+        return self._register(Counter(self._name(name), documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames=()) -> Gauge:
+        return self._register(Gauge(self._name(name), documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(self._name(name), documentation, labelnames, buckets))
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, prefix: str, stats):
+        # stats() -> dict, every number in it (nested dicts flattened with _) becomes a gauge
+        self._collectors.append((self._name(prefix), stats))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for prefix, stats in self._collectors:
+            try:
+                values = stats()
+            except Exception as e:
+                print(f"Metrics collector {prefix} failed: {e}")
+                continue
+            for name, value in _flatten(prefix, values):
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {_format_number(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+def _flatten(prefix: str, values: dict):
+    for key, value in values.items():
+        name = f"{prefix}_{key}"
+        if isinstance(value, dict):
+            yield from _flatten(name, value)
+        elif isinstance(value, (int, float)):
+            yield name, value
+
+
+registry = Registry()
+
+HTTP_REQUESTS = registry.counter(
+    'http_requests_total', 'HTTP requests by route template and status', ('method', 'route', 'status')
+)
+HTTP_LATENCY = registry.histogram(
+    'http_request_duration_seconds', 'HTTP request latency by route template', ('method', 'route')
+)
+HTTP_IN_PROGRESS = registry.gauge('http_requests_in_progress', 'HTTP requests being served')
+
+STAGE_LATENCY = registry.histogram(
+    'generation_stage_seconds',
+    'Time spent in each stage of a generation: openai, install, execute, store, and install_wait and validate when pipelined',
+    ('stage',)
+)
+OPENAI_REQUESTS = registry.counter('openai_requests_total', 'Code generations by model and prompt cache use', ('model', 'cached'))
+OPENAI_TOKENS = registry.counter('openai_tokens_total', 'Tokens billed by OpenAI', ('model', 'kind'))
+OPENAI_COMPLETION_TOKENS = registry.histogram(
+    'openai_completion_tokens', 'Completion tokens per generation', ('model',), buckets=TOKEN_BUCKETS
+)
+OPENAI_RETRIES = registry.counter('openai_retries_total', 'OpenAI calls retried, by status code or connection', ('reason',))
+OPENAI_HEDGES = registry.counter('openai_hedges_total', 'Hedged OpenAI requests sent, and how many beat the original', ('outcome',))
+
+EXECUTIONS = registry.counter(
+    'executions_total', 'Generated scripts run, by executor mode and outcome', ('mode', 'cached', 'outcome')
+)
+EXECUTION_CPU = registry.histogram('execution_cpu_seconds', 'CPU time used by a generated script', ('mode',))
+EXECUTION_RSS = registry.histogram(
+    'execution_max_rss_bytes', 'Peak resident memory of a generated script', ('mode',), buckets=BYTE_BUCKETS
+)
+EXECUTION_OUTPUT = registry.histogram(
+    'execution_output_bytes', 'Bytes of files written by a generated script', ('mode',), buckets=BYTE_BUCKETS
+)
+
+DB_LATENCY = registry.histogram(
+    'db_helper_duration_seconds', 'Time spent in each model helper, queries and flushes included', ('helper',),
+    buckets=DB_BUCKETS
+)
+
+
+def timed_db(fn):
+    """Records a model helper's duration in DB_LATENCY, labelled Class.method."""
+    helper = fn.__qualname__
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def async_wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                DB_LATENCY.observe(time.perf_counter() - started, helper=helper)
+        return async_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            DB_LATENCY.observe(time.perf_counter() - started, helper=helper)
+    return wrapper
+
+
+class MetricsMiddleware:
+    """Request rate, errors and duration per route, as plain ASGI middleware.
+
+    Routes are labelled with their template (/api/users/{userId}/...) so
+    label cardinality stays fixed, mounts with their prefix and anything
+    unrouted as "unmatched". Streaming responses count until their last byte.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        status = 500
+        async def send_with_status(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        started = time.perf_counter()
+        HTTP_IN_PROGRESS.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            HTTP_IN_PROGRESS.dec()
+            route = _route_label(scope)
+            method = scope['method']
+            HTTP_LATENCY.observe(time.perf_counter() - started, method=method, route=route)
+            HTTP_REQUESTS.inc(method=method, route=route, status=status)
+
+
+def _route_label(scope) -> str:
+    # The router fills these into the scope as it matches
+    route = scope.get('route')
+    if route is not None and getattr(route, 'path', None):
+        return route.path
+    if scope.get('endpoint') is not None and scope.get('root_path'):
+        return f"{scope['root_path'][len(scope.get('app_root_path', '')):]}/*"
+    return 'unmatched'
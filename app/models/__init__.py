@@ -1,5 +1,6 @@
 from .user import User
 from .chat import Chat
 from .message import Message
-from .user_file import UserFile
+from .user_file import UserFile, UserFileVersion
+from .execution_usage import ExecutionUsage
 from .base import Base
\ No newline at end of file
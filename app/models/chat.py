@@ -1,11 +1,14 @@
 from requests import Session
-from sqlalchemy import Column, ForeignKey, DateTime, and_
+from sqlalchemy import Column, ForeignKey, DateTime, Integer, Text, UniqueConstraint, and_, select, tuple_, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.dialects.postgresql import UUID, insert
 import uuid
+from datetime import datetime
 from .message import Message, MessageType
 from .base import Base
+from ..metrics import timed_db
 from enum import Enum as PyEnum
 from sqlalchemy.dialects.postgresql import ENUM
 
@@ -20,28 +23,155 @@ class Chat(Base):
     user_id = Column(UUID(as_uuid=True), ForeignKey('users.id'), nullable=False)
     context = Column(ENUM(ChatContextType), nullable= False)
     created_date = Column(DateTime, default=func.now()) 
+    # Bumped on every message insert, edit or delete; drives the messages ETag and `since` sync
+    version = Column(Integer, nullable=False, default=0, server_default='0')
+    # Rolling summary of the messages up to summary_revision, fed to the generator instead of them
+    summary = Column(Text, nullable=True)
+    summary_revision = Column(Integer, nullable=False, default=0, server_default='0')
     
     user = relationship("User", back_populates="chats")
     messages = relationship("Message", back_populates="chat")
 
+    __table_args__ = (
+        UniqueConstraint('user_id', 'context', name='uq_chats_user_id_context'),
+    )
+    # Server defaults come back through RETURNING on flush instead of a refresh
+    __mapper_args__ = {"eager_defaults": True}
+
+    # The helpers below only flush; callers commit once per request through unit_of_work
+
+    @classmethod
+    def _insert_if_missing(cls, user_id: str, context: ChatContextType):
+        # Two requests racing to create the same chat both end up with the one row
+        return insert(cls).values(user_id=user_id, context=context).on_conflict_do_nothing(
+            index_elements=[cls.user_id, cls.context]
+        ).returning(cls)
+
     @classmethod
+    @timed_db
     def get_or_create(cls, db: Session, user_id: str, context: ChatContextType):
-        chat = db.query(cls).filter(
-            and_(cls.user_id == user_id, cls.context == context)
-        ).first()
+        query = db.query(cls).filter(and_(cls.user_id == user_id, cls.context == context))
+        chat = query.first()
         if not chat:
-            chat = cls(user_id=user_id, context=context)
-            db.add(chat)
-            db.commit()
-            db.refresh(chat)
+            # Nothing comes back when another request won the race, its row is visible by then
+            chat = db.scalars(cls._insert_if_missing(user_id, context)).first() or query.first()
         return chat
 
+    def _bump_version(self):
+        # The row lock this takes is held until commit, so revisions are handed out in commit order
+        return update(Chat).where(Chat.id == self.id).values(version=Chat.version + 1).returning(Chat.version)
+
+    @timed_db
     def get_messages(self, db: Session):
-        return db.query(Message).filter(Message.chat_id == self.id).all()
+        return db.query(Message).filter(Message.chat_id == self.id, Message.deleted_date.is_(None)).all()
 
+    @timed_db
     def add_message(self, db: Session, content: str, line_type: MessageType):
-        message = Message(chat_id=self.id, content=content, line_type=line_type)
+        revision = db.execute(self._bump_version()).scalar_one()
+        message = Message(chat_id=self.id, content=content, line_type=line_type, revision=revision)
         db.add(message)
-        db.commit()
-        db.refresh(message)
-        return message
\ No newline at end of file
+        db.flush()
+        return message
+
+    @timed_db
+    def get_recent_messages(self, db: Session, after_revision: int, limit: int):
+        # Newest first
+        return db.query(Message).filter(
+            Message.chat_id == self.id,
+            Message.deleted_date.is_(None),
+            Message.revision > after_revision
+        ).order_by(Message.revision.desc()).limit(limit).all()
+
+    @timed_db
+    def save_summary(self, db: Session, summary: str, revision: int, expected_revision: int) -> bool:
+        # Compare-and-set, False when another job moved the summary on since `expected_revision` was read
+        result = db.execute(
+            update(Chat)
+            .where(Chat.id == self.id, Chat.summary_revision == expected_revision)
+            .values(summary=summary, summary_revision=revision)
+        )
+        return result.rowcount == 1
+
+    @classmethod
+    @timed_db
+    async def get_async(cls, db: AsyncSession, user_id: str, context: ChatContextType):
+        result = await db.execute(select(cls).where(and_(cls.user_id == user_id, cls.context == context)))
+        return result.scalars().first()
+
+    @classmethod
+    @timed_db
+    async def get_or_create_async(cls, db: AsyncSession, user_id: str, context: ChatContextType):
+        query = select(cls).where(and_(cls.user_id == user_id, cls.context == context))
+        chat = (await db.execute(query)).scalars().first()
+        if not chat:
+            chat = (await db.scalars(cls._insert_if_missing(user_id, context))).first()
+            chat = chat or (await db.execute(query)).scalars().first()
+        return chat
+
+    @timed_db
+    async def get_version_async(self, db: AsyncSession) -> int:
+        # Read fresh, the instance may have come from the identity cache
+        return (await db.execute(select(Chat.version).where(Chat.id == self.id))).scalar_one()
+
+    @timed_db
+    async def get_message_async(self, db: AsyncSession, message_id: str):
+        result = await db.execute(select(Message).where(
+            Message.id == message_id,
+            Message.chat_id == self.id,
+            Message.deleted_date.is_(None)
+        ))
+        return result.scalars().first()
+
+    @timed_db
+    async def get_messages_async(self, db: AsyncSession):
+        result = await db.execute(select(Message).where(Message.chat_id == self.id, Message.deleted_date.is_(None)))
+        return result.scalars().all()
+
+    @timed_db
+    async def get_changes_async(self, db: AsyncSession, since: int, limit: int):
+        # Everything written after revision `since`, tombstones included, oldest change first
+        result = await db.execute(
+            select(Message)
+            .where(Message.chat_id == self.id, Message.revision > since)
+            .order_by(Message.revision)
+            .limit(limit)
+        )
+        return result.scalars().all()
+
+    @timed_db
+    async def get_messages_page_async(self, db: AsyncSession, limit: int, before=None):
+        # Newest page first; `before` is the (created_date, id) of the oldest message already seen
+        query = select(Message).where(Message.chat_id == self.id, Message.deleted_date.is_(None))
+        if before:
+            query = query.where(tuple_(Message.created_date, Message.id) < tuple_(*before))
+        query = query.order_by(Message.created_date.desc(), Message.id.desc()).limit(limit + 1)
+        messages = (await db.execute(query)).scalars().all()
+
+        next_before = None
+        if len(messages) > limit:
+            messages = messages[:limit]
+            next_before = (messages[-1].created_date, messages[-1].id)
+        return list(reversed(messages)), next_before
+
+    @timed_db
+    async def add_message_async(self, db: AsyncSession, content: str, line_type: MessageType):
+        revision = (await db.execute(self._bump_version())).scalar_one()
+        message = Message(chat_id=self.id, content=content, line_type=line_type, revision=revision)
+        db.add(message)
+        await db.flush()
+        return message
+
+    @timed_db
+    async def update_message_async(self, db: AsyncSession, message: Message, content: str):
+        message.content = content
+        message.revision = (await db.execute(self._bump_version())).scalar_one()
+        await db.flush()
+        return message
+
+    @timed_db
+    async def delete_message_async(self, db: AsyncSession, message: Message):
+        message.content = ''
+        message.deleted_date = datetime.utcnow()
+        message.revision = (await db.execute(self._bump_version())).scalar_one()
+        await db.flush()
+        return message
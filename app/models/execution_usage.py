@@ -0,0 +1,54 @@
+from sqlalchemy import Column, ForeignKey, DateTime, String, Integer, BigInteger, Boolean, Text, Index
+from sqlalchemy.sql import func
+from sqlalchemy.dialects.postgresql import UUID
+import uuid
+from .base import Base
+from ..metrics import timed_db
+
+
+class ExecutionUsage(Base):
+    __tablename__ = "execution_usage"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    user_id = Column(UUID(as_uuid=True), ForeignKey('users.id'), nullable=False)
+    prompt = Column(Text, nullable=True)
+    # sha256 of the generated code, repeats of the same script group together
+    code_digest = Column(String(64), nullable=True)
+    mode = Column(String, nullable=False)
+    cached = Column(Boolean, nullable=False, default=False)
+    exit_code = Column(Integer, nullable=True)
+    # timeout, cpu, memory, open_files or output when a cap ended the run
+    limit_exceeded = Column(String, nullable=True)
+    wall_ms = Column(Integer, nullable=False, default=0)
+    cpu_user_ms = Column(Integer, nullable=False, default=0)
+    cpu_system_ms = Column(Integer, nullable=False, default=0)
+    max_rss_bytes = Column(BigInteger, nullable=False, default=0)
+    output_bytes = Column(BigInteger, nullable=False, default=0)
+    created_date = Column(DateTime, default=func.now())
+
+    __table_args__ = (
+        Index('ix_execution_usage_user_id_created_date', 'user_id', 'created_date'),
+    )
+
+    @classmethod
+    @timed_db
+    def record(cls, db, user_id, prompt: str, result, mode: str):
+        # Cached replays ran nothing, they're kept with zero usage so hit rates show up too
+        resources = result.resources or {}
+        usage = cls(
+            user_id=user_id,
+            prompt=prompt,
+            code_digest=result.code_digest,
+            mode=mode,
+            cached=result.cached,
+            exit_code=result.exit_code,
+            limit_exceeded=resources.get('limit_exceeded'),
+            wall_ms=int(resources.get('wall_seconds', 0) * 1000),
+            cpu_user_ms=int(resources.get('cpu_user_seconds', 0) * 1000),
+            cpu_system_ms=int(resources.get('cpu_system_seconds', 0) * 1000),
+            max_rss_bytes=resources.get('max_rss_bytes', 0),
+            output_bytes=resources.get('output_bytes', 0)
+        )
+        db.add(usage)
+        db.flush()
+        return usage
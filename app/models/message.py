@@ -1,10 +1,12 @@
 from requests import Session
-from sqlalchemy import Column, ForeignKey, Text, DateTime
+from sqlalchemy import Column, ForeignKey, Text, DateTime, Integer, Index, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from sqlalchemy.dialects.postgresql import UUID
 import uuid
 from .base import Base
+from ..metrics import timed_db
 from enum import Enum as PyEnum
 from sqlalchemy.dialects.postgresql import ENUM
 
@@ -20,14 +22,33 @@ class Message(Base):
     content = Column(Text, nullable=False)
     line_type = Column(ENUM(MessageType), nullable= False)
     created_date = Column(DateTime, default=func.now()) 
+    # Chat version of the last write to this message, see Chat.version
+    revision = Column(Integer, nullable=False, default=0, server_default='0')
+    # Deleted messages stay behind as tombstones so incremental sync can report them
+    deleted_date = Column(DateTime, nullable=True)
     
     chat = relationship("Chat", back_populates="messages")
 
+    __table_args__ = (
+        # Serves the keyset pagination in Chat.get_messages_page_async
+        Index('ix_messages_chat_id_created_date_id', 'chat_id', 'created_date', 'id'),
+        # Serves the `since` sync in Chat.get_changes_async
+        Index('ix_messages_chat_id_revision', 'chat_id', 'revision'),
+    )
+    __mapper_args__ = {"eager_defaults": True}
+
     @classmethod
+    @timed_db
     def get_by_id(cls, db: Session, message_id: str):
         return db.query(cls).filter(cls.id == message_id).first()
 
+    @timed_db
     def update_content(self, db: Session, new_content: str):
         self.content = new_content
-        db.commit()
-        db.refresh(self)
\ No newline at end of file
+        db.flush()
+
+    @classmethod
+    @timed_db
+    async def get_by_id_async(cls, db: AsyncSession, message_id: str):
+        result = await db.execute(select(cls).where(cls.id == message_id))
+        return result.scalars().first()
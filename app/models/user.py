@@ -1,5 +1,6 @@
 from requests import Session
-from sqlalchemy import Column, String, DateTime, and_
+from sqlalchemy import Column, String, DateTime, and_, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import relationship
 from sqlalchemy.dialects.postgresql import UUID
 import uuid
@@ -7,6 +8,7 @@ import uuid
 from .chat import Chat, ChatContextType
 from .user_file import UserFile
 from .base import Base
+from ..metrics import timed_db
 from sqlalchemy.sql import func
 
 class User(Base):
@@ -20,23 +22,37 @@ class User(Base):
     # One user can have many chats
     chats = relationship("Chat", back_populates="user")
     user_files = relationship("UserFile", back_populates="user")
+
+    __mapper_args__ = {"eager_defaults": True}
     
     @classmethod
+    @timed_db
     def get_by_id(cls, db: Session, user_id: str):
         return db.query(cls).filter(cls.id == user_id).first()
 
+    @timed_db
     def get_or_create_chat(self, db: Session, context: ChatContextType):
-        chat = db.query(Chat).filter(
-            and_(Chat.user_id == self.id, Chat.context == context)
-        ).first()
-        if not chat:
-            chat = Chat(user_id=self.id, context=context)
-            db.add(chat)
-            db.commit()
-            db.refresh(chat)
-        return chat
+        return Chat.get_or_create(db, self.id, context)
 
+    @timed_db
     def get_file(self, db: Session, file_id: str):
         return db.query(UserFile).filter(
             and_(UserFile.user_id == self.id, UserFile.id == file_id)
-        ).first()
\ No newline at end of file
+        ).first()
+
+    @classmethod
+    @timed_db
+    async def get_by_id_async(cls, db: AsyncSession, user_id: str):
+        result = await db.execute(select(cls).where(cls.id == user_id))
+        return result.scalars().first()
+
+    @timed_db
+    async def get_or_create_chat_async(self, db: AsyncSession, context: ChatContextType):
+        return await Chat.get_or_create_async(db, self.id, context)
+
+    @timed_db
+    async def get_file_async(self, db: AsyncSession, file_id: str):
+        result = await db.execute(select(UserFile).where(
+            and_(UserFile.user_id == self.id, UserFile.id == file_id)
+        ))
+        return result.scalars().first()
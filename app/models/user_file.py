@@ -1,9 +1,10 @@
-from sqlalchemy import Column, ForeignKey, DateTime, String
+from sqlalchemy import Column, ForeignKey, DateTime, String, Integer, BigInteger, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.dialects.postgresql import UUID, insert
 import uuid
 from .base import Base
+from ..metrics import timed_db
 
 
 class UserFile(Base):
@@ -13,5 +14,48 @@ class UserFile(Base):
     user_id = Column(UUID(as_uuid=True), ForeignKey('users.id'), nullable=False)
     file_name = Column(String, nullable=False)
     created_date = Column(DateTime, default=func.now()) 
+    # sha256 of the content in the artifact store, empty for files stored before it existed
+    digest = Column(String(64), nullable=True)
+    size = Column(BigInteger, nullable=True)
+    mime_type = Column(String, nullable=True)
     
-    user = relationship("User", back_populates="user_files")
\ No newline at end of file
+    user = relationship("User", back_populates="user_files")
+
+    __table_args__ = (
+        Index('ix_user_files_user_id_id', 'user_id', 'id'),
+        Index('ix_user_files_digest', 'digest'),
+        Index('ix_user_files_created_date', 'created_date'),
+    )
+    __mapper_args__ = {"eager_defaults": True}
+
+    @classmethod
+    @timed_db
+    def expired(cls, db, before, limit: int = 1000):
+        # Oldest first, so repeated sweeps work through a backlog
+        return db.query(cls).filter(cls.created_date < before).order_by(cls.created_date).limit(limit).all()
+
+    @classmethod
+    @timed_db
+    def digests_in_use(cls, db, digests) -> set:
+        if not digests:
+            return set()
+        return {d for d, in db.query(cls.digest).filter(cls.digest.in_(list(digests))).distinct()}
+
+
+class UserFileVersion(Base):
+    __tablename__ = "user_file_versions"
+
+    user_id = Column(UUID(as_uuid=True), ForeignKey('users.id'), primary_key=True)
+    file_name = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+    @classmethod
+    @timed_db
+    def next_version(cls, db, user_id: str, file_name: str) -> int:
+        # Single upsert, so concurrent executions never get the same version. The row
+        # stays locked until the caller's unit of work commits.
+        stmt = insert(cls).values(user_id=user_id, file_name=file_name, version=1).on_conflict_do_update(
+            index_elements=[cls.user_id, cls.file_name],
+            set_={"version": cls.version + 1}
+        ).returning(cls.version)
+        return db.execute(stmt).scalar_one()
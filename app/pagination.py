@@ -0,0 +1,18 @@
+import base64
+import uuid
+from datetime import datetime
+
+
+def encode_cursor(created_date: datetime, message_id) -> str:
+    raw = f"{created_date.isoformat()}|{message_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor: str):
+    # Raises ValueError for anything we didn't hand out
+    padded = cursor + '=' * (-len(cursor) % 4)
+    try:
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("Invalid cursor")
+    created_date, _, message_id = raw.partition('|')
+    return datetime.fromisoformat(created_date), uuid.UUID(message_id)
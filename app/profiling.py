@@ -0,0 +1,172 @@
+import contextvars
+import hmac
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+
+_current = contextvars.ContextVar('profile', default=None)
+_NO_SPAN = nullcontext()
+
+
+class Profile:
+    """One request profiled end to end, across the threads that work on it.
+
+    A sampler thread reads the stacks of the attached threads with
+    sys._current_frames every `interval` seconds and counts them as
+    collapsed stacks, which flamegraph.pl, speedscope and friends read as
+    is. Each sample is rooted at the span its thread was in, so the flame
+    graph splits by stage. Spans are wall-clock timings of the stages. The
+    profile is saved once nothing holds it: every attached thread counts as
+    a hold, and `hold` keeps it open while work is handed between threads.
+    A thread attached with `spans_only`, the event loop that every request
+    shares, is only sampled while one of this profile's spans is open on it.
+    """
+
+    def __init__(self, name: str, directory: str, interval: float = 0.005):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.directory = directory
+        self.interval = interval
+        self.spans = []
+        self.samples = Counter()
+        self.started = time.perf_counter()
+        self.started_at = time.time()
+        self._threads = {}
+        self._spans_only = set()
+        self._holds = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sampler = None
+
+    def attach(self, spans_only: bool = False):
+        # The calling thread is sampled until it detaches
+        with self._lock:
+            self._threads[threading.get_ident()] = []
+            if spans_only:
+                self._spans_only.add(threading.get_ident())
+            self._holds += 1
+            if self._sampler is None:
+                self._sampler = threading.Thread(target=self._sample, name=f"profile_{self.id[:8]}", daemon=True)
+                self._sampler.start()
+
+    def detach(self):
+        with self._lock:
+            self._threads.pop(threading.get_ident(), None)
+            self._spans_only.discard(threading.get_ident())
+        self.release()
+
+    def hold(self):
+        with self._lock:
+            self._holds += 1
+
+    def release(self):
+        with self._lock:
+            self._holds -= 1
+            done = self._holds == 0
+        if done:
+            self._stop.set()
+            self.save()
+
+    @contextmanager
+    def span(self, name: str):
+        stack = self._threads.get(threading.get_ident())
+        if stack is not None:
+            stack.append(name)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, started, time.perf_counter(), depth=len(stack) - 1 if stack else 0)
+            if stack:
+                stack.pop()
+
+    def record(self, name: str, started: float, ended: float, depth: int = 0):
+        with self._lock:
+            self.spans.append({
+                "name": name,
+                "thread": threading.current_thread().name,
+                "depth": depth,
+                "start_ms": round((started - self.started) * 1000, 3),
+                "duration_ms": round((ended - started) * 1000, 3),
+            })
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            with self._lock:
+                threads = [
+                    (ident, stack[-1] if stack else None) for ident, stack in self._threads.items()
+                    if stack or ident not in self._spans_only
+                ]
+            for ident, span in threads:
+                frame = frames.get(ident)
+                if frame is None:
+                    continue
+                self.samples[_collapse(frame, span)] += 1
+
+    def save(self):
+        os.makedirs(self.directory, exist_ok=True)
+        base = os.path.join(self.directory, f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(self.started_at))}-{self.id[:8]}")
+        with open(f"{base}.collapsed", 'w') as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+        with open(f"{base}.json", 'w') as f:
+            json.dump({
+                "id": self.id,
+                "name": self.name,
+                "started_at": self.started_at,
+                "duration_ms": round((time.perf_counter() - self.started) * 1000, 3),
+                "interval_ms": self.interval * 1000,
+                "samples": sum(self.samples.values()),
+                "spans": sorted(self.spans, key=lambda s: s["start_ms"]),
+            }, f, indent=2)
+        print(f"Profile {self.name} saved to {base}.json and {base}.collapsed")
+        return base
+
+
+def _collapse(frame, span=None) -> str:
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    if span:
+        names.append(f"[{span}]")
+    return ';'.join(reversed(names))
+
+
+def requested(request, token: str) -> bool:
+    # Admin switch, the X-Profile header or ?profile= has to carry the configured token
+    if not token:
+        return False
+    given = request.headers.get('x-profile') or request.query_params.get('profile') or ''
+    return hmac.compare_digest(given.encode(), token.encode())
+
+
+@contextmanager
+def activate(profile, spans_only: bool = False):
+    """Makes `profile` the current one for this thread or task and samples it until the block ends.
+
+    On an event loop pass `spans_only`, the thread runs other requests between this one's spans.
+    """
+    if profile is None:
+        yield None
+        return
+    token = _current.set(profile)
+    profile.attach(spans_only)
+    try:
+        yield profile
+    finally:
+        profile.detach()
+        _current.reset(token)
+
+
+def span(name: str):
+    # Stages call this unconditionally, without a profile it's a context var lookup
+    profile = _current.get()
+    return profile.span(name) if profile is not None else _NO_SPAN
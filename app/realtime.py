@@ -0,0 +1,194 @@
+import asyncio
+import json
+import os
+import resource
+import threading
+
+from .config import REDIS_URL, REALTIME_QUEUE_SIZE
+
+# Sent in place of the backlog when a subscriber falls too far behind,
+# the client catches up through the messages endpoint instead
+RESYNC = {"type": "resync"}
+
+
+def chat_channel(chat_id) -> str:
+    return f"chat:{chat_id}"
+
+
+def rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        # Peak rather than current outside Linux, good enough for sizing
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class LocalBroker:
+    """In-process fan-out from publishers to asyncio subscribers.
+
+    `publish` can be called from any thread, each subscriber is woken on its
+    own event loop. Subscriber queues are bounded: a subscriber that can't
+    keep up has its backlog replaced by a single RESYNC message.
+    """
+
+    def __init__(self, queue_size: int = 100):
+        self.queue_size = queue_size
+        self._channels = {}
+        self._lock = threading.Lock()
+
+    def publish(self, channel: str, message: dict):
+        self._deliver(channel, message)
+
+    async def publish_async(self, channel: str, message: dict):
+        # For publishers on an event loop, delivery here never blocks
+        self._deliver(channel, message)
+
+    def _deliver(self, channel: str, message: dict):
+        with self._lock:
+            subscribers = list(self._channels.get(channel, ()))
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(self._offer, queue, message)
+            except RuntimeError:
+                # The subscriber's loop has already shut down
+                pass
+
+    @staticmethod
+    def _offer(queue: asyncio.Queue, message: dict):
+        try:
+            queue.put_nowait(message)
+        except asyncio.QueueFull:
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(RESYNC)
+
+    def subscribe(self, channel: str) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        with self._lock:
+            self._channels.setdefault(channel, []).append((asyncio.get_running_loop(), queue))
+        return queue
+
+    def unsubscribe(self, channel: str, queue: asyncio.Queue):
+        with self._lock:
+            subscribers = [(loop, q) for loop, q in self._channels.get(channel, ()) if q is not queue]
+            if subscribers:
+                self._channels[channel] = subscribers
+            else:
+                self._channels.pop(channel, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "channels": len(self._channels),
+                "subscribers": sum(len(s) for s in self._channels.values()),
+                "backlog": sum(q.qsize() for s in self._channels.values() for _, q in s),
+            }
+
+
+class RedisBroker(LocalBroker):
+    """Fans out through Redis pub/sub so every worker sees every publish.
+
+    Each process keeps one pattern subscription and hands what it receives
+    to its local subscribers, so idle WebSockets don't cost a Redis
+    connection each. Needs the `redis` package.
+    """
+
+    def __init__(self, url: str, queue_size: int = 100):
+        super().__init__(queue_size)
+        try:
+            import redis
+            import redis.asyncio
+        except ImportError:
+            raise RuntimeError("REDIS_URL is set but the redis package isn't installed, pip install redis")
+        self.url = url
+        self._publisher = redis.Redis.from_url(url)
+        self._redis_asyncio = redis.asyncio
+        self._async_publishers = {}
+        self._listener = None
+
+    def publish(self, channel: str, message: dict):
+        # Sync client, for job worker threads; code on the event loop uses publish_async
+        self._publisher.publish(channel, json.dumps(message))
+
+    async def publish_async(self, channel: str, message: dict):
+        # An asyncio client is tied to the loop it was made on, one per loop
+        loop = asyncio.get_running_loop()
+        publisher = self._async_publishers.get(loop)
+        if publisher is None:
+            publisher = self._async_publishers[loop] = self._redis_asyncio.Redis.from_url(self.url)
+        await publisher.publish(channel, json.dumps(message))
+
+    def subscribe(self, channel: str) -> asyncio.Queue:
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.get_running_loop().create_task(self._listen())
+        return super().subscribe(channel)
+
+    async def _listen(self):
+        client = self._redis_asyncio.Redis.from_url(self.url)
+        pubsub = client.pubsub()
+        await pubsub.psubscribe("chat:*")
+        try:
+            async for item in pubsub.listen():
+                if item["type"] != "pmessage":
+                    continue
+                channel = item["channel"].decode() if isinstance(item["channel"], bytes) else item["channel"]
+                self._deliver(channel, json.loads(item["data"]))
+        finally:
+            await pubsub.aclose()
+            await client.aclose()
+
+
+class ConnectionRegistry:
+    """Counts open WebSocket connections and estimates what each one costs.
+
+    The per-connection figure is the RSS growth since the worker last had
+    no connections, divided by the connections open now. It's an estimate,
+    but it tracks the real cost once a few hundred sockets are open.
+    """
+
+    def __init__(self):
+        self._connections = {}
+        self._lock = threading.Lock()
+        self._baseline_rss = rss_bytes()
+        self.total_opened = 0
+
+    def opened(self, channel: str):
+        with self._lock:
+            if not self._connections:
+                self._baseline_rss = rss_bytes()
+            self._connections[channel] = self._connections.get(channel, 0) + 1
+            self.total_opened += 1
+
+    def closed(self, channel: str):
+        with self._lock:
+            remaining = self._connections.get(channel, 0) - 1
+            if remaining > 0:
+                self._connections[channel] = remaining
+            else:
+                self._connections.pop(channel, None)
+
+    def stats(self):
+        with self._lock:
+            connections = sum(self._connections.values())
+            channels = len(self._connections)
+            baseline = self._baseline_rss
+        rss = rss_bytes()
+        return {
+            "pid": os.getpid(),
+            "connections": connections,
+            "channels": channels,
+            "total_opened": self.total_opened,
+            "rss_bytes": rss,
+            "bytes_per_connection": max(0, rss - baseline) // connections if connections else 0,
+        }
+
+
+def create_broker():
+    if REDIS_URL:
+        return RedisBroker(REDIS_URL, queue_size=REALTIME_QUEUE_SIZE)
+    return LocalBroker(queue_size=REALTIME_QUEUE_SIZE)
+
+
+broker = create_broker()
+connections = ConnectionRegistry()
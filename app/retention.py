@@ -0,0 +1,93 @@
+import os
+import threading
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from .config import unit_of_work
+from .models.user_file import UserFile
+
+
+def collect_garbage(db, store, before, users_dir, batch_size: int = 1000) -> dict:
+    """Deletes one batch of UserFiles created before `before`, their per-user names, and the blobs left unused.
+
+    Blobs go through `store.delete`, so the execution cache forgets the
+    results that handed them out. A blob is checked again right before it
+    goes, in case a run stored the same bytes since the rows were deleted,
+    and one the store has handed out recently is kept: the rows of a run
+    still going aren't committed yet.
+    """
+    with unit_of_work(db):
+        files = UserFile.expired(db, before, batch_size)
+        links = [Path(users_dir) / str(user_file.user_id) / user_file.file_name for user_file in files]
+        digests = {user_file.digest for user_file in files if user_file.digest}
+        for user_file in files:
+            db.delete(user_file)
+        db.flush()
+        orphaned = digests - UserFile.digests_in_use(db, digests)
+
+    # Only once the rows are gone for good
+    for link in links:
+        try:
+            os.remove(link)
+        except FileNotFoundError:
+            pass
+    blobs = 0
+    for digest in sorted(orphaned):
+        with unit_of_work(db):
+            in_use = UserFile.digests_in_use(db, {digest})
+        if not in_use and not store.recently_used(digest):
+            store.delete(digest)
+            blobs += 1
+    return {'files': len(files), 'blobs': blobs}
+
+
+class RetentionSweeper:
+    """Deletes generated files past ARTIFACT_RETENTION_DAYS every `interval` seconds, on a thread of its own."""
+
+    def __init__(self, session_factory, store, retention_days: int, interval: int, users_dir, cache=None):
+        self.session_factory = session_factory
+        self.store = store
+        self.retention_days = retention_days
+        self.interval = interval
+        self.users_dir = users_dir
+        self.cache = cache
+        self.files_deleted = 0
+        self.blobs_deleted = 0
+        self.cache_evicted = 0
+        self._stop = threading.Event()
+
+    def start(self):
+        threading.Thread(target=self._loop, name="retention", daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"Retention sweep failed: {e}")
+
+    def sweep(self, batch_size: int = 1000):
+        before = datetime.utcnow() - timedelta(days=self.retention_days)
+        db = self.session_factory()
+        try:
+            while True:
+                deleted = collect_garbage(db, self.store, before, self.users_dir, batch_size)
+                self.files_deleted += deleted['files']
+                self.blobs_deleted += deleted['blobs']
+                if deleted['files'] < batch_size or self._stop.is_set():
+                    break
+        finally:
+            db.close()
+        if self.cache:
+            # Blobs that went missing without a delete, e.g. removed from the bucket by hand
+            self.cache_evicted += self.cache.evict_missing(self.store)
+
+    def stats(self):
+        return {
+            "files_deleted": self.files_deleted,
+            "blobs_deleted": self.blobs_deleted,
+            "cache_evicted": self.cache_evicted,
+        }
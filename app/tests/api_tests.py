@@ -2,17 +2,32 @@ import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
-from ..main import app, get_db
-from ..models import Base
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import NullPool
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from ..main import app
+from ..config import get_db, get_async_db
+from ..models import Base, User, Chat, Message, UserFileVersion
+from ..agents import code_generator
+from ..agents.artifact_store import LocalArtifactStore
+from ..config import unit_of_work
+from ..jobs import Job
+from .. import main
 from ..models.chat import ChatContextType
 from ..models.message import MessageType
 import os
+import uuid
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 
 # PostgreSQL database URL for testing
 SQLALCHEMY_DATABASE_URL = os.getenv("TEST_DATABASE_URL", "postgresql://postgresql:@localhost:5432/testdb")
 
 engine = create_engine(SQLALCHEMY_DATABASE_URL)
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Unpooled: TestClient runs each request on an event loop of its own, a pooled connection stays tied to the first
+async_engine = create_async_engine(make_url(SQLALCHEMY_DATABASE_URL).set(drivername="postgresql+asyncpg"), poolclass=NullPool)
+TestingAsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
 
 # Set up a TestClient
 client = TestClient(app)
@@ -25,7 +40,12 @@ def override_get_db():
     finally:
         db.close()
 
+async def override_get_async_db():
+    async with TestingAsyncSessionLocal() as db:
+        yield db
+
 app.dependency_overrides[get_db] = override_get_db
+app.dependency_overrides[get_async_db] = override_get_async_db
 
 @pytest.fixture(scope="session")
 def db_engine():
@@ -64,4 +84,187 @@ def test_send_message(db):
     assert "details" in response_json
 
     assert response_json["chat_context"] == chat_context
-    assert isinstance(response_json["details"], str)
\ No newline at end of file
+    assert isinstance(response_json["details"], str)
+def make_chat(context=ChatContextType.ONBOARDING):
+    # Committed, the handlers and job workers read it through sessions of their own
+    db = TestingSessionLocal()
+    try:
+        user = User(name="Test", email=f"{uuid.uuid4()}@example.com")
+        db.add(user)
+        db.flush()
+        chat = Chat.get_or_create(db, user.id, context)
+        db.commit()
+        return user.id, chat.id
+    finally:
+        db.close()
+
+def test_generate_batch_replies_in_the_chat(db_engine, monkeypatch):
+    user_id, chat_id = make_chat()
+    published = []
+    monkeypatch.setattr(main, "SessionLocal", TestingSessionLocal)
+    monkeypatch.setattr(main.broker, "publish", lambda channel, payload: published.append(payload))
+    monkeypatch.setattr(main.code_generator, "generate", lambda prompt: (f"# {prompt}", {}))
+    monkeypatch.setattr(main.code_generator.library_manager, "install_batch", lambda codes: [{} for _ in codes])
+    monkeypatch.setattr(main, "run_batch_item", lambda user_id, prompt, code, usage, dependencies: {
+        "status": "done", "error": None, "files": [{"file_name": f"{prompt}.csv", "url": f"/{prompt}.csv"}]
+    })
+
+    job = Job(user_id, chat_id, "Batch of 2 prompts")
+    manifest = main.generate_batch(job, ["a", "b"])
+
+    assert [entry["status"] for entry in manifest] == ["done", "done"]
+    assert [event["stage"] for event in job.events if event["stage"] == "item"] == ["item", "item"]
+    # The reply went out after its session committed, and it's the one stored in the chat
+    assert len(published) == 1
+    reply = published[0]["message"]
+    session = TestingSessionLocal()
+    try:
+        stored = session.get(Message, uuid.UUID(reply["id"]))
+        assert stored.chat_id == chat_id
+        assert stored.content == reply["content"]
+        assert "a.csv" in reply["content"] and "b.csv" in reply["content"]
+    finally:
+        session.close()
+
+def add_messages(chat_id, contents, created_date=None):
+    db = TestingSessionLocal()
+    try:
+        chat = db.get(Chat, chat_id)
+        messages = []
+        for content in contents:
+            message = chat.add_message(db, content, MessageType.USER)
+            if created_date:
+                message.created_date = created_date
+            messages.append(message)
+        db.commit()
+        return [str(message.id) for message in messages]
+    finally:
+        db.close()
+
+def messages_url(user_id):
+    return f"/api/users/{user_id}/chats/onboarding/messages"
+
+def test_since_returns_only_later_changes(db_engine):
+    user_id, chat_id = make_chat()
+    add_messages(chat_id, ["one", "two", "three"])
+
+    response = client.get(messages_url(user_id), params={"since": 1})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert [m["content"] for m in body["messages"]] == ["two", "three"]
+    assert [m["revision"] for m in body["messages"]] == [2, 3]
+    assert body["version"] == 3
+
+def test_deleted_messages_come_back_as_tombstones(db_engine):
+    user_id, chat_id = make_chat()
+    ids = add_messages(chat_id, ["one", "two"])
+
+    assert client.delete(f"{messages_url(user_id)}/{ids[0]}").status_code == 200
+
+    changes = client.get(messages_url(user_id), params={"since": 2}).json()
+    assert [(m["id"], m["deleted"], m["revision"]) for m in changes["messages"]] == [(ids[0], True, 3)]
+    assert changes["version"] == 3
+    # A full read leaves it out
+    page = client.get(messages_url(user_id)).json()
+    assert [m["content"] for m in page["messages"]] == ["two"]
+
+def test_unchanged_messages_answer_not_modified(db_engine):
+    user_id, chat_id = make_chat()
+    add_messages(chat_id, ["one"])
+    etag = client.get(messages_url(user_id), params={"since": 0}).headers["ETag"]
+
+    response = client.get(messages_url(user_id), params={"since": 0}, headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+
+    add_messages(chat_id, ["two"])
+    response = client.get(messages_url(user_id), params={"since": 0}, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+def test_since_with_a_limit_carries_on_from_the_last_change(db_engine):
+    user_id, chat_id = make_chat()
+    add_messages(chat_id, ["1", "2", "3", "4", "5"])
+
+    seen, since = [], 0
+    for _ in range(5):
+        body = client.get(messages_url(user_id), params={"since": since, "limit": 2}).json()
+        seen += [m["content"] for m in body["messages"]]
+        if body["version"] == since:
+            break
+        since = body["version"]
+
+    assert seen == ["1", "2", "3", "4", "5"]
+    assert since == 5
+
+def test_concurrent_runs_are_isolated_and_versioned(db_engine, tmp_path, monkeypatch):
+    user_id, _ = make_chat()
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(code_generator, "execution_cache", None)
+    monkeypatch.setattr(code_generator, "artifact_store", LocalArtifactStore(tmp_path / "blobs"))
+    code = "import os\nprint(os.getcwd())\nopen('report.csv', 'w').write('a,b\\n')\n"
+
+    def run(_):
+        db = TestingSessionLocal()
+        try:
+            with unit_of_work(db):
+                return code_generator.CodeExecutor.execute_code(
+                    code, str(user_id),
+                    allocate_version=lambda file_name: UserFileVersion.next_version(db, user_id, file_name)
+                )
+        finally:
+            db.close()
+
+    with ThreadPoolExecutor(8) as pool:
+        results = list(pool.map(run, range(8)))
+
+    assert all(result.exit_code == 0 for result in results)
+    # Each run had a scratch directory of its own, gone once it finished
+    scratch_dirs = {result.stdout.strip() for result in results}
+    assert len(scratch_dirs) == 8
+    assert not any(os.path.exists(path) for path in scratch_dirs)
+    names = sorted(result.artifacts[0]["file_name"] for result in results)
+    assert names == sorted(f"report_v{version}.csv" for version in range(1, 9))
+
+    db = TestingSessionLocal()
+    try:
+        with unit_of_work(db):
+            assert UserFileVersion.next_version(db, user_id, "report.csv") == 9
+    finally:
+        db.close()
+
+def test_malformed_cursor_is_a_bad_request(db_engine):
+    user_id, _ = make_chat()
+
+    response = client.get(messages_url(user_id), params={"cursor": "not a cursor"})
+
+    assert response.status_code == 400
+
+def test_pages_break_created_date_ties_by_id(db_engine):
+    user_id, chat_id = make_chat()
+    # All in the same instant, only the id orders them
+    ids = add_messages(chat_id, [str(i) for i in range(5)], created_date=datetime(2026, 1, 1))
+
+    pages, cursor = [], None
+    while True:
+        body = client.get(messages_url(user_id), params={"limit": 2, **({"cursor": cursor} if cursor else {})}).json()
+        pages.append([m["id"] for m in body["messages"]])
+        cursor = body["next_cursor"]
+        if not cursor:
+            break
+
+    assert [len(page) for page in pages] == [2, 2, 1]
+    # Newest page first, oldest first within a page
+    assert [message_id for page in reversed(pages) for message_id in page] == sorted(ids, key=uuid.UUID)
+
+def test_last_page_has_no_next_cursor(db_engine):
+    user_id, chat_id = make_chat()
+    # Separate transactions, so they don't share a created_date
+    add_messages(chat_id, ["one"])
+    add_messages(chat_id, ["two"])
+
+    body = client.get(messages_url(user_id), params={"limit": 2}).json()
+
+    assert [m["content"] for m in body["messages"]] == ["one", "two"]
+    assert body["next_cursor"] is None
@@ -0,0 +1,101 @@
+import errno
+import io
+import os
+import pytest
+from ..agents import artifact_store
+from ..agents.artifact_store import ArtifactStore, LocalArtifactStore, S3ArtifactStore
+
+
+class InMemoryS3Client:
+    """Just enough of boto3's S3 client for the store."""
+
+    def __init__(self):
+        self.objects = {}
+        self.puts = 0
+
+    def put_object(self, Bucket, Key, Body, ContentType=None):
+        self.puts += 1
+        self.objects[(Bucket, Key)] = Body.read()
+
+    def head_object(self, Bucket, Key):
+        return {'ContentLength': len(self.objects[(Bucket, Key)])}
+
+    def get_object(self, Bucket, Key):
+        return {'Body': io.BytesIO(self.objects[(Bucket, Key)])}
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop((Bucket, Key), None)
+
+
+def write(path, content):
+    path.write_bytes(content)
+    return path
+
+
+def test_identical_content_is_stored_once(tmp_path):
+    store = LocalArtifactStore(tmp_path / "blobs")
+    first = store.put(write(tmp_path / "a.csv", b"year,revenue\n"))
+    second = store.put(write(tmp_path / "b.csv", b"year,revenue\n"))
+
+    assert first["digest"] == second["digest"]
+    assert store.stats() == {"blobs": 1, "bytes": 13}
+    assert not (tmp_path / "a.csv").exists()
+
+def test_put_describes_the_content(tmp_path):
+    store = LocalArtifactStore(tmp_path / "blobs")
+    stored = store.put(write(tmp_path / "deck.pptx", b"slides"))
+
+    assert len(stored["digest"]) == 64
+    assert stored["size"] == 6
+    assert stored["mime_type"] == "application/vnd.openxmlformats-officedocument.presentationml.presentation"
+
+def test_user_names_are_hard_links_to_the_blob(tmp_path):
+    store = LocalArtifactStore(tmp_path / "blobs")
+    digest = store.put(write(tmp_path / "a.csv", b"data"))["digest"]
+
+    assert store.link(digest, tmp_path / "a_v1.csv")
+    assert store.link(digest, tmp_path / "a_v2.csv")
+    assert not store.link(digest, tmp_path / "a_v1.csv")
+    assert os.stat(tmp_path / "a_v1.csv").st_ino == os.stat(store.local_path(digest)).st_ino
+
+def test_user_names_are_copies_across_filesystems(tmp_path, monkeypatch):
+    store = LocalArtifactStore(tmp_path / "blobs")
+    digest = store.put(write(tmp_path / "a.csv", b"data"))["digest"]
+    link = os.link
+
+    def cross_device(source, target):
+        if str(source).startswith(str(store.root)):
+            raise OSError(errno.EXDEV, "Invalid cross-device link")
+        link(source, target)
+    monkeypatch.setattr(artifact_store.os, "link", cross_device)
+
+    assert store.link(digest, tmp_path / "a_v1.csv")
+    assert not store.link(digest, tmp_path / "a_v1.csv")
+    assert (tmp_path / "a_v1.csv").read_bytes() == b"data"
+    assert sorted(os.listdir(tmp_path)) == ["a_v1.csv", "blobs"]
+
+def test_s3_store_uploads_each_digest_once(tmp_path):
+    client = InMemoryS3Client()
+    store = S3ArtifactStore(client, "bucket")
+    digest = store.put(write(tmp_path / "a.csv", b"data"))["digest"]
+    store.put(write(tmp_path / "b.csv", b"data"))
+
+    assert client.puts == 1
+    assert store.exists(digest)
+    assert b"".join(store.iter_bytes(digest)) == b"data"
+    assert store.local_path(digest) is None
+
+def test_s3_store_delete(tmp_path):
+    store = S3ArtifactStore(InMemoryS3Client(), "bucket")
+    digest = store.put(write(tmp_path / "a.csv", b"data"))["digest"]
+    store.delete(digest)
+
+    assert not store.exists(digest)
+
+def test_backend_must_implement_the_blob_operations():
+    class PutOnly(ArtifactStore):
+        def put(self, source):
+            return {}
+
+    with pytest.raises(TypeError):
+        PutOnly()
@@ -0,0 +1,27 @@
+import io
+import zipfile
+from ..batch import ZipStream
+
+
+def test_entries_come_out_as_they_are_written():
+    stream = ZipStream()
+    pieces = []
+    for piece in stream.add("a.csv", [b"x" * 10, b"y" * 10]):
+        pieces.append(piece)
+    # The entry's data is out before the archive is finished
+    assert b"x" * 10 in b"".join(pieces)
+
+    pieces.append(stream.add_bytes("manifest.json", b"[]"))
+    pieces.append(stream.close())
+
+    with zipfile.ZipFile(io.BytesIO(b"".join(pieces))) as archive:
+        assert archive.namelist() == ["a.csv", "manifest.json"]
+        assert archive.read("a.csv") == b"x" * 10 + b"y" * 10
+        assert archive.read("manifest.json") == b"[]"
+        assert archive.testzip() is None
+
+def test_empty_archive_is_valid():
+    stream = ZipStream()
+    data = stream.close()
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        assert archive.namelist() == []
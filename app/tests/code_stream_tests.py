@@ -0,0 +1,72 @@
+from concurrent.futures import Future
+from ..agents.code_stream import CodeStream
+from ..agents.dependency_resolver import DependencyResolver
+
+CODE = """# pip install python-pptx
+import os
+from pptx import Presentation
+
+def build(path):
+    deck = Presentation()
+    deck.save(path)
+
+build(os.path.join("out", "deck.pptx"))
+"""
+
+
+def make_stream(tmp_path, monkeypatch):
+    resolver = DependencyResolver(str(tmp_path / "index.json"), str(tmp_path / "wheels"), max_workers=2)
+    prefetched = []
+
+    def prefetch(requirements):
+        prefetched.append(set(requirements))
+        future = Future()
+        future.set_result({})
+        return future
+    monkeypatch.setattr(resolver, "prefetch", prefetch)
+    return CodeStream(resolver), prefetched
+
+def feed_tokens(stream, text, size=3):
+    for i in range(0, len(text), size):
+        stream.feed(text[i:i + size])
+
+
+def test_installs_start_with_the_header(tmp_path, monkeypatch):
+    stream, prefetched = make_stream(tmp_path, monkeypatch)
+    header, body = CODE.split("\ndef ", 1)
+    feed_tokens(stream, header + "\n")
+
+    # Before the rest of the code has arrived, and once per distribution
+    assert prefetched == [{"python-pptx"}]
+    feed_tokens(stream, "def " + body)
+    stream.close()
+    stream.wait()
+    assert prefetched == [{"python-pptx"}]
+    assert stream.installed_at is not None
+
+def test_statements_are_checked_as_they_complete(tmp_path, monkeypatch):
+    stream, _ = make_stream(tmp_path, monkeypatch)
+    feed_tokens(stream, CODE)
+    stream.close()
+
+    # Everything up to the last statement was parsed on the way in
+    assert stream._checked == CODE.splitlines().index('build(os.path.join("out", "deck.pptx"))')
+    assert stream.validate(CODE.rstrip("\n")) is None
+
+def test_syntax_errors_are_reported_with_their_line(tmp_path, monkeypatch):
+    stream, _ = make_stream(tmp_path, monkeypatch)
+    code = "import os\n\nif os.sep:\n    x = (1,\nelse:\n    pass\nprint(x)"
+    feed_tokens(stream, code)
+    stream.close()
+
+    error = stream.validate(code)
+    assert isinstance(error, SyntaxError)
+    assert error.lineno in (4, 5)
+
+def test_prose_and_fences_are_skipped_like_clean_code(tmp_path, monkeypatch):
+    stream, _ = make_stream(tmp_path, monkeypatch)
+    feed_tokens(stream, "Here you go:\n```python\nimport os\nprint(os.sep)\n```")
+    stream.close()
+
+    assert stream.lines == ["import os", "print(os.sep)"]
+    assert stream.validate("import os\nprint(os.sep)\n") is None
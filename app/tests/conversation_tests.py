@@ -0,0 +1,124 @@
+from types import SimpleNamespace
+from ..agents.conversation import ConversationHistory, count_tokens
+from ..models.message import MessageType
+
+
+class FakeChat:
+    def __init__(self, contents, summary=None, summary_revision=0):
+        self.id = "chat"
+        self.summary = summary
+        self.summary_revision = summary_revision
+        self.messages = [
+            SimpleNamespace(
+                id=revision,
+                content=content,
+                revision=revision,
+                line_type=MessageType.USER if revision % 2 else MessageType.SYSTEM
+            ) for revision, content in enumerate(contents, start=1)
+        ]
+        self.saved = []
+
+    def get_recent_messages(self, db, after_revision, limit):
+        newer = [m for m in self.messages if m.revision > after_revision]
+        return list(reversed(newer))[:limit]
+
+    def save_summary(self, db, summary, revision, expected_revision):
+        if self.summary_revision != expected_revision:
+            return False
+        self.saved.append((summary, revision))
+        self.summary, self.summary_revision = summary, revision
+        return True
+
+
+class FakeSession:
+    def __init__(self):
+        self.commits = 0
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        pass
+
+
+def test_short_history_is_sent_verbatim_without_the_prompt():
+    chat = FakeChat(["make a csv of revenue", "done, link", "now make it blue"])
+    history, usage = ConversationHistory(1000, 50).build(FakeSession(), chat, "now make it blue")
+
+    assert history == [
+        {"role": "user", "content": "make a csv of revenue"},
+        {"role": "assistant", "content": "done, link"},
+    ]
+    assert usage["history_messages"] == 2
+
+def test_overflow_is_folded_into_the_summary():
+    calls = []
+    def summarize(summary, messages):
+        calls.append([m.revision for m in messages])
+        return "user wants revenue reports"
+
+    turn = "x" * 400
+    chat = FakeChat([turn] * 6 + ["prompt"])
+    budget = 3 * count_tokens(turn) - 1 + count_tokens("prompt")
+    history, usage = ConversationHistory(budget, 50, summarize).build(FakeSession(), chat, "prompt")
+
+    # Two turns fit, one more is folded so that half the budget is free again
+    assert calls == [[1, 2, 3, 4, 5]]
+    assert chat.saved == [("user wants revenue reports", 5)]
+    assert history == [
+        {"role": "system", "content": "Summary of the conversation so far: user wants revenue reports"},
+        {"role": "assistant", "content": turn},
+    ]
+    assert usage["history_tokens"] == count_tokens(turn)
+
+def test_summarized_messages_are_not_summarized_again():
+    calls = []
+    def summarize(summary, messages):
+        calls.append([m.revision for m in messages])
+        return "summary"
+
+    chat = FakeChat(["x" * 400] * 6 + ["prompt"])
+    conversation = ConversationHistory(300, 50, summarize)
+    conversation.build(FakeSession(), chat, "prompt")
+    conversation.build(FakeSession(), chat, "prompt")
+
+    assert len(calls) == 1
+
+def test_failed_summary_still_returns_what_fits():
+    def summarize(summary, messages):
+        raise RuntimeError("rate limited")
+
+    chat = FakeChat(["x" * 400] * 6 + ["prompt"])
+    history, usage = ConversationHistory(300, 50, summarize).build(FakeSession(), chat, "prompt")
+
+    assert chat.saved == []
+    assert all(m["role"] != "system" for m in history)
+
+def test_summarizing_happens_outside_a_transaction():
+    db = FakeSession()
+    def summarize(summary, messages):
+        # Read committed before the call, the save commits after it
+        assert db.commits == 1
+        return "summary"
+
+    chat = FakeChat(["x" * 400] * 6 + ["prompt"])
+    ConversationHistory(300, 50, summarize).build(db, chat, "prompt")
+    assert db.commits == 2
+
+def test_a_concurrent_summary_is_not_overwritten():
+    chat = FakeChat(["x" * 400] * 6 + ["prompt"])
+    def summarize(summary, messages):
+        # Another job saves its summary while this one is being written
+        chat.summary_revision = 2
+        return "stale"
+
+    history, _ = ConversationHistory(300, 50, summarize).build(FakeSession(), chat, "prompt")
+    assert chat.saved == []
+    assert history[0]["content"].endswith("stale")
+
+def test_an_edited_older_prompt_is_excluded_by_id():
+    chat = FakeChat(["make a csv", "done, link", "make it blue", "done again"])
+    # The first message was edited and is being answered again
+    history, _ = ConversationHistory(1000, 50).build(FakeSession(), chat, "make a csv", message_id=1)
+
+    assert [m["content"] for m in history] == ["done, link", "make it blue", "done again"]
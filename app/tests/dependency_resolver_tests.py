@@ -0,0 +1,68 @@
+from ..agents.dependency_resolver import DependencyResolver
+
+CODE = """# pip install python-pptx pandas>=2.0
+# pip install --upgrade pptx
+import os
+import json
+from pptx import Presentation
+import notapackage
+"""
+
+
+def make_resolver(tmp_path):
+    return DependencyResolver(str(tmp_path / "index.json"), str(tmp_path / "wheels"), max_workers=2)
+
+def test_pip_comments_list_every_package():
+    assert DependencyResolver.parse_pip_comments(CODE) == ["python-pptx", "pandas", "pptx"]
+
+def test_import_names_map_to_pip_names(tmp_path):
+    resolver = make_resolver(tmp_path)
+    requirements = resolver.requirements_for(CODE)
+
+    assert "python-pptx" in requirements
+    assert "pandas" in requirements
+    assert "pptx" not in requirements
+    assert "notapackage" not in requirements
+    assert "os" not in requirements
+
+def test_installed_distributions_are_not_reinstalled(tmp_path, monkeypatch):
+    resolver = make_resolver(tmp_path)
+    monkeypatch.setattr(resolver, "_install", lambda missing: (_ for _ in ()).throw(AssertionError(missing)))
+
+    result = resolver.ensure({"pytest"})
+
+    assert result["installed"] == []
+    assert result["versions"]["pytest"]
+
+def test_repeat_requests_are_memoized(tmp_path, monkeypatch):
+    resolver = make_resolver(tmp_path)
+    installs = []
+    monkeypatch.setattr(resolver, "_install", lambda missing: installs.append(missing) or [])
+    monkeypatch.setattr(resolver, "rebuild_index", lambda: None)
+
+    first = resolver.ensure({"not-installed-package"})
+    second = resolver.ensure({"not-installed-package"})
+
+    assert installs == [["not-installed-package"]]
+    assert first is second
+
+def test_index_is_persisted(tmp_path):
+    make_resolver(tmp_path)
+    assert (tmp_path / "index.json").exists()
+    assert make_resolver(tmp_path).is_installed("pytest")
+
+def test_changes_made_outside_the_resolver_rebuild_the_index(tmp_path, monkeypatch):
+    resolver = make_resolver(tmp_path)
+    monkeypatch.setattr(resolver, "_install", lambda missing: [])
+    first = resolver.ensure({"pytest"})
+    assert resolver.ensure({"pytest"}) is first
+
+    # Something was pip installed or removed by hand, site-packages changed
+    signature = resolver._signature() + ":changed"
+    monkeypatch.setattr(resolver, "_signature", lambda: signature)
+    resolver._distributions["pytest"]["version"] = "0.0.stale"
+    second = resolver.ensure({"pytest"})
+
+    assert second is not first
+    assert second["versions"]["pytest"] != "0.0.stale"
+    assert make_resolver(tmp_path)._indexed_signature != signature
@@ -0,0 +1,102 @@
+import asyncio
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from starlette.requests import Request
+from ..downloads import FileRangeResponse, file_response, parse_range, RangeNotSatisfiable
+
+CONTENT = bytes(range(256)) * 40
+
+
+@pytest.fixture
+def client(tmp_path):
+    path = tmp_path / "report_v1.csv"
+    path.write_bytes(CONTENT)
+    app = FastAPI()
+
+    @app.get("/file")
+    def get_file(request: Request):
+        return file_response(request, path)
+
+    return TestClient(app)
+
+
+def test_parse_range():
+    assert parse_range("bytes=0-99", 1000) == (0, 99)
+    assert parse_range("bytes=900-", 1000) == (900, 999)
+    assert parse_range("bytes=-100", 1000) == (900, 999)
+    assert parse_range("bytes=990-2000", 1000) == (990, 999)
+    assert parse_range("bytes=0-1,5-9", 1000) is None
+    with pytest.raises(RangeNotSatisfiable):
+        parse_range("bytes=1000-", 1000)
+
+def test_full_download_has_validators(client):
+    response = client.get("/file")
+
+    assert response.status_code == 200
+    assert response.content == CONTENT
+    assert response.headers["etag"].startswith('"')
+    assert response.headers["accept-ranges"] == "bytes"
+    assert "last-modified" in response.headers
+
+def test_matching_etag_is_not_modified(client):
+    etag = client.get("/file").headers["etag"]
+    response = client.get("/file", headers={"If-None-Match": etag})
+
+    assert response.status_code == 304
+    assert response.content == b""
+
+def test_range_is_partial_content(client):
+    response = client.get("/file", headers={"Range": "bytes=100-199"})
+
+    assert response.status_code == 206
+    assert response.content == CONTENT[100:200]
+    assert response.headers["content-range"] == f"bytes 100-199/{len(CONTENT)}"
+
+def test_stale_if_range_gets_the_whole_file(client):
+    response = client.get("/file", headers={"Range": "bytes=100-199", "If-Range": '"stale"'})
+
+    assert response.status_code == 200
+    assert response.content == CONTENT
+
+def test_unsatisfiable_range(client):
+    response = client.get("/file", headers={"Range": f"bytes={len(CONTENT)}-"})
+
+    assert response.status_code == 416
+    assert response.headers["content-range"] == f"bytes */{len(CONTENT)}"
+
+def test_zero_copy_extension_gets_the_file_descriptor(tmp_path):
+    path = tmp_path / "report_v1.csv"
+    path.write_bytes(CONTENT)
+    sent = []
+
+    async def send(message):
+        if message["type"] == "http.response.zerocopysend":
+            message = {**message, "file": message["file"].fileno()}
+        sent.append(message)
+
+    response = FileRangeResponse(path, 10, 19, status_code=206)
+    scope = {"type": "http", "method": "GET", "extensions": {"http.response.zerocopysend": {}}}
+    asyncio.run(response(scope, None, send))
+
+    assert sent[1]["type"] == "http.response.zerocopysend"
+    assert (sent[1]["offset"], sent[1]["count"]) == (10, 10)
+
+def test_without_the_extension_the_file_is_sent_in_chunks(tmp_path):
+    # What uvicorn gets, it doesn't offer zerocopysend
+    path = tmp_path / "report_v1.csv"
+    path.write_bytes(CONTENT)
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    response = FileRangeResponse(path, 100, 1099, status_code=206)
+    response.chunk_size = 300
+    asyncio.run(response({"type": "http", "method": "GET"}, None, send))
+
+    bodies = sent[1:]
+    assert all(message["type"] == "http.response.body" for message in bodies)
+    assert [len(message["body"]) for message in bodies] == [300, 300, 300, 100]
+    assert [message["more_body"] for message in bodies] == [True, True, True, False]
+    assert b"".join(message["body"] for message in bodies) == CONTENT[100:1100]
@@ -0,0 +1,78 @@
+from ..agents.artifact_store import LocalArtifactStore
+from ..agents.execution_cache import ExecutionCache, NO_CACHE_MARKER
+
+
+class FakeStore:
+    def __init__(self, digests=()):
+        self.digests = set(digests)
+
+    def exists(self, digest):
+        return digest in self.digests
+
+
+ARTIFACT = {'name': 'report.csv', 'file_name': 'report_v1.csv', 'path': '/x', 'digest': 'abc', 'size': 3, 'mime_type': 'text/csv'}
+
+
+def make_cache(tmp_path, **kwargs):
+    return ExecutionCache(str(tmp_path / "execution_cache.sqlite3"), **kwargs)
+
+
+def test_key_depends_on_dependency_versions():
+    code = "import pandas"
+    assert ExecutionCache.make_key(code, {'pandas': '2.2.0'}) == ExecutionCache.make_key(code, {'pandas': '2.2.0'})
+    assert ExecutionCache.make_key(code, {'pandas': '2.2.0'}) != ExecutionCache.make_key(code, {'pandas': '2.2.1'})
+
+def test_opt_out_marker():
+    assert ExecutionCache.cacheable("import csv\n")
+    assert not ExecutionCache.cacheable(f"{NO_CACHE_MARKER}\nimport random\n")
+
+def test_hit_returns_output_and_digests(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.set("k", "out", "", [ARTIFACT])
+
+    result = cache.get("k")
+    assert result == {'stdout': 'out', 'stderr': '', 'artifacts': [
+        {'name': 'report.csv', 'digest': 'abc', 'size': 3, 'mime_type': 'text/csv'}
+    ]}
+    assert cache.stats()["hits"] == 1
+
+def test_lookups_leave_the_store_alone(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.set("k", "out", "", [ARTIFACT])
+
+    # No existence check per hit, deletes reach the cache through forget_digest
+    assert cache.get("k") is not None
+    cache.forget_digest('abc')
+    assert cache.get("k") is None
+    assert cache.stats()["entries"] == 0
+
+def test_evict_missing_sweeps_entries_of_deleted_blobs(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.set("gone", "", "", [ARTIFACT])
+    cache.set("kept", "", "", [{**ARTIFACT, 'digest': 'def'}])
+
+    assert cache.evict_missing(FakeStore({'def'})) == 1
+    assert cache.stats()["entries"] == 1
+    assert cache.get("kept") is not None
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = make_cache(tmp_path, max_entries=2)
+    cache.set("a", "", "", [])
+    cache.set("b", "", "", [])
+    cache.get("a")
+    cache.set("c", "", "", [])
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+
+def test_deleting_a_blob_forgets_the_results_that_used_it(tmp_path):
+    store = LocalArtifactStore(tmp_path / "blobs")
+    (tmp_path / "report.csv").write_bytes(b"data")
+    digest = store.put(tmp_path / "report.csv")["digest"]
+    cache = make_cache(tmp_path)
+    store.add_delete_listener(cache.forget_digest)
+    cache.set("k", "", "", [{**ARTIFACT, 'digest': digest}])
+
+    store.delete(digest)
+
+    assert cache.stats()["entries"] == 0
@@ -0,0 +1,60 @@
+import time
+import uuid
+from sqlalchemy import inspect
+from ..identity_cache import TTLCache, IdentityCache, snapshot, restore
+from ..models import User
+from ..models.chat import ChatContextType
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = TTLCache(max_entries=2, ttl_seconds=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+def test_entries_expire():
+    cache = TTLCache(max_entries=2, ttl_seconds=0.01)
+    cache.set("a", 1)
+    time.sleep(0.02)
+
+    assert cache.get("a") is None
+    assert cache.stats()["entries"] == 0
+
+def test_hit_rate():
+    cache = TTLCache(max_entries=2, ttl_seconds=60)
+    cache.set("a", 1)
+    cache.get("a")
+    cache.get("a")
+    cache.get("b")
+
+    stats = cache.stats()
+    assert stats["hits"] == 2
+    assert stats["misses"] == 1
+    assert stats["hit_rate"] == 2 / 3
+
+def test_invalidating_a_user_drops_their_chats():
+    cache = IdentityCache(max_users=10, max_chats=10, ttl_seconds=60)
+    user_id = uuid.uuid4()
+    cache.users.set(str(user_id), {"id": user_id})
+    cache.chats.set((str(user_id), ChatContextType.SALES), {"id": uuid.uuid4()})
+    cache.chats.set(("someone-else", ChatContextType.SALES), {"id": uuid.uuid4()})
+
+    cache.invalidate_user(user_id)
+
+    assert cache.users.get(str(user_id)) is None
+    assert cache.chats.get((str(user_id), ChatContextType.SALES)) is None
+    assert cache.chats.get(("someone-else", ChatContextType.SALES)) is not None
+
+def test_restored_instances_are_detached_with_their_identity():
+    user = User(id=uuid.uuid4(), name="Ava", email="ava@example.com", created_date=None)
+    restored = restore(User, snapshot(user))
+
+    state = inspect(restored)
+    assert state.detached
+    assert state.identity == (user.id,)
+    assert restored.name == "Ava"
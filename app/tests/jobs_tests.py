@@ -0,0 +1,133 @@
+import threading
+import time
+import pytest
+from ..jobs import Job, JobQueue, JobStatus, QueueFull
+
+
+def blocking_work(gate, started):
+    def work(job):
+        started.append(job.user_id)
+        gate.wait(5)
+        return job.prompt
+    return work
+
+def wait_until(condition, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.005)
+    return condition()
+
+
+def test_users_take_turns():
+    queue = JobQueue(max_workers=1, max_per_user=1)
+    gate, started = threading.Event(), []
+    work = blocking_work(gate, started)
+    for user in ["a", "a", "a", "b", "c"]:
+        queue.submit(work, user, None, "p")
+    gate.set()
+    queue.shutdown()
+
+    # b and c don't wait behind all of a's jobs
+    assert started == ["a", "b", "c", "a", "a"]
+
+def test_per_user_limit_leaves_workers_for_others():
+    queue = JobQueue(max_workers=3, max_per_user=1)
+    gate, started = threading.Event(), []
+    work = blocking_work(gate, started)
+    for user in ["a", "a", "a", "b"]:
+        queue.submit(work, user, None, "p")
+
+    assert wait_until(lambda: len(started) == 2)
+    time.sleep(0.05)
+    assert sorted(started) == ["a", "b"]
+    gate.set()
+    queue.shutdown()
+
+def test_full_queue_is_rejected():
+    queue = JobQueue(max_workers=1, max_per_user=1, max_queued=2, max_queued_per_user=2)
+    gate, started = threading.Event(), []
+    work = blocking_work(gate, started)
+    queue.submit(work, "a", None, "p")
+    assert wait_until(lambda: started)
+    queue.submit(work, "a", None, "p")
+    queue.submit(work, "b", None, "p")
+
+    with pytest.raises(QueueFull):
+        queue.submit(work, "c", None, "p")
+    assert queue.stats()["rejected"] == 1
+    gate.set()
+    queue.shutdown()
+
+def test_per_user_queue_limit():
+    queue = JobQueue(max_workers=1, max_per_user=1, max_queued_per_user=1)
+    gate, started = threading.Event(), []
+    work = blocking_work(gate, started)
+    queue.submit(work, "a", None, "p")
+    assert wait_until(lambda: started)
+    queue.submit(work, "a", None, "p")
+
+    with pytest.raises(QueueFull):
+        queue.check_admission("a")
+    queue.check_admission("b")
+    gate.set()
+    queue.shutdown()
+
+def test_reserved_place_is_kept_for_its_job():
+    queue = JobQueue(max_workers=1, max_per_user=1, max_queued_per_user=1)
+    gate, started = threading.Event(), []
+    work = blocking_work(gate, started)
+    queue.submit(work, "a", None, "p")
+    assert wait_until(lambda: started)
+    queue.reserve("a")
+
+    # The place is taken while whatever comes before the job is written
+    with pytest.raises(QueueFull):
+        queue.submit(work, "a", None, "p")
+    queue.submit(work, "a", None, "p", reserved=True)
+    assert queue.stats()["reserved"] == 0
+
+    with pytest.raises(QueueFull):
+        queue.reserve("a")
+    gate.set()
+    queue.shutdown()
+
+def test_released_place_can_be_taken_again():
+    queue = JobQueue(max_workers=1, max_queued=1)
+    queue.reserve("a")
+    with pytest.raises(QueueFull):
+        queue.check_admission("b")
+    queue.release("a")
+    queue.check_admission("b")
+    assert queue.stats()["reserved"] == 0
+
+def test_position_and_stats():
+    queue = JobQueue(max_workers=1, max_per_user=1)
+    gate, started = threading.Event(), []
+    work = blocking_work(gate, started)
+    running = queue.submit(work, "a", None, "p")
+    assert wait_until(lambda: started)
+    second = queue.submit(work, "a", None, "p")
+    other = queue.submit(work, "b", None, "p")
+
+    assert queue.position(running) is None
+    assert queue.position(second) == 1
+    assert queue.position(other) == 2
+    stats = queue.stats()
+    assert (stats["queued"], stats["running"]) == (2, 1)
+    gate.set()
+    queue.shutdown()
+    assert second.status == JobStatus.DONE
+
+def test_tokens_are_coalesced_and_not_replayed():
+    published = []
+    job = Job("a", None, "p", on_event=lambda job, event: published.append(event))
+    for _ in range(1000):
+        job.add_event("tokens", {"text": "ab"})
+    job.add_event("usage", {"prompt_tokens": 1})
+
+    tokens = [e for e in published if e["stage"] == "tokens"]
+    assert ''.join(e["text"] for e in tokens) == "ab" * 1000
+    assert len(tokens) < 100
+    # Flushed ahead of the next stage, and only stages are kept
+    assert published[-1]["stage"] == "usage"
+    assert [e["stage"] for e in job.events] == ["usage"]
@@ -0,0 +1,85 @@
+import asyncio
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from ..metrics import Registry, MetricsMiddleware, HTTP_REQUESTS, DB_LATENCY, timed_db
+
+
+def test_counter_and_gauge_render():
+    registry = Registry()
+    requests = registry.counter('requests_total', 'Requests', ('status',))
+    in_flight = registry.gauge('in_flight', 'In flight')
+    requests.inc(status=200)
+    requests.inc(2, status=200)
+    requests.inc(status=500)
+    in_flight.inc()
+
+    text = registry.render()
+    assert '# TYPE requests_total counter' in text
+    assert 'requests_total{status="200"} 3' in text
+    assert 'requests_total{status="500"} 1' in text
+    assert 'in_flight 1' in text
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    latency = registry.histogram('latency_seconds', 'Latency', ('stage',), buckets=(0.1, 1))
+    for value in (0.05, 0.1, 0.5, 3):
+        latency.observe(value, stage='install')
+
+    text = registry.render()
+    assert 'latency_seconds_bucket{stage="install",le="0.1"} 2' in text
+    assert 'latency_seconds_bucket{stage="install",le="1"} 3' in text
+    assert 'latency_seconds_bucket{stage="install",le="+Inf"} 4' in text
+    assert 'latency_seconds_sum{stage="install"} 3.65' in text
+    assert 'latency_seconds_count{stage="install"} 4' in text
+
+def test_collectors_flatten_numbers_and_skip_failures():
+    registry = Registry()
+    registry.add_collector('cache', lambda: {'hits': 3, 'users': {'entries': 2}, 'path': '/tmp/x'})
+    registry.add_collector('broken', lambda: 1 / 0)
+
+    text = registry.render()
+    assert 'cache_hits 3' in text
+    assert 'cache_users_entries 2' in text
+    assert 'path' not in text
+    assert 'broken' not in text
+
+def test_label_values_are_escaped():
+    registry = Registry()
+    counter = registry.counter('errors_total', 'Errors', ('message',))
+    counter.inc(message='bad "quote"\nline')
+
+    assert 'errors_total{message="bad \\"quote\\"\\nline"} 1' in registry.render()
+
+def test_middleware_labels_routes_by_template():
+    app = FastAPI()
+    app.add_middleware(MetricsMiddleware)
+
+    @app.get("/api/items/{itemId}")
+    def get_item(itemId: str):
+        return {"id": itemId}
+
+    client = TestClient(app)
+    client.get("/api/items/1")
+    client.get("/api/items/2")
+    client.get("/missing")
+
+    text = '\n'.join(HTTP_REQUESTS.render())
+    assert 'http_requests_total{method="GET",route="/api/items/{itemId}",status="200"} 2' in text
+    assert 'route="unmatched",status="404"' in text
+
+def test_timed_db_wraps_sync_and_async_helpers():
+    class Model:
+        @classmethod
+        @timed_db
+        def lookup(cls, db):
+            return db
+
+        @timed_db
+        async def lookup_async(self, db):
+            return db
+
+    assert Model.lookup('db') == 'db'
+    assert asyncio.run(Model().lookup_async('db')) == 'db'
+    text = '\n'.join(DB_LATENCY.render())
+    assert 'db_helper_duration_seconds_count{helper="test_timed_db_wraps_sync_and_async_helpers.<locals>.Model.lookup"} 1' in text
+    assert 'helper="test_timed_db_wraps_sync_and_async_helpers.<locals>.Model.lookup_async"' in text
@@ -0,0 +1,126 @@
+import asyncio
+import json
+import threading
+import time
+import httpx
+import openai
+import pytest
+from ..agents.openai_client import OpenAIClient
+
+
+def completion(content="print('hi')"):
+    return {
+        "id": "chatcmpl-1", "object": "chat.completion", "created": 0, "model": "gpt-4o",
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 10, "completion_tokens": 3, "total_tokens": 13},
+    }
+
+def sse(*pieces):
+    chunks = [
+        {"id": "c", "object": "chat.completion.chunk", "created": 0, "model": "gpt-4o",
+         "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+        for piece in pieces
+    ]
+    chunks.append({"id": "c", "object": "chat.completion.chunk", "created": 0, "model": "gpt-4o", "choices": [],
+                   "usage": {"prompt_tokens": 10, "completion_tokens": len(pieces), "total_tokens": 10 + len(pieces)}})
+    return ''.join(f"data: {json.dumps(c)}\n\n" for c in chunks) + "data: [DONE]\n\n"
+
+def make_client(handler, **kwargs):
+    calls = []
+
+    async def record(request):
+        calls.append(request)
+        return await handler(len(calls))
+
+    http_client = httpx.AsyncClient(transport=httpx.MockTransport(record), base_url="https://api.openai.test/v1")
+    client = OpenAIClient(http_client=http_client, backoff_base=0.01, **kwargs)
+    return client, calls
+
+def create(client, **kwargs):
+    return client.complete(model="gpt-4o", messages=[{"role": "user", "content": "hi"}], **kwargs)
+
+
+@pytest.fixture(autouse=True)
+def api_key(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setenv("OPENAI_BASE_URL", "https://api.openai.test/v1")
+
+
+def test_retries_rate_limits_then_succeeds():
+    async def handler(call):
+        if call == 1:
+            return httpx.Response(429, json={"error": {"message": "slow down"}})
+        return httpx.Response(200, json=completion())
+
+    client, calls = make_client(handler)
+    assert create(client).choices[0].message.content == "print('hi')"
+    assert len(calls) == 2
+
+def test_client_errors_are_not_retried():
+    async def handler(call):
+        return httpx.Response(400, json={"error": {"message": "bad request"}})
+
+    client, calls = make_client(handler)
+    with pytest.raises(openai.BadRequestError):
+        create(client)
+    assert len(calls) == 1
+
+def test_gives_up_at_the_deadline():
+    async def handler(call):
+        await asyncio.sleep(2)
+        return httpx.Response(200, json=completion())
+
+    client, calls = make_client(handler)
+    started = time.perf_counter()
+    with pytest.raises(TimeoutError):
+        create(client, deadline=0.2)
+    assert time.perf_counter() - started < 1
+
+def test_hedges_a_request_slower_than_p95():
+    async def handler(call):
+        if call == 1:
+            await asyncio.sleep(2)
+        return httpx.Response(200, json=completion(f"call {call}"))
+
+    client, calls = make_client(handler, hedge=True)
+    for _ in range(20):
+        client.latency_for("gpt-4o", False).add(0.05)
+    started = time.perf_counter()
+    assert create(client).choices[0].message.content == "call 2"
+    assert time.perf_counter() - started < 1
+    assert len(calls) == 2
+
+def test_stream_hands_out_every_chunk():
+    async def handler(call):
+        return httpx.Response(200, text=sse("print(", "'hi')"), headers={"content-type": "text/event-stream"})
+
+    client, _ = make_client(handler)
+    chunks = []
+    client.stream(chunks.append, model="gpt-4o", messages=[{"role": "user", "content": "hi"}],
+                  stream_options={"include_usage": True})
+    assert ''.join(c.choices[0].delta.content for c in chunks if c.choices) == "print('hi')"
+    assert chunks[-1].usage.completion_tokens == 2
+
+def test_stream_listener_runs_on_the_calling_thread():
+    async def handler(call):
+        return httpx.Response(200, text=sse("a", "b"), headers={"content-type": "text/event-stream"})
+
+    client, _ = make_client(handler)
+    threads = set()
+    client.stream(lambda chunk: threads.add(threading.get_ident()), model="gpt-4o",
+                  messages=[{"role": "user", "content": "hi"}])
+    assert threads == {threading.get_ident()}
+
+def test_latency_is_tracked_per_model_and_mode():
+    async def handler(call):
+        if call == 1:
+            await asyncio.sleep(0.3)
+        return httpx.Response(200, json=completion(f"call {call}"))
+
+    client, calls = make_client(handler, hedge=True)
+    # Fast streams and another model's calls don't make this call look slow
+    for _ in range(20):
+        client.latency_for("gpt-4o", True).add(0.01)
+        client.latency_for("gpt-4o-mini", False).add(0.01)
+    assert create(client).choices[0].message.content == "call 1"
+    assert len(calls) == 1
@@ -0,0 +1,23 @@
+import base64
+import uuid
+from datetime import datetime
+import pytest
+from ..pagination import encode_cursor, decode_cursor
+
+
+def test_cursor_round_trip():
+    created_date, message_id = datetime(2026, 10, 18, 12, 30, 5, 123456), uuid.uuid4()
+    cursor = encode_cursor(created_date, message_id)
+
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == (created_date, message_id)
+
+@pytest.mark.parametrize("cursor", [
+    "not a cursor",
+    base64.urlsafe_b64encode(b"\xff\xfe").decode(),
+    base64.urlsafe_b64encode(b"2026-10-18T12:30:05").decode(),
+    base64.urlsafe_b64encode(b"yesterday|" + str(uuid.uuid4()).encode()).decode(),
+])
+def test_malformed_cursors_are_rejected(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
@@ -0,0 +1,71 @@
+import json
+import threading
+import time
+from types import SimpleNamespace
+from .. import profiling
+from ..profiling import Profile
+
+
+def busy(seconds):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+def saved(directory):
+    [report] = directory.glob("*.json")
+    [collapsed] = directory.glob("*.collapsed")
+    return json.loads(report.read_text()), collapsed.read_text()
+
+
+def test_span_is_a_no_op_without_a_profile():
+    assert profiling.span("openai") is profiling.span("install")
+
+def test_spans_and_samples_are_saved_when_released(tmp_path):
+    profile = Profile("POST /messages", str(tmp_path), interval=0.001)
+    with profiling.activate(profile):
+        with profiling.span("execute"):
+            with profiling.span("script"):
+                busy(0.05)
+
+    report, collapsed = saved(tmp_path)
+    assert [(s["name"], s["depth"]) for s in report["spans"]] == [("execute", 0), ("script", 1)]
+    assert report["spans"][1]["duration_ms"] >= 50
+    assert report["samples"] > 0
+    assert "[script]" in collapsed and "busy (profiling_tests.py" in collapsed
+
+def test_profile_follows_work_handed_to_another_thread(tmp_path):
+    profile = Profile("POST /messages", str(tmp_path), interval=0.001)
+
+    def job():
+        with profiling.activate(profile), profiling.span("openai"):
+            busy(0.02)
+        profile.release()
+
+    with profiling.activate(profile):
+        profile.hold()
+        worker = threading.Thread(target=job, name="generator_0")
+        worker.start()
+    assert not list(tmp_path.glob("*.json"))
+    worker.join()
+
+    report, _ = saved(tmp_path)
+    assert report["spans"][0]["thread"] == "generator_0"
+
+def test_requested_needs_the_token():
+    request = SimpleNamespace(headers={"x-profile": "secret"}, query_params={})
+    assert profiling.requested(request, "secret")
+    assert not profiling.requested(request, "other")
+    assert not profiling.requested(request, "")
+    assert profiling.requested(SimpleNamespace(headers={}, query_params={"profile": "secret"}), "secret")
+
+def test_shared_thread_is_only_sampled_inside_spans(tmp_path):
+    profile = Profile("POST /messages", str(tmp_path), interval=0.001)
+    with profiling.activate(profile, spans_only=True):
+        # Stands in for other requests on the same event loop
+        busy(0.03)
+        assert sum(profile.samples.values()) == 0
+        with profiling.span("save_message"):
+            busy(0.03)
+
+    _, collapsed = saved(tmp_path)
+    assert collapsed and all(line.startswith("[save_message]") for line in collapsed.splitlines())
@@ -0,0 +1,94 @@
+import time
+from types import SimpleNamespace
+from ..agents.code_generator import OpenAIHelper
+from ..agents.prompt_cache import PromptCache
+
+
+def make_cache(tmp_path, **kwargs):
+    return PromptCache(str(tmp_path / "prompt_cache.sqlite3"), **kwargs)
+
+def test_normalized_prompts_share_a_key(tmp_path):
+    cache = make_cache(tmp_path)
+    key = cache.make_key("Make a presentation on love.", "gpt-4o", "system")
+
+    assert key == cache.make_key("  Make a   presentation on love ", "gpt-4o", "system")
+    assert key != cache.make_key("Make a presentation on love", "gpt-4o-mini", "system")
+    assert key != cache.make_key("Make a presentation on love", "gpt-4o", "other system")
+    assert key != cache.make_key("Make a presentation on love", "gpt-4o", "system", template="Write code to {prompt}")
+
+def test_case_is_part_of_the_key(tmp_path):
+    cache = make_cache(tmp_path)
+
+    assert cache.make_key("Save it as Report.csv", "gpt-4o", "system") != cache.make_key("save it as report.csv", "gpt-4o", "system")
+
+def test_hit_and_miss_counters(tmp_path):
+    cache = make_cache(tmp_path)
+    key = cache.make_key("make a csv", "gpt-4o", "system")
+
+    assert cache.get(key) is None
+    cache.set(key, "import csv")
+    assert cache.get(key) == "import csv"
+
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["entries"] == 1
+
+def test_entries_survive_a_new_instance(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.set("key", "import csv")
+
+    assert make_cache(tmp_path).get("key") == "import csv"
+
+def test_expired_entries_are_misses(tmp_path):
+    cache = make_cache(tmp_path, ttl_seconds=0)
+    cache.set("key", "import csv")
+    time.sleep(0.01)
+
+    assert cache.get("key") is None
+    assert cache.stats()["entries"] == 0
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = make_cache(tmp_path, max_entries=2)
+    cache.set("a", "code a")
+    time.sleep(0.01)
+    cache.set("b", "code b")
+    time.sleep(0.01)
+    cache.get("a")
+    time.sleep(0.01)
+    cache.set("c", "code c")
+
+    assert cache.get("b") is None
+    assert cache.get("a") == "code a"
+    assert cache.get("c") == "code c"
+
+class FakeClient:
+    def __init__(self, code):
+        self.code = code
+        self.calls = 0
+
+    def complete(self, **request):
+        self.calls += 1
+        message = SimpleNamespace(content=self.code)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+def test_code_is_cached_only_once_it_ran_cleanly(tmp_path):
+    client = FakeClient("import csv")
+    helper = OpenAIHelper(cache=make_cache(tmp_path), client=client)
+
+    code = helper.generate_code("make a csv")
+    helper.generate_code("make a csv")
+    assert client.calls == 2
+
+    helper.remember("make a csv", code, succeeded=True)
+    assert helper.generate_code("make a csv") == "import csv"
+    assert client.calls == 2
+
+def test_failed_code_is_forgotten(tmp_path):
+    client = FakeClient("import csv")
+    helper = OpenAIHelper(cache=make_cache(tmp_path), client=client)
+    helper.remember("make a csv", "import csv", succeeded=True)
+
+    helper.remember("make a csv", "import csv", succeeded=False)
+    helper.generate_code("make a csv")
+    assert client.calls == 1
@@ -0,0 +1,72 @@
+import asyncio
+import threading
+from ..realtime import LocalBroker, ConnectionRegistry, RESYNC, chat_channel
+
+
+def test_publish_reaches_every_subscriber_of_the_channel():
+    async def scenario():
+        broker = LocalBroker()
+        first = broker.subscribe(chat_channel("a"))
+        second = broker.subscribe(chat_channel("a"))
+        other = broker.subscribe(chat_channel("b"))
+        broker.publish(chat_channel("a"), {"type": "message"})
+        await asyncio.sleep(0)
+        return first.get_nowait(), second.get_nowait(), other.empty()
+
+    first, second, other_empty = asyncio.run(scenario())
+    assert first == second == {"type": "message"}
+    assert other_empty
+
+def test_publish_from_another_thread():
+    async def scenario():
+        broker = LocalBroker()
+        queue = broker.subscribe("chat:a")
+        threading.Thread(target=broker.publish, args=("chat:a", {"type": "job"})).start()
+        return await asyncio.wait_for(queue.get(), timeout=1)
+
+    assert asyncio.run(scenario()) == {"type": "job"}
+
+def test_unsubscribed_queue_gets_nothing():
+    async def scenario():
+        broker = LocalBroker()
+        queue = broker.subscribe("chat:a")
+        broker.unsubscribe("chat:a", queue)
+        broker.publish("chat:a", {"type": "message"})
+        await asyncio.sleep(0)
+        return queue.empty(), broker.stats()
+
+    empty, stats = asyncio.run(scenario())
+    assert empty
+    assert stats["channels"] == 0
+
+def test_slow_subscriber_is_told_to_resync():
+    async def scenario():
+        broker = LocalBroker(queue_size=2)
+        queue = broker.subscribe("chat:a")
+        for i in range(3):
+            broker.publish("chat:a", {"type": "message", "n": i})
+        await asyncio.sleep(0)
+        return [queue.get_nowait() for _ in range(queue.qsize())]
+
+    assert asyncio.run(scenario()) == [RESYNC]
+
+def test_connection_counts():
+    registry = ConnectionRegistry()
+    registry.opened("chat:a")
+    registry.opened("chat:a")
+    registry.opened("chat:b")
+    registry.closed("chat:a")
+
+    stats = registry.stats()
+    assert stats["connections"] == 2
+    assert stats["channels"] == 2
+    assert stats["total_opened"] == 3
+
+def test_publish_async_from_the_event_loop():
+    async def scenario():
+        broker = LocalBroker()
+        queue = broker.subscribe("chat:a")
+        await broker.publish_async("chat:a", {"type": "message"})
+        return await asyncio.wait_for(queue.get(), timeout=1)
+
+    assert asyncio.run(scenario()) == {"type": "message"}
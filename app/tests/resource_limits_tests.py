@@ -0,0 +1,79 @@
+import signal
+import sys
+from ..agents.resource_limits import MB, ResourceLimits, run_limited
+from ..agents.warm_executor import WarmExecutor
+
+
+def script(tmp_path, code):
+    path = tmp_path / "script.py"
+    path.write_text(code)
+    return [sys.executable, str(path)]
+
+
+def test_measures_cpu_time_and_output(tmp_path):
+    args = script(tmp_path, "total = sum(i * i for i in range(2_000_000))\nprint(total)\n")
+    stdout, stderr, exit_code, timed_out, usage = run_limited(args, str(tmp_path), 30, ResourceLimits())
+
+    assert exit_code == 0 and not timed_out
+    assert stdout.strip() == str(sum(i * i for i in range(2_000_000)))
+    assert usage['cpu_seconds'] > 0
+    assert usage['max_rss_bytes'] > MB
+    assert usage['stdout_bytes'] == len(stdout)
+
+def test_cpu_limit_stops_a_busy_loop(tmp_path):
+    limits = ResourceLimits(cpu_seconds=1)
+    args = script(tmp_path, "while True:\n    pass\n")
+    stdout, stderr, exit_code, timed_out, usage = run_limited(args, str(tmp_path), 30, limits)
+
+    assert not timed_out
+    assert exit_code in (-signal.SIGXCPU, -signal.SIGKILL)
+    assert limits.exceeded(usage, stderr, exit_code) == 'cpu'
+
+def test_limits_reach_the_script(tmp_path):
+    limits = ResourceLimits(open_files=64)
+    args = script(tmp_path, "import resource\nprint(resource.getrlimit(resource.RLIMIT_NOFILE)[0])\n")
+    stdout, stderr, exit_code, timed_out, usage = run_limited(args, str(tmp_path), 30, limits)
+
+    assert exit_code == 0, stderr
+    assert stdout.strip() == "64"
+
+def test_file_size_limit(tmp_path):
+    limits = ResourceLimits(output_bytes=MB)
+    args = script(tmp_path, "with open('big.bin', 'wb') as f:\n    f.write(b'x' * (2 * 1024 * 1024))\n")
+    stdout, stderr, exit_code, timed_out, usage = run_limited(args, str(tmp_path), 30, limits)
+
+    assert exit_code != 0
+    assert (tmp_path / "big.bin").stat().st_size <= MB
+    assert limits.exceeded(usage, stderr, exit_code) == 'output'
+
+def test_wall_clock_timeout(tmp_path):
+    args = script(tmp_path, "import time\ntime.sleep(30)\n")
+    stdout, stderr, exit_code, timed_out, usage = run_limited(args, str(tmp_path), 0.5, ResourceLimits())
+
+    assert timed_out
+    assert usage['wall_seconds'] < 10
+    assert ResourceLimits().exceeded(usage, stderr, exit_code) == 'timeout'
+
+def test_exceeded_classification():
+    limits = ResourceLimits(cpu_seconds=10, memory_bytes=512 * MB, open_files=64, output_bytes=MB)
+
+    assert limits.exceeded({'output_bytes': 2 * MB}, '', 0) == 'output'
+    assert limits.exceeded({}, 'MemoryError', 1) == 'memory'
+    assert limits.exceeded({}, "OSError: [Errno 24] Too many open files", 1) == 'open_files'
+    assert limits.exceeded({'cpu_seconds': 0.2, 'output_bytes': 10}, '', 0) is None
+
+def test_warm_executor_reports_usage(tmp_path):
+    executor = WarmExecutor(size=1, preload=[])
+    try:
+        path = tmp_path / "script.py"
+        path.write_text("print(sum(range(1_000_000)))\n")
+        stdout, stderr, exit_code, timed_out, usage = executor.execute(
+            str(path), str(tmp_path), timeout=30, limits=ResourceLimits(open_files=64)
+        )
+    finally:
+        executor.shutdown()
+
+    assert exit_code == 0 and stdout.strip() == str(sum(range(1_000_000)))
+    assert usage['cpu_seconds'] > 0
+    assert usage['max_rss_bytes'] > 0
+    assert usage['wall_seconds'] > 0
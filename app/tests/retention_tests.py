@@ -0,0 +1,87 @@
+from datetime import datetime
+from types import SimpleNamespace
+from ..agents.artifact_store import LocalArtifactStore
+from ..agents.execution_cache import ExecutionCache
+from ..models.user_file import UserFile
+from .. import retention
+
+
+class FakeSession:
+    def __init__(self, files):
+        self.files = files
+
+    def delete(self, user_file):
+        self.files.remove(user_file)
+
+    def flush(self):
+        pass
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+
+def test_expired_files_and_unused_blobs_are_deleted(tmp_path, monkeypatch):
+    store = LocalArtifactStore(tmp_path / "blobs")
+    store.grace_seconds = 0
+    digests = []
+    for name, data in (("old.csv", b"old"), ("shared.csv", b"shared")):
+        (tmp_path / name).write_bytes(data)
+        digests.append(store.put(tmp_path / name)["digest"])
+    old, shared = digests
+    users_dir = tmp_path / "users"
+    (users_dir / "u").mkdir(parents=True)
+    for name, digest in (("old_v1.csv", old), ("shared_v1.csv", shared)):
+        store.link(digest, users_dir / "u" / name)
+
+    files = [
+        SimpleNamespace(user_id="u", file_name="old_v1.csv", digest=old, created_date=datetime(2020, 1, 1)),
+        SimpleNamespace(user_id="u", file_name="shared_v1.csv", digest=shared, created_date=datetime(2020, 1, 1)),
+        SimpleNamespace(user_id="u", file_name="shared_v2.csv", digest=shared, created_date=datetime(2030, 1, 1)),
+    ]
+    db = FakeSession(files)
+    monkeypatch.setattr(UserFile, "expired", lambda db, before, limit: [f for f in db.files if f.created_date < before][:limit])
+    monkeypatch.setattr(UserFile, "digests_in_use", lambda db, digests: {f.digest for f in db.files} & set(digests))
+    cache = ExecutionCache(str(tmp_path / "cache.sqlite3"))
+    store.add_delete_listener(cache.forget_digest)
+    cache.set("k", "", "", [{"name": "old.csv", "digest": old, "size": 3, "mime_type": "text/csv"}])
+
+    deleted = retention.collect_garbage(db, store, datetime(2025, 1, 1), users_dir)
+
+    assert deleted == {"files": 2, "blobs": 1}
+    assert not store.exists(old)
+    # Still used by a newer file
+    assert store.exists(shared)
+    assert not (users_dir / "u" / "old_v1.csv").exists()
+    assert cache.get("k") is None
+
+def test_blob_of_a_run_still_going_is_kept(tmp_path, monkeypatch):
+    store = LocalArtifactStore(tmp_path / "blobs")
+    (tmp_path / "old.csv").write_bytes(b"data")
+    digest = store.put(tmp_path / "old.csv")["digest"]
+    users_dir = tmp_path / "users"
+    (users_dir / "u").mkdir(parents=True)
+    store.link(digest, users_dir / "u" / "old_v1.csv")
+
+    # The expired row is the only committed one, the new run's row comes once it's done
+    files = [SimpleNamespace(user_id="u", file_name="old_v1.csv", digest=digest, created_date=datetime(2020, 1, 1))]
+    db = FakeSession(files)
+    monkeypatch.setattr(UserFile, "expired", lambda db, before, limit: list(db.files))
+    monkeypatch.setattr(UserFile, "digests_in_use", lambda db, digests: {f.digest for f in db.files} & set(digests))
+    (tmp_path / "new.csv").write_bytes(b"data")
+    store.put(tmp_path / "new.csv")
+
+    deleted = retention.collect_garbage(db, store, datetime(2025, 1, 1), users_dir)
+
+    assert deleted == {"files": 1, "blobs": 0}
+    assert store.exists(digest)
+
+def test_other_processes_puts_count_as_recent(tmp_path):
+    store = LocalArtifactStore(tmp_path / "blobs")
+    (tmp_path / "a.csv").write_bytes(b"data")
+    digest = store.put(tmp_path / "a.csv")["digest"]
+
+    # A fresh instance knows nothing of the put above, the blob's ctime does
+    assert LocalArtifactStore(tmp_path / "blobs").recently_used(digest)
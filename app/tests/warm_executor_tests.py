@@ -0,0 +1,57 @@
+import signal
+import pytest
+from ..agents import code_generator
+from ..agents.artifact_store import LocalArtifactStore
+from ..agents.code_generator import CodeExecutor
+from ..agents.resource_limits import ResourceLimits
+from ..agents.warm_executor import WarmExecutor
+
+
+@pytest.fixture(scope="module")
+def executor():
+    executor = WarmExecutor(size=1, preload=[])
+    yield executor
+    executor.shutdown()
+
+@pytest.fixture
+def warm(executor, tmp_path, monkeypatch):
+    # EXECUTOR_MODE=warm, with runs kept out of the repo's output and caches
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(code_generator, "EXECUTOR_MODE", "warm")
+    monkeypatch.setattr(code_generator, "get_warm_executor", lambda **kwargs: executor)
+    monkeypatch.setattr(code_generator, "execution_cache", None)
+    monkeypatch.setattr(code_generator, "artifact_store", LocalArtifactStore(tmp_path / "blobs"))
+    return monkeypatch
+
+
+def test_output_is_captured(warm):
+    result = CodeExecutor.execute_code("import sys\nprint('out')\nprint('err', file=sys.stderr)\n", "u")
+
+    assert result.exit_code == 0
+    assert result.stdout == "out\n"
+    assert result.stderr == "err\n"
+
+def test_failures_keep_their_exit_code(warm):
+    assert CodeExecutor.execute_code("import sys\nsys.exit(3)\n", "u").exit_code == 3
+
+    result = CodeExecutor.execute_code("raise ValueError('boom')\n", "u")
+    assert result.exit_code == 1
+    assert "ValueError: boom" in result.stderr
+
+def test_timeout_kills_the_run(warm):
+    warm.setattr(code_generator, "EXECUTION_TIMEOUT", 1)
+    result = CodeExecutor.execute_code("import time\nprint('started')\ntime.sleep(30)\n", "u")
+
+    assert result.stdout == ""
+    assert result.stderr == "Execution timed out after 1 seconds."
+    assert result.resources['timed_out']
+    assert result.resources['wall_seconds'] < 10
+    assert result.resources['limit_exceeded'] == 'timeout'
+
+def test_cpu_limit_stops_a_busy_loop(warm):
+    warm.setattr(code_generator, "execution_limits", ResourceLimits(cpu_seconds=1))
+    result = CodeExecutor.execute_code("while True:\n    pass\n", "u")
+
+    assert not result.resources['timed_out']
+    assert result.exit_code in (-signal.SIGXCPU, -signal.SIGKILL)
+    assert result.resources['limit_exceeded'] == 'cpu'
@@ -0,0 +1,110 @@
+"""Concurrent download throughput for generated files.
+
+Serves one synthetic artifact through uvicorn twice: with a plain
+FileResponse (what get_user_file used to return) and with
+app.downloads.file_response. Clients fetch it concurrently in three
+patterns: full downloads, revalidation with If-None-Match as a re-rendered
+link would, and resumed downloads that only ask for the second half.
+
+    python -m benchmarks.download_bench --size-mb 20 --concurrency 32 --requests 256
+"""
+import argparse
+import asyncio
+import os
+import socket
+import tempfile
+import threading
+import time
+
+import httpx
+import uvicorn
+from fastapi import FastAPI
+from fastapi.responses import FileResponse
+from starlette.requests import Request
+
+from app.downloads import file_response
+
+
+def build_app(path):
+    app = FastAPI()
+
+    @app.get("/plain")
+    def plain():
+        return FileResponse(path)
+
+    @app.get("/ranged")
+    def ranged(request: Request):
+        return file_response(request, path)
+
+    return app
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def serve(app, port):
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+async def run(url, headers, concurrency, requests):
+    limits = httpx.Limits(max_connections=concurrency)
+    received = 0
+    statuses = {}
+    async with httpx.AsyncClient(limits=limits, timeout=120) as client:
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def fetch():
+            nonlocal received
+            async with semaphore:
+                response = await client.get(url, headers=headers)
+                received += len(response.content)
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(fetch() for _ in range(requests)))
+        elapsed = time.perf_counter() - start
+    return elapsed, received, statuses
+
+def report(name, elapsed, received, statuses, requests):
+    print(
+        f"{name:<22} {requests / elapsed:>8.1f} req/s {received / elapsed / 1e6:>9.1f} MB/s "
+        f"statuses={dict(sorted(statuses.items()))}"
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size-mb", type=float, default=20)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=256)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "report_v1.pptx")
+        size = int(args.size_mb * 1024 * 1024)
+        with open(path, "wb") as f:
+            f.write(os.urandom(size))
+
+        port = free_port()
+        server = serve(build_app(path), port)
+        base = f"http://127.0.0.1:{port}"
+        etag = httpx.get(f"{base}/ranged").headers["etag"]
+
+        scenarios = [
+            ("plain full", "/plain", {}),
+            ("ranged full", "/ranged", {}),
+            ("plain revalidate", "/plain", {"If-None-Match": etag}),
+            ("ranged revalidate", "/ranged", {"If-None-Match": etag}),
+            ("ranged resume", "/ranged", {"Range": f"bytes={size // 2}-"}),
+        ]
+        for name, route, headers in scenarios:
+            elapsed, received, statuses = asyncio.run(run(base + route, headers, args.concurrency, args.requests))
+            report(name, elapsed, received, statuses, args.requests)
+        server.should_exit = True
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Cold vs warm script execution.
+
+Runs the same generated-style script through a fresh `python` process per
+run (what CodeExecutor does in "subprocess" mode) and through the
+pre-forked WarmExecutor pool, then prints latency percentiles for both.
+
+    python -m benchmarks.executor_bench --runs 20
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from app.agents.warm_executor import WarmExecutor
+
+SCRIPT = '''
+import importlib
+for name in ("pandas", "matplotlib.pyplot", "pptx"):
+    try:
+        importlib.import_module(name)
+    except ImportError:
+        pass
+print("ok")
+'''
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def report(name, samples):
+    print(
+        f"{name:<6} runs={len(samples)} "
+        f"mean={statistics.mean(samples) * 1000:.1f}ms "
+        f"p50={percentile(samples, 50) * 1000:.1f}ms "
+        f"p95={percentile(samples, 95) * 1000:.1f}ms"
+    )
+
+def run_cold(script_path, cwd, runs):
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, script_path], capture_output=True, text=True, timeout=30, cwd=cwd)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+def run_warm(script_path, cwd, runs, pool_size):
+    executor = WarmExecutor(size=pool_size)
+    executor.start()
+    # Let the fork server finish preloading before timing anything
+    executor.execute(script_path, cwd)
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        executor.execute(script_path, cwd)
+        samples.append(time.perf_counter() - start)
+        # Give the replacement worker time to fork, as it would between requests
+        time.sleep(0.05)
+    executor.shutdown()
+    return samples
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--pool-size", type=int, default=2)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as cwd:
+        script_path = os.path.join(cwd, "bench_script.py")
+        with open(script_path, "w") as f:
+            f.write(SCRIPT)
+        report("cold", run_cold(script_path, cwd, args.runs))
+        report("warm", run_warm(script_path, cwd, args.runs, args.pool_size))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""Local stand-in for the OpenAI chat completions API.
+
+Answers /v1/chat/completions, streamed or not, with canned code after a
+configurable delay, and reports token usage the way the real API does.
+Summary requests (the chat history's rolling summary) get a canned summary.
+Point the app at it with OPENAI_BASE_URL=http://127.0.0.1:<port>/v1.
+
+    python -m benchmarks.fake_openai --port 8081 --latency-ms 800 --jitter-ms 200 --tokens-per-second 80
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+import socket
+import threading
+import time
+import uuid
+
+import uvicorn
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from starlette.requests import Request
+
+CODE = '''# Standard library only, nothing to install
+import csv
+
+rows = [("quarter", "revenue"), ("Q1", 120), ("Q2", 135), ("Q3", 150), ("Q4", 171)]
+with open("report.csv", "w", newline="") as f:
+    csv.writer(f).writerows(rows)
+print("wrote report.csv")
+'''
+SUMMARY = "The user asks for quarterly revenue reports as CSV files."
+
+
+def count_tokens(text):
+    return max(1, (len(text) + 3) // 4)
+
+def chunk_text(text):
+    # Roughly a token per chunk, like the real stream
+    return re.findall(r'\s*\S+|\s+', text)
+
+
+def build_app(latency_ms=800, jitter_ms=0, tokens_per_second=0, code=CODE):
+    app = FastAPI()
+    app.state.requests = 0
+
+    async def delay():
+        wait = latency_ms + random.uniform(-jitter_ms, jitter_ms)
+        await asyncio.sleep(max(0, wait) / 1000)
+
+    @app.post("/v1/chat/completions")
+    async def completions(request: Request):
+        body = await request.json()
+        app.state.requests += 1
+        messages = body.get("messages", [])
+        system = messages[0]["content"] if messages and messages[0]["role"] == "system" else ""
+        content = SUMMARY if "summary" in system.lower() else code
+        model = body.get("model", "gpt-4o")
+        usage = {
+            "prompt_tokens": sum(count_tokens(m["content"]) for m in messages),
+            "completion_tokens": count_tokens(content),
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+
+        if not body.get("stream"):
+            await delay()
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop",
+                }],
+                "usage": usage,
+            }
+
+        include_usage = (body.get("stream_options") or {}).get("include_usage")
+
+        def event(choices, **extra):
+            payload = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                       "choices": choices, **extra}
+            return f"data: {json.dumps(payload)}\n\n"
+
+        async def stream():
+            await delay()
+            yield event([{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}])
+            for piece in chunk_text(content):
+                if tokens_per_second:
+                    await asyncio.sleep(1 / tokens_per_second)
+                yield event([{"index": 0, "delta": {"content": piece}, "finish_reason": None}])
+            yield event([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+            if include_usage:
+                yield event([], usage=usage)
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    return app
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def serve(app, port):
+    # In a background thread, for drivers that run it next to the app
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency-ms", type=float, default=800, help="time to the first token")
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--tokens-per-second", type=float, default=0, help="0 sends the whole answer at once")
+    parser.add_argument("--code-file", help="answer with this file instead of the built-in script")
+    args = parser.parse_args()
+
+    code = open(args.code_file).read() if args.code_file else CODE
+    app = build_app(args.latency_ms, args.jitter_ms, args.tokens_per_second, code)
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+"""Load test of the chat API against a local OpenAI stand-in and the stub executor.
+
+Starts benchmarks.fake_openai and the app itself under uvicorn, with
+EXECUTOR_MODE=stub and the prompt and execution caches off so that every
+message goes through generation. Virtual users then hit the chat routes at
+the given concurrency for a fixed time: reading messages, sending a message
+and following its job to the reply, and downloading the file it made. It
+prints req/s and p50/p95/p99 per route, plus the end-to-end time from
+sending a message to its reply.
+
+    python -m benchmarks.load_bench --dsn postgresql+psycopg2://localhost/chat_bench --concurrency 32 --duration 60
+
+Save a run with --save baseline.json and compare later runs with
+--baseline baseline.json, e.g. a --pipelined run against one without. Needs a Postgres database (it gets wiped: point
+--dsn at a throwaway database, never at the app's own); nothing goes to
+OpenAI and no generated code runs.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+
+import httpx
+
+from benchmarks.fake_openai import build_app as build_fake_openai, free_port, serve
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LINK = re.compile(r'/api/users/[^/]+/user-files/([0-9a-f-]+)')
+
+# Operation -> weight, a read-heavy chat
+MIX = {
+    'read': 6,
+    'send': 3,
+    'download': 1,
+}
+
+
+def percentile(samples, pct):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))] if samples else 0.0
+
+
+def prepare_environment(args, workdir, openai_port):
+    # Read by app.config at import time, so this has to run before the app is imported
+    os.environ.update({
+        'DATABASE_URL': args.dsn,
+        'OPENAI_API_KEY': 'load-test',
+        'OPENAI_BASE_URL': f"http://127.0.0.1:{openai_port}/v1",
+        'EXECUTOR_MODE': 'stub',
+        'EXECUTOR_STUB_SECONDS': str(args.stub_seconds),
+        'PROMPT_CACHE_ENABLED': 'false',
+        'EXECUTION_CACHE_ENABLED': 'false',
+        'GENERATOR_WORKERS': str(args.generators),
+        'JOB_QUEUE_MAX': str(args.queue_max),
+        'PIPELINED_GENERATION': 'true' if args.pipelined else 'false',
+        'CACHE_DIR': os.path.join(workdir, 'cache'),
+        'ARTIFACT_DIR': os.path.join(workdir, 'output', 'blobs'),
+    })
+    # The app serves static/, templates/ and output/ relative to the working directory
+    for name in ('static', 'templates'):
+        os.symlink(os.path.join(REPO, name), os.path.join(workdir, name))
+    os.makedirs(os.path.join(workdir, 'output'))
+    os.chdir(workdir)
+    sys.path.insert(0, REPO)
+
+def create_users(count):
+    from sqlalchemy import text
+    from app.config import engine
+    from app.models import Base
+
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        rows = conn.execute(text("""
+            INSERT INTO users (id, name, email, created_date)
+            SELECT gen_random_uuid(), 'load user ' || g, 'load' || g || '@example.com', now()
+            FROM generate_series(1, :count) g
+            RETURNING id
+        """), {'count': count}).all()
+    return [str(user_id) for user_id, in rows]
+
+
+class Recorder:
+    def __init__(self):
+        self.timings = {}
+        self.statuses = {}
+
+    def add(self, route, started, status):
+        self.timings.setdefault(route, []).append((time.perf_counter() - started) * 1000)
+        counts = self.statuses.setdefault(route, {})
+        counts[status] = counts.get(status, 0) + 1
+
+    async def request(self, client, route, method, url, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.HTTPError as e:
+            self.add(route, started, type(e).__name__)
+            return None
+        self.add(route, started, response.status_code)
+        return response
+
+
+async def follow_job(client, recorder, base, user_id, job_id, started, poll_interval):
+    # Polled rather than over the socket, it's the reply time a client sees either way
+    while True:
+        response = await recorder.request(client, 'GET job', 'GET', f"{base}/api/users/{user_id}/jobs/{job_id}")
+        if response is None or response.status_code != 200:
+            return None
+        job = response.json()['job']
+        if job['status'] in ('done', 'failed'):
+            recorder.add('message -> reply', started, job['status'])
+            match = LINK.search(job.get('result') or '')
+            return match.group(1) if match else None
+        await asyncio.sleep(poll_interval)
+
+async def virtual_user(client, recorder, base, user_id, deadline, poll_interval):
+    chat = f"{base}/api/users/{user_id}/chats/onboarding"
+    files = []
+    while time.perf_counter() < deadline:
+        operation = random.choices(list(MIX), weights=list(MIX.values()))[0]
+        if operation == 'download' and files:
+            await recorder.request(client, 'GET user file', 'GET', f"{base}/api/users/{user_id}/user-files/{random.choice(files)}")
+        elif operation == 'send':
+            started = time.perf_counter()
+            response = await recorder.request(
+                client, 'POST message', 'POST', f"{chat}/messages",
+                json={'content': f"make a revenue report {random.randint(0, 10 ** 9)}", 'line_type': 'user'}
+            )
+            if response is not None and response.status_code == 200:
+                file_id = await follow_job(client, recorder, base, user_id, response.json()['job']['id'], started, poll_interval)
+                if file_id:
+                    files.append(file_id)
+            elif response is not None and response.status_code == 429:
+                await asyncio.sleep(float(response.headers.get('retry-after', 1)))
+        else:
+            await recorder.request(client, 'GET messages', 'GET', f"{chat}/messages")
+
+async def drive(base, users, concurrency, duration, poll_interval):
+    recorder = Recorder()
+    limits = httpx.Limits(max_connections=concurrency * 2)
+    async with httpx.AsyncClient(limits=limits, timeout=120) as client:
+        deadline = time.perf_counter() + duration
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            virtual_user(client, recorder, base, users[i % len(users)], deadline, poll_interval)
+            for i in range(concurrency)
+        ))
+        elapsed = time.perf_counter() - started
+    return recorder, elapsed
+
+def summarize(recorder, elapsed):
+    results = {}
+    for route, timings in sorted(recorder.timings.items()):
+        results[route] = {
+            'count': len(timings),
+            'rps': len(timings) / elapsed,
+            'p50': percentile(timings, 50),
+            'p95': percentile(timings, 95),
+            'p99': percentile(timings, 99),
+            'statuses': {str(k): v for k, v in sorted(recorder.statuses[route].items(), key=lambda kv: str(kv[0]))},
+        }
+    return results
+
+def report(results, baseline=None):
+    print(f"{'route':<20}{'count':>8}{'req/s':>9}{'p50':>11}{'p95':>11}{'p99':>11}  statuses")
+    for route, r in results.items():
+        line = f"{route:<20}{r['count']:>8}{r['rps']:>9.1f}{r['p50']:>9.1f}ms{r['p95']:>9.1f}ms{r['p99']:>9.1f}ms  {r['statuses']}"
+        before = (baseline or {}).get(route)
+        if before and before['p95']:
+            line += f"  p95 {(r['p95'] - before['p95']) / before['p95'] * 100:+.0f}% vs baseline"
+        print(line)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--dsn", required=True, help="throwaway database, it gets wiped")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=30, help="seconds")
+    parser.add_argument("--openai-latency-ms", type=float, default=800)
+    parser.add_argument("--openai-jitter-ms", type=float, default=200)
+    parser.add_argument("--tokens-per-second", type=float, default=0)
+    parser.add_argument("--stub-seconds", type=float, default=0.2, help="how long each stub execution takes")
+    parser.add_argument("--generators", type=int, default=4, help="GENERATOR_WORKERS")
+    parser.add_argument("--queue-max", type=int, default=1000, help="JOB_QUEUE_MAX")
+    parser.add_argument("--poll-interval", type=float, default=0.1)
+    parser.add_argument("--pipelined", action="store_true", help="PIPELINED_GENERATION, best with --tokens-per-second")
+    parser.add_argument("--save", help="write the results here as JSON")
+    parser.add_argument("--baseline", help="compare with results saved by an earlier --save")
+    args = parser.parse_args()
+
+    openai_port = free_port()
+    openai_server = serve(
+        build_fake_openai(args.openai_latency_ms, args.openai_jitter_ms, args.tokens_per_second), openai_port
+    )
+    save_path = os.path.abspath(args.save) if args.save else None
+    baseline_path = os.path.abspath(args.baseline) if args.baseline else None
+
+    with tempfile.TemporaryDirectory() as workdir:
+        prepare_environment(args, workdir, openai_port)
+        users = create_users(args.users)
+        from app.main import app
+
+        port = free_port()
+        server = serve(app, port)
+        recorder, elapsed = asyncio.run(
+            drive(f"http://127.0.0.1:{port}", users, args.concurrency, args.duration, args.poll_interval)
+        )
+        server.should_exit = True
+        openai_server.should_exit = True
+        os.chdir(REPO)
+
+    results = summarize(recorder, elapsed)
+    baseline = None
+    if baseline_path:
+        with open(baseline_path) as f:
+            baseline = json.load(f)['routes']
+    report(results, baseline)
+    if save_path:
+        with open(save_path, 'w') as f:
+            json.dump({'args': vars(args), 'elapsed': elapsed, 'routes': results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""Hot-path query latency on a large synthetic chat schema.
+
+Fills a scratch Postgres database with synthetic users, chats, messages and
+user files, then times the queries the model helpers run. Each query is
+timed once with the hot-path indexes dropped and once with them in place.
+
+    python -m benchmarks.query_bench --dsn postgresql+psycopg2://localhost/chat_bench --users 200000
+
+The target database is wiped: point --dsn at a throwaway database, never at
+the app's own.
+"""
+import argparse
+import statistics
+import time
+
+from sqlalchemy import create_engine, text
+
+from app.models import Base
+
+# name -> (create statement, drop statement)
+INDEXES = {
+    'ix_messages_chat_id_created_date_id': (
+        "CREATE INDEX ix_messages_chat_id_created_date_id ON messages (chat_id, created_date, id)",
+        "DROP INDEX IF EXISTS ix_messages_chat_id_created_date_id",
+    ),
+    'ix_messages_chat_id_revision': (
+        "CREATE INDEX ix_messages_chat_id_revision ON messages (chat_id, revision)",
+        "DROP INDEX IF EXISTS ix_messages_chat_id_revision",
+    ),
+    'uq_chats_user_id_context': (
+        "ALTER TABLE chats ADD CONSTRAINT uq_chats_user_id_context UNIQUE (user_id, context)",
+        "ALTER TABLE chats DROP CONSTRAINT IF EXISTS uq_chats_user_id_context",
+    ),
+    'ix_user_files_user_id_id': (
+        "CREATE INDEX ix_user_files_user_id_id ON user_files (user_id, id)",
+        "DROP INDEX IF EXISTS ix_user_files_user_id_id",
+    ),
+}
+
+# Mirrors the SQL issued by the helpers in app/models
+QUERIES = {
+    'User.get_by_id': "SELECT * FROM users WHERE id = :user_id",
+    'Chat.get_or_create': "SELECT * FROM chats WHERE user_id = :user_id AND context = 'ONBOARDING'",
+    'Chat.get_messages': "SELECT * FROM messages WHERE chat_id = :chat_id AND deleted_date IS NULL",
+    'Chat.get_messages_page': (
+        "SELECT * FROM messages WHERE chat_id = :chat_id AND deleted_date IS NULL "
+        "ORDER BY created_date DESC, id DESC LIMIT 51"
+    ),
+    'Chat.get_changes': "SELECT * FROM messages WHERE chat_id = :chat_id AND revision > :since ORDER BY revision LIMIT 200",
+    'Chat.get_recent_messages': (
+        "SELECT * FROM messages WHERE chat_id = :chat_id AND deleted_date IS NULL AND revision > 0 "
+        "ORDER BY revision DESC LIMIT 50"
+    ),
+    'User.get_file': "SELECT * FROM user_files WHERE user_id = :user_id AND id = :file_id",
+}
+
+
+def load(engine, users, messages_per_chat, files_per_user):
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    steps = [
+        ("users", """
+            INSERT INTO users (id, name, email, created_date)
+            SELECT gen_random_uuid(), 'user ' || g, 'user' || g || '@example.com', now()
+            FROM generate_series(1, :users) g
+        """),
+        ("chats", """
+            INSERT INTO chats (id, user_id, context, created_date)
+            SELECT gen_random_uuid(), u.id, c.context::chatcontexttype, now()
+            FROM users u CROSS JOIN (VALUES ('ONBOARDING'), ('SALES')) c(context)
+        """),
+        ("messages", """
+            INSERT INTO messages (id, chat_id, content, line_type, created_date, revision, deleted_date)
+            SELECT gen_random_uuid(), c.id, 'synthetic message ' || g,
+                   (CASE WHEN g % 2 = 0 THEN 'USER' ELSE 'SYSTEM' END)::messagetype,
+                   now() - make_interval(mins => g),
+                   :messages_per_chat - g + 1,
+                   CASE WHEN g % 10 = 0 THEN now() END
+            FROM chats c CROSS JOIN generate_series(1, :messages_per_chat) g
+        """),
+        ("chat versions", """
+            UPDATE chats SET version = :messages_per_chat
+        """),
+        ("user_files", """
+            INSERT INTO user_files (id, user_id, file_name, created_date)
+            SELECT gen_random_uuid(), u.id, 'report_v' || g || '.csv', now()
+            FROM users u CROSS JOIN generate_series(1, :files_per_user) g
+        """),
+    ]
+    params = {'users': users, 'messages_per_chat': messages_per_chat, 'files_per_user': files_per_user}
+    with engine.begin() as conn:
+        # Indexes are built after the load, which is much faster
+        for name, (_, drop) in INDEXES.items():
+            conn.execute(text(drop))
+        for table, statement in steps:
+            start = time.perf_counter()
+            result = conn.execute(text(statement), params)
+            print(f"loaded {result.rowcount} {table} in {time.perf_counter() - start:.1f}s")
+
+def sample_params(engine, count):
+    with engine.connect() as conn:
+        rows = conn.execute(text("""
+            SELECT c.user_id, c.id, f.id, c.version
+            FROM chats c
+            JOIN LATERAL (SELECT id FROM user_files WHERE user_id = c.user_id LIMIT 1) f ON true
+            WHERE c.context = 'ONBOARDING'
+            ORDER BY random()
+            LIMIT :count
+        """), {'count': count}).all()
+    # A client a few messages behind, as the `since` sync usually sees
+    return [
+        {'user_id': user_id, 'chat_id': chat_id, 'file_id': file_id, 'since': max(0, version - 5)}
+        for user_id, chat_id, file_id, version in rows
+    ]
+
+def set_indexes(engine, present):
+    with engine.begin() as conn:
+        for name, (create, drop) in INDEXES.items():
+            conn.execute(text(drop))
+            if present:
+                start = time.perf_counter()
+                conn.execute(text(create))
+                print(f"built {name} in {time.perf_counter() - start:.1f}s")
+        conn.execute(text("ANALYZE"))
+
+def measure(engine, samples, iterations):
+    results = {}
+    with engine.connect() as conn:
+        for name, statement in QUERIES.items():
+            query = text(statement)
+            timings = []
+            for i in range(iterations):
+                params = samples[i % len(samples)]
+                start = time.perf_counter()
+                conn.execute(query, params).all()
+                timings.append((time.perf_counter() - start) * 1000)
+            timings.sort()
+            results[name] = {
+                'mean': statistics.mean(timings),
+                'p50': timings[len(timings) // 2],
+                'p99': timings[min(len(timings) - 1, int(len(timings) * 0.99))],
+            }
+    return results
+
+def report(before, after):
+    print(f"{'query':<26}{'before p50':>12}{'before p99':>12}{'after p50':>12}{'after p99':>12}{'speedup':>10}")
+    for name in QUERIES:
+        b, a = before[name], after[name]
+        speedup = b['p50'] / a['p50'] if a['p50'] else float('inf')
+        print(f"{name:<26}{b['p50']:>10.2f}ms{b['p99']:>10.2f}ms{a['p50']:>10.2f}ms{a['p99']:>10.2f}ms{speedup:>9.1f}x")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--dsn", required=True, help="throwaway database, it gets wiped")
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--messages-per-chat", type=int, default=20)
+    parser.add_argument("--files-per-user", type=int, default=3)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--skip-load", action="store_true", help="reuse the data from a previous run")
+    args = parser.parse_args()
+
+    engine = create_engine(args.dsn)
+    if not args.skip_load:
+        load(engine, args.users, args.messages_per_chat, args.files_per_user)
+
+    samples = sample_params(engine, max(50, args.iterations))
+
+    set_indexes(engine, present=False)
+    before = measure(engine, samples, args.iterations)
+    set_indexes(engine, present=True)
+    after = measure(engine, samples, args.iterations)
+    report(before, after)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,5 @@
 'use client'
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import styles from '../css/ChatWidget.module.css'; // Importing CSS Module
 import Link from 'next/link';
 
@@ -8,8 +8,12 @@ type Message = {
   line_type: 'user' | 'system';
   content: string;
   created_date?: string;
+  revision?: number;
+  deleted?: boolean;
 };
 
+const SYNC_PAGE_SIZE = 50;
+
 interface ChatWidgetProps {
   userId: string;
   userName: string;
@@ -24,22 +28,122 @@ const ChatWidget: React.FC<ChatWidgetProps> = ({ userId, userName }) => {
   const defaultMessage: Message = { line_type: 'user', content: input };
   const [newMessage, setNewMessage] = useState<Message>(defaultMessage);
   const [expanded, setExpanded] = useState(false)
+  const [progress, setProgress] = useState<string>('');
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  // Last chat version we have and the ETag of the last sync response
+  const version = useRef<number>(0);
+  const etag = useRef<string | null>(null);
+  const socket = useRef<WebSocket | null>(null);
+  // Characters of code streamed so far, token events come coalesced into chunks
+  const written = useRef<number>(0);
 
   const getMessages = async () => {
     const resp = await fetch(`http://localhost:8000/api/users/${userId}/chats/${chatContext}/messages`);
     if (resp?.status === 200) {
       const jsonData = await resp.json();
       setMessages(jsonData.messages);
+      setNextCursor(jsonData.next_cursor);
+      version.current = jsonData.version;
+      etag.current = null;
+    }
+  };
+
+  const applyChanges = (changes: Message[]) => {
+    setMessages((current) => {
+      // Drop optimistic messages, the server copies arrive with the changes
+      const merged = current.filter((m) => m.id);
+      for (const change of changes) {
+        const index = merged.findIndex((m) => m.id === change.id);
+        if (change.deleted) {
+          if (index !== -1) merged.splice(index, 1);
+        } else if (index !== -1) {
+          merged[index] = change;
+        } else {
+          merged.push(change);
+        }
+      }
+      return merged;
+    });
+  };
+
+  // Fetches only what changed since the last version, an unchanged chat answers 304
+  const syncMessages = async () => {
+    const headers: Record<string, string> = etag.current ? { 'If-None-Match': etag.current } : {};
+    const resp = await fetch(
+      `http://localhost:8000/api/users/${userId}/chats/${chatContext}/messages?since=${version.current}&limit=${SYNC_PAGE_SIZE}`,
+      { headers, cache: 'no-store' }
+    );
+    if (resp?.status !== 200) return;
+    etag.current = resp.headers.get('ETag');
+    const jsonData = await resp.json();
+    const changes: Message[] = jsonData.messages;
+    applyChanges(changes);
+    version.current = jsonData.version;
+    // A full page means the server stopped early, carry on from where it left off
+    if (changes.length === SYNC_PAGE_SIZE) await syncMessages();
+  };
+
+  const loadEarlierMessages = async () => {
+    if (!nextCursor) return;
+    const resp = await fetch(`http://localhost:8000/api/users/${userId}/chats/${chatContext}/messages?cursor=${encodeURIComponent(nextCursor)}`);
+    if (resp?.status === 200) {
+      const jsonData = await resp.json();
+      setMessages((current) => [...jsonData.messages, ...current]);
+      setNextCursor(jsonData.next_cursor);
     }
   };
 
+  const showJobProgress = (event: { stage: string, text?: string }) => {
+    if (event.stage === 'generating') {
+      written.current = 0;
+      setProgress('Thinking...');
+    } else if (event.stage === 'tokens') {
+      written.current += event.text?.length ?? 0;
+      setProgress(`Writing code (${written.current} characters)...`);
+    } else if (event.stage === 'installing') {
+      setProgress('Installing libraries...');
+    } else if (event.stage === 'executing') {
+      setProgress('Running code...');
+    } else if (event.stage === 'artifact') {
+      setProgress('Your document is ready');
+    } else if (event.stage === 'done' || event.stage === 'failed') {
+      setProgress('');
+    }
+  };
+
+  // Fallback for when the chat socket isn't connected
+  const waitForJob = (jobId: string) => new Promise<void>((resolve) => {
+    const source = new EventSource(`http://localhost:8000/api/users/${userId}/chats/${chatContext}/jobs/${jobId}/events`);
+    const finish = () => {
+      source.close();
+      setProgress('');
+      resolve();
+    };
+    for (const stage of ['generating', 'tokens', 'installing', 'executing', 'artifact']) {
+      source.addEventListener(stage, (e) => showJobProgress(JSON.parse((e as MessageEvent).data)));
+    }
+    source.addEventListener('done', finish);
+    source.addEventListener('failed', finish);
+    source.onerror = finish;
+  });
+
+  const socketOpen = () => socket.current?.readyState === WebSocket.OPEN;
+
+  // The reply for a job arrives over the socket, without one we wait and sync
+  const followJob = async (job: { id: string; position?: number | null }) => {
+    if (job.position) setProgress(`Queued (#${job.position})...`);
+    if (socketOpen()) return;
+    await waitForJob(job.id);
+    await syncMessages();
+  };
+
   const handleDeleteMessage = async (messageId: string) => {
     try{
         await fetch(`http://localhost:8000/api/users/${userId}/chats/${chatContext}/messages/${messageId}`, {
             method: 'DELETE',
             headers: { 'Content-Type': 'application/json' }
         });
-        await getMessages()
+        await syncMessages()
     } catch(e){
         console.log(e)
     }
@@ -54,7 +158,7 @@ const ChatWidget: React.FC<ChatWidgetProps> = ({ userId, userName }) => {
   const handleEdit = async (message: Message) => {
     const messageId = message.id;
     try{
-        await fetch(`http://localhost:8000/api/users/${userId}/chats/${chatContext}/messages/${messageId}`, {
+        const resp = await fetch(`http://localhost:8000/api/users/${userId}/chats/${chatContext}/messages/${messageId}`, {
             method: 'PUT',
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify(message)
@@ -62,7 +166,13 @@ const ChatWidget: React.FC<ChatWidgetProps> = ({ userId, userName }) => {
         setIsEdit(false)
         setInput('')
         setNewMessage(defaultMessage)
-        await getMessages()
+        await syncMessages()
+        const jsonData = await resp.json();
+        if (resp.status === 429) {
+          setProgress(jsonData.detail)
+        } else if (jsonData.job) {
+          await followJob(jsonData.job)
+        }
     } catch(e){
         console.log(e)
     }
@@ -81,6 +191,19 @@ const ChatWidget: React.FC<ChatWidgetProps> = ({ userId, userName }) => {
 
   useEffect(() => {
     getMessages();
+    // New messages, edits and job progress for this chat are pushed as they happen
+    const ws = new WebSocket(`ws://localhost:8000/api/users/${userId}/chats/${chatContext}/ws`);
+    ws.onmessage = (event) => {
+      const data = JSON.parse(event.data);
+      if (data.type === 'message') applyChanges([data.message]);
+      else if (data.type === 'job') showJobProgress(data);
+      else if (data.type === 'resync') syncMessages();
+    };
+    socket.current = ws;
+    return () => {
+      ws.close();
+      socket.current = null;
+    };
   }, [chatContext]);
 
   const sendMessage = async () => {
@@ -94,13 +217,21 @@ const ChatWidget: React.FC<ChatWidgetProps> = ({ userId, userName }) => {
     setMessages([...messages, message])
     setInput('')
     try {
-      await fetch(`http://localhost:8000/api/users/${userId}/chats/${chatContext}/messages`, {
+      const resp = await fetch(`http://localhost:8000/api/users/${userId}/chats/${chatContext}/messages`, {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify(message),
       });
-      await getMessages()
+      await syncMessages()
       setInput('');
+      const jsonData = await resp.json();
+      if (resp.status === 429) {
+        // Busy, nothing was saved so the message goes back in the box
+        setInput(message.content);
+        setProgress(jsonData.detail);
+      } else if (jsonData.job) {
+        await followJob(jsonData.job)
+      }
     } catch (error) {
       console.error('Error sending message:', error);
     }
@@ -133,6 +264,9 @@ const ChatWidget: React.FC<ChatWidgetProps> = ({ userId, userName }) => {
         <p>Ask me anything or pick a place to start</p>
       </div>
       <div className={styles.chatBody}>
+        {nextCursor && (
+          <button className={styles.actionButton} onClick={() => loadEarlierMessages()}>Load earlier messages</button>
+        )}
         {messages.map((message: Message, idx) => (
           <div key={idx} className={styles[`${message.line_type}Message`]}>
             {message.line_type === 'system' && (
@@ -155,6 +289,11 @@ const ChatWidget: React.FC<ChatWidgetProps> = ({ userId, userName }) => {
               )}
           </div>
         ))}
+        {progress && (
+          <div className={styles.systemMessage}>
+            <p>{progress}</p>
+          </div>
+        )}
       </div>
       {messages.length > 0 && (
         <div className={styles.actionButtons}>